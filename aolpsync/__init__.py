@@ -1,11 +1,16 @@
 from .aliases import AliasError , AliasCommands , AliasesMap
+from .addresses import AddressRegistry
 from .calendar import CalendarSync
 from .configuration import Config
 from .account import AttributeDefError , AccountStateError
-from .account import SyncAccount , LDAPData
+from .account import SyncAccount , SyncAccountView , LDAPData
+from .ldapcache import LDAPCache
+from .listener import LDAPListener
 from .logging import Logging
-from .rules import RuleError , Rule
+from .rules import RuleError , Rule , RuleIndex
 from .skel import ProcessSkeleton
+from .snapshot import LDAPSnapshot
+from .table import AccountTable
 from .utils import FatalError , BSSAction , BSSQuery
 from . import utils as aolputils
 from . import sqldb as aolpsql
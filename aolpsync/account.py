@@ -1,4 +1,5 @@
 from .logging import Logging
+from .utils import FatalError , record_field , record_index , record_load
 
 
 class AttributeDefError( Exception ):
@@ -39,7 +40,8 @@ class LDAPAttr:
     manquant.
     """
 
-    def __init__( self , local , ldap = None , gen = None , opt = False ):
+    def __init__( self , local , ldap = None , gen = None , opt = False ,
+            needs = ( ) ):
         """
         Initialise la description d'attribut.
 
@@ -49,6 +51,8 @@ class LDAPAttr:
         :param gen: une fonction qui peut transformer les données en \
                 provenance du LDAP afin de générer la valeur du champ.
         :param bool opt: indique si l'attribut est optionel.
+        :param needs: la liste des attributs LDAP utilisés par la fonction \
+                de génération
         """
         assert isinstance( local , str )
         assert ldap is None or isinstance( ldap , str )
@@ -60,35 +64,144 @@ class LDAPAttr:
             self.ldap = ldap
         self.gen = gen
         self.optional = opt
+        self.needs = tuple( needs )
 
-    def __call__( self , syncAccount , ldapEntry ):
+    def ldap_attributes( self ):
         """
-        Lit ou génère la valeur de l'attribut depuis une entrée LDAP puis
-        la stocke dans une instance de compte de synchronisation.
+        Liste les attributs LDAP devant être lus afin de pouvoir importer ou
+        générer la valeur.
+
+        :return: la liste des noms d'attributs LDAP
+        """
+        if self.ldap == '':
+            return list( self.needs )
+        return [ self.ldap ] + list( self.needs )
+
+    def __call__( self , syncAccount , ldapAttrs ):
+        """
+        Lit ou génère la valeur de l'attribut depuis les attributs d'une entrée
+        LDAP puis la stocke dans une instance de compte de synchronisation.
 
         :param SyncAccount syncAccount: l'instance de compte de \
                 synchronisation vers laquelle les données seront stockées.
-        :param ldap3.Entry ldapEntry: l'entrée LDAP depuis laquelle les \
-                données seront extraites.
+        :param ldapAttrs: le dictionnaire (insensible à la casse) des \
+                attributs de l'entrée LDAP, associant à chaque nom d'attribut \
+                la liste de ses valeurs.
         :raises AttributeError: un attribut non optionnel n'a pas été \
                 trouvé dans l'entrée LDAP d'origine et/ou n'a pas pu \
                 être généré.
         """
         value = None
         if self.ldap != '':
-            value = getattr( ldapEntry , self.ldap , None )
+            value = ldapAttrs.get( self.ldap )
         if value is not None:
-            value = value.values
             l = len( value )
             if l == 1:
                 value = value[0]
             elif l == 0:
                 value = None
         elif self.gen is not None:
-            value = self.gen( ldapEntry )
+            value = self.gen( ldapAttrs )
         if value is None and not self.optional:
             raise AttributeError( self.local )
-        setattr( syncAccount , self.local , value )
+        object.__setattr__( syncAccount , self.local , value )
+
+    @staticmethod
+    def text( ldapAttrs , name ):
+        """
+        Génère la représentation textuelle d'un attribut LDAP, de la même
+        manière que ldap3: la valeur si l'attribut n'en a qu'une, la liste des
+        valeurs sinon.
+
+        :param ldapAttrs: le dictionnaire des attributs de l'entrée LDAP
+        :param str name: le nom de l'attribut
+        :return: la représentation textuelle de l'attribut
+        :raises AttributeError: l'attribut est absent de l'entrée
+        """
+        try:
+            values = ldapAttrs[ name ]
+        except KeyError:
+            raise AttributeError( name )
+        if len( values ) == 1:
+            return str( values[ 0 ] )
+        return str( values )
+
+    @staticmethod
+    def from_entry( ldapEntry ):
+        """
+        Extrait les attributs d'une entrée LDAP lue au travers d'un curseur
+        ldap3. Les attributs opérationnels sont renommés afin de supprimer le
+        préfixe ajouté par ldap3. Chaque attribut est également accessible
+        sous les autres noms que lui donne le schéma (par exemple surname pour
+        sn), comme il l'est au travers de l'entrée ldap3.
+
+        :param ldap3.Entry ldapEntry: l'entrée LDAP
+        :return: le dictionnaire (insensible à la casse) des attributs
+        """
+        from ldap3.utils.ciDict import CaseInsensitiveDict
+        attrs = CaseInsensitiveDict( )
+        for name in ldapEntry.entry_attributes:
+            attribute = ldapEntry[ name ]
+            key = name[ 3: ] if name.startswith( 'OA_' ) else name
+            attrs[ key ] = attribute.values
+            info = attribute.definition.oid_info
+            if info is None or not info.name:
+                continue
+            for alias in info.name:
+                if alias not in attrs:
+                    attrs[ alias ] = attribute.values
+        return attrs
+
+    @staticmethod
+    def schema_aliases( schema , names ):
+        """
+        Liste, pour des noms d'attributs LDAP, les autres noms que leur donne
+        le schéma (par exemple sn pour surname).
+
+        :param schema: le schéma du serveur, ou None
+        :param names: les noms des attributs
+        :return: un dictionnaire associant à chaque nom ayant d'autres noms \
+                la liste de ces derniers
+        """
+        if schema is None:
+            return {}
+        aliases = {}
+        for name in names:
+            info = schema.attribute_types.get( name )
+            if info is None or not info.name:
+                continue
+            others = [ n for n in info.name if n.lower( ) != name.lower( ) ]
+            if others:
+                aliases[ name ] = others
+        return aliases
+
+    @staticmethod
+    def from_response( ldapAttrs , aliases = None ):
+        """
+        Normalise les attributs d'une entrée LDAP renvoyée directement par une
+        recherche: les attributs mono-valués, que ldap3 renvoie sous la forme
+        d'une valeur simple, sont transformés en listes, et les attributs
+        demandés sous un nom que le serveur a remplacé par un autre nom du
+        même attribut sont ajoutés sous le nom demandé. Le dictionnaire est
+        modifié sur place.
+
+        :param ldapAttrs: le dictionnaire des attributs de la réponse
+        :param aliases: le dictionnaire des autres noms des attributs \
+                demandés (voir schema_aliases()), ou None
+        :return: le dictionnaire des attributs
+        """
+        for name , value in list( ldapAttrs.items( ) ):
+            if not isinstance( value , list ):
+                ldapAttrs[ name ] = [ value ]
+        if aliases:
+            for name , others in aliases.items( ):
+                if ldapAttrs.get( name ):
+                    continue
+                for other in others:
+                    if ldapAttrs.get( other ):
+                        ldapAttrs[ name ] = ldapAttrs[ other ]
+                        break
+        return ldapAttrs
 
 
 #-------------------------------------------------------------------------------
@@ -98,13 +211,29 @@ class SyncAccount:
     """
     Classe servant à représenter un compte devant être synchronisé entre le LDAP
     et le serveur Partage.
+
+    Les instances sont en fait créées à partir d'une sous-classe générée lors
+    de l'initialisation des attributs, dont les champs sont déclarés au moyen
+    de __slots__ afin de réduire l'occupation mémoire des comptes.
     """
 
+    # Pas de dictionnaire d'attributs pour les instances
+    __slots__ = ( )
+
     # Attributs devant être stockés.
     STORAGE = None
     # Attributs devant être synchronisés lors de la création du compte
     # uniquement
     CREATE_ONLY = None
+    # Listes triées des attributs stockés, et de l'ensemble des attributs
+    STORAGE_ATTRS = None
+    ALL_ATTRS = None
+    # Sous-classe utilisée pour les instances
+    SLOTTED = None
+    # Lecture des valeurs des attributs stockés, et préfixe des données
+    # utilisées pour le calcul des empreintes
+    STORAGE_GETTER = None
+    FINGERPRINT_PREFIX = None
     # Attributs LDAP
     LDAP = None
     # Correspondances BSS -> champs locaux
@@ -113,12 +242,16 @@ class SyncAccount:
     BSS_BYPASS = None
     # Liste des champs de détail
     DETAILS = None
+    # Groupes de champs utilisés par diff(), sous la forme de paires
+    # (attribut, groupe)
+    DIFF_GROUPS = None
 
     @staticmethod
     def init_storage_( cfg ):
         """
         Initialise la liste des attributs à stocker en ajoutant aux attributs
-        par défauts les attributs en provenance de la configuration.
+        par défauts les attributs en provenance de la configuration, puis
+        génère la sous-classe dont les instances seront utilisées.
 
         :param Config cfg: la configuration
         :raises AttributeDefError: un attribut configuré a le même nom que \
@@ -148,6 +281,19 @@ class SyncAccount:
         Logging( 'cfg' ).debug( 'Attributs de création: ' + ', '.join( once ) )
         SyncAccount.STORAGE = attrs
         SyncAccount.CREATE_ONLY = once
+        SyncAccount.STORAGE_ATTRS = tuple( sorted( attrs ) )
+        SyncAccount.ALL_ATTRS = tuple( sorted( attrs | once ) )
+        from operator import attrgetter
+        SyncAccount.STORAGE_GETTER = attrgetter( *SyncAccount.STORAGE_ATTRS )
+        SyncAccount.FINGERPRINT_PREFIX = repr(
+                ( 1 , SyncAccount.STORAGE_ATTRS ) ).encode( 'utf-8' )
+
+        slotted = type( 'SyncAccount' , ( SyncAccount , ) , {
+            '__slots__' : SyncAccount.ALL_ATTRS + ( 'fingerprint_' , ) ,
+            '__module__' : SyncAccount.__module__ ,
+            '__qualname__' : 'SyncAccount.SLOTTED' ,
+        } )
+        SyncAccount.SLOTTED = slotted
 
     @staticmethod
     def init_ldap_attrs_( cfg ):
@@ -169,16 +315,18 @@ class SyncAccount:
 
         if bss_dom == mail_dom or cfg.has_flag( 'bss' , 'dont-fix-domains' ):
             eppn_attr = LA( 'eppn' , 'eduPersonPrincipalName' ,
-                    gen = lambda e : "{}@{}".format( str( e.uid ) , eppn_dom ) )
+                    gen = lambda e : "{}@{}".format( LA.text( e , 'uid' ) ,
+                        eppn_dom ) ,
+                    needs = ( 'uid' , ) )
         else:
             from .utils import get_eppn_fixer
             eppn_fixer = get_eppn_fixer( cfg )
             def gen_eppn_( la ):
-                la_eppn = getattr( la , 'eduPersonPrincipalName' , None )
-                if la_eppn is None:
-                    return '{}@{}'.format( str( la.uid ) , bss_dom )
-                return eppn_fixer( str( la_eppn ) )
-            eppn_attr = LA( 'eppn' , '' , gen = gen_eppn_ )
+                if 'eduPersonPrincipalName' not in la:
+                    return '{}@{}'.format( LA.text( la , 'uid' ) , bss_dom )
+                return eppn_fixer( LA.text( la , 'eduPersonPrincipalName' ) )
+            eppn_attr = LA( 'eppn' , '' , gen = gen_eppn_ ,
+                    needs = ( 'uid' , 'eduPersonPrincipalName' ) )
 
         extra_attrs = cfg.get_section( 'ldap-extra-attributes' , True )
 
@@ -187,12 +335,15 @@ class SyncAccount:
             LA( 'uid' ) ,
             eppn_attr ,
             LA( 'mail' , '' ,
-                gen = lambda e : "{}@{}".format( str( e.uid ) , mail_dom ) ) ,
+                gen = lambda e : "{}@{}".format( LA.text( e , 'uid' ) ,
+                        mail_dom ) ,
+                needs = ( 'uid' , ) ) ,
             LA( 'surname' , 'sn' ) ,
             LA( 'givenName' ) ,
             LA( 'displayName' ,
-                gen = lambda e : "{} {}".format( str( e.givenName ) ,
-                        str( e.sn ) ) ) ,
+                gen = lambda e : "{} {}".format( LA.text( e , 'givenName' ) ,
+                        LA.text( e , 'sn' ) ) ,
+                needs = ( 'givenName' , 'sn' ) ) ,
             LA( 'ldapMail' , 'mail' ) ,
             LA( 'passwordHash' , 'userPassword' ) ,
         ]
@@ -210,12 +361,43 @@ class SyncAccount:
 
         SyncAccount.LDAP = tuple( ldap_attrs )
 
+    @staticmethod
+    def ldap_attributes( ):
+        """
+        Liste les attributs LDAP nécessaires à l'import des comptes, c'est à
+        dire les attributs lus ou utilisés par les fonctions de génération.
+        L'UID est systématiquement inclus.
+
+        :return: la liste triée des noms d'attributs LDAP
+        """
+        assert SyncAccount.LDAP is not None
+        attrs = set([ 'uid' ])
+        for attr in SyncAccount.LDAP:
+            attrs.update( attr.ldap_attributes( ) )
+        return sorted( attrs )
+
+    @staticmethod
+    def ldap_sources( ):
+        """
+        Liste les attributs dont la valeur est lue directement depuis un
+        attribut LDAP, sans génération ni modification ultérieure. L'attribut
+        ldapMail est exclu, car il peut être modifié après la lecture.
+
+        :return: un dictionnaire associant aux noms des attributs les noms \
+                des attributs LDAP correspondants
+        """
+        assert SyncAccount.LDAP is not None
+        return { attr.local : attr.ldap for attr in SyncAccount.LDAP
+                if attr.ldap != '' and attr.gen is None
+                    and attr.local != 'ldapMail' }
+
     @staticmethod
     def init_bss_attrs_( cfg ):
         """
         Initialise la liste des correspondances entre les champs de
         synchronisation et les champs de l'API BSS. Établit par ailleurs la
-        liste des champs "de détail".
+        liste des champs "de détail" et les groupes de champs utilisés lors
+        de la recherche de différences.
 
         :param Config cfg: l'instance de configuration
         :raises AttributeDefError: l'un des champs personnalisés est en fait \
@@ -255,8 +437,46 @@ class SyncAccount:
             for x in cfg.get( 'bss' , 'bypass-acc-checks' , '' ).split( ' ' )
             if x != '' ])
 
+        def diff_group_( attr ):
+            if attr in ( 'uid' , 'eppn' , 'markedForDeletion' ):
+                return 'identity'
+            if attr == 'passwordHash':
+                return 'password'
+            if attr in details:
+                return 'details'
+            if attr in ( 'mail' , 'aliases' ):
+                return attr
+            return 'extra'
+        SyncAccount.DIFF_GROUPS = tuple( ( attr , diff_group_( attr ) )
+                for attr in SyncAccount.STORAGE_ATTRS )
+
     #---------------------------------------------------------------------------
 
+    def __new__( cls , cfg = None ):
+        """
+        Initialise si nécessaire la liste des attributs, puis crée une instance
+        de la sous-classe générée.
+
+        :param Config cfg: la configuration
+        :return: la nouvelle instance
+        """
+        if cls is SyncAccount:
+            if SyncAccount.STORAGE is None:
+                SyncAccount.init_storage_( cfg )
+                SyncAccount.init_ldap_attrs_( cfg )
+                SyncAccount.init_bss_attrs_( cfg )
+            cls = SyncAccount.SLOTTED
+        return object.__new__( cls )
+
+    def __setattr__( self , name , value ):
+        """
+        Modifie un attribut; si celui-ci fait partie des attributs stockés,
+        l'empreinte du compte est oubliée.
+        """
+        object.__setattr__( self , name , value )
+        if name in SyncAccount.STORAGE:
+            object.__setattr__( self , 'fingerprint_' , None )
+
     def __init__( self , cfg ):
         """
         Initialise les données de synchronisation en initialisant tous les
@@ -264,20 +484,19 @@ class SyncAccount:
 
         :param Config cfg: la configuration
         """
-        if SyncAccount.STORAGE is None:
-            SyncAccount.init_storage_( cfg )
-            SyncAccount.init_ldap_attrs_( cfg )
-            SyncAccount.init_bss_attrs_( cfg )
         self.clear( )
 
     #---------------------------------------------------------------------------
 
     def clear( self ):
         """
-        Réinitialise tous les attributs à None.
+        Réinitialise tous les attributs à None. Les attributs sont modifiés
+        sans passer par __setattr__, l'empreinte étant de toute façon oubliée.
         """
-        for attr in SyncAccount.STORAGE | SyncAccount.CREATE_ONLY:
-            setattr( self , attr , None )
+        set_ = object.__setattr__
+        for attr in SyncAccount.ALL_ATTRS:
+            set_( self , attr , None )
+        set_( self , 'fingerprint_' , None )
 
     def copy_details_from( self , other ):
         """
@@ -288,13 +507,14 @@ class SyncAccount:
         """
         for d in SyncAccount.DETAILS:
             setattr( self , d , getattr( other , d ) )
+        self.fingerprint_ = None
 
     def clear_empty_sets( self ):
         """
         'Corrige' les attributs en remplaçant les ensembles vides par des
         valeurs non définies.
         """
-        for attr in SyncAccount.STORAGE | SyncAccount.CREATE_ONLY:
+        for attr in SyncAccount.ALL_ATTRS:
             av = getattr( self , attr )
             if isinstance( av , set ) and not av:
                 setattr( self , attr , None )
@@ -308,6 +528,66 @@ class SyncAccount:
         if self.groups is None:
             self.groups = set( )
         self.groups.add( group )
+        self.fingerprint_ = None
+
+    #---------------------------------------------------------------------------
+
+    def compute_fingerprint( self ):
+        """
+        Calcule l'empreinte des attributs stockés du compte, sans la conserver.
+        L'empreinte est calculée sur une forme canonique des valeurs: les
+        valeurs vides sont remplacées par None, les ensembles ne contenant
+        qu'un élément par cet élément, et les autres ensembles par la liste
+        triée de leurs éléments. La liste des attributs stockés est incluse
+        dans le calcul, de sorte que les empreintes sauvegardées deviennent
+        caduques si la configuration change. Deux comptes ayant la même
+        empreinte sont donc considérés comme égaux par la comparaison champ
+        par champ.
+
+        :return: l'empreinte sous forme hexadécimale
+        """
+        import hashlib
+        values = list( SyncAccount.STORAGE_GETTER( self ) )
+        for i , v in enumerate( values ):
+            vt = type( v )
+            if vt is set:
+                if not v:
+                    values[ i ] = None
+                elif len( v ) == 1:
+                    values[ i ] = next( iter( v ) )
+                else:
+                    try:
+                        values[ i ] = ( 'set' , tuple( sorted( v ) ) )
+                    except TypeError:
+                        values[ i ] = ( 'set' ,
+                                tuple( sorted( v , key = repr ) ) )
+            elif vt is list and not v:
+                values[ i ] = None
+        h = hashlib.blake2b( SyncAccount.FINGERPRINT_PREFIX , digest_size = 16 )
+        h.update( repr( values ).encode( 'utf-8' ) )
+        return h.hexdigest( )
+
+    def fingerprint( self ):
+        """
+        Renvoie l'empreinte des attributs stockés du compte. Elle est calculée
+        lors du premier appel, ou lue depuis l'enregistrement de la base de
+        données, puis conservée jusqu'à la modification de l'un des attributs
+        stockés. L'affectation d'un attribut oublie l'empreinte; le code qui
+        modifie sur place la valeur d'un attribut (ajout à un ensemble, par
+        exemple) doit en revanche appeler reset_fingerprint.
+
+        :return: l'empreinte sous forme hexadécimale
+        """
+        if self.fingerprint_ is None:
+            self.fingerprint_ = self.compute_fingerprint( )
+        return self.fingerprint_
+
+    def reset_fingerprint( self ):
+        """
+        Oublie l'empreinte du compte, qui sera recalculée lors de sa prochaine
+        utilisation.
+        """
+        self.fingerprint_ = None
 
     #---------------------------------------------------------------------------
 
@@ -319,29 +599,48 @@ class SyncAccount:
                 seront lues
         :return: l'instance de synchronisation
         """
+        return self.from_ldap_attributes( LDAPAttr.from_entry( entry ) )
+
+    def from_ldap_attributes( self , attrs ):
+        """
+        Initialise les attributs à partir du dictionnaire des attributs d'une
+        entrée LDAP.
+
+        :param attrs: le dictionnaire (insensible à la casse) associant à \
+                chaque nom d'attribut LDAP la liste de ses valeurs
+        :return: l'instance de synchronisation
+        """
         self.clear( )
         for attr in self.LDAP:
-            attr( self , entry )
+            attr( self , attrs )
         return self
 
     #---------------------------------------------------------------------------
 
-    def from_json_record( self , data ):
+    def from_json_record( self , data , all_fields = False ):
         """
         Initialise les attributs à partir d'un enregistrement désérialisé depuis
-        du JSON.
+        du JSON. Si l'enregistrement contient l'empreinte des attributs stockés
+        (champ '__fp__'), celle-ci est conservée.
 
         :param str data: l'enregistrement JSON désérialisé
+        :param bool all_fields: les attributs de création doivent-ils aussi \
+                être lus?
 
         :return: l'instance de synchronisation
         """
-        self.clear( )
-        for a in SyncAccount.STORAGE:
-            if a in data:
-                v = data[ a ]
+        set_ = object.__setattr__
+        get_ = data.get
+        storage = SyncAccount.STORAGE
+        for a in SyncAccount.ALL_ATTRS:
+            if all_fields or a in storage:
+                set_( self , a , get_( a ) )
             else:
-                v = None
-            setattr( self , a , v )
+                set_( self , a , None )
+        if all_fields:
+            set_( self , 'fingerprint_' , None )
+        else:
+            set_( self , 'fingerprint_' , get_( '__fp__' ) )
         return self
 
     def from_json( self , data ):
@@ -355,17 +654,23 @@ class SyncAccount:
         from .utils import json_load
         return self.from_json_record( json_load( data ) )
 
-    def to_json_record( self ):
+    def to_json_record( self , all_fields = False ):
         """
         Convertit les données de synchronisation en un enregistrement destiné à
         être sauvegardé sous forme de JSON. Les attributs vides (valeurs None ou
         bien listes/ensembles/dictionnaires vides) seront ignorés.
 
+        :param bool all_fields: les attributs de création doivent-ils aussi \
+                être inclus?
         :return: les données sous la forme d'un dictionnaire pouvant être \
                 sérialisé en JSON
         """
+        if all_fields:
+            attrs = SyncAccount.ALL_ATTRS
+        else:
+            attrs = SyncAccount.STORAGE_ATTRS
         d = {}
-        for a in SyncAccount.STORAGE:
+        for a in attrs:
             av = getattr( self , a )
             if av is None:
                 continue
@@ -479,7 +784,7 @@ class SyncAccount:
     def __repr__( self ):
         return 'SyncAccount({})'.format( ','.join( [
                     a + '=' + repr( getattr( self , a ) )
-                        for a in SyncAccount.STORAGE | SyncAccount.CREATE_ONLY
+                        for a in SyncAccount.ALL_ATTRS
             ] ) )
 
     def __str__( self ):
@@ -496,13 +801,43 @@ class SyncAccount:
         return False not in ( eq_check_( a ) for a in attributes )
 
     def __eq__( self , other ):
-        if type( other ) != type( self ):
+        if isinstance( other , SyncAccountView ):
+            other = other.upgrade( )
+        elif not isinstance( other , SyncAccount ):
             return False
-        return self.compare_( other , SyncAccount.STORAGE )
+        if self.fingerprint( ) == other.fingerprint( ):
+            return True
+        return self.compare_( other , SyncAccount.STORAGE_ATTRS )
 
     def __ne__( self , other ):
         return not self.__eq__( other )
 
+    def diff( self , other ):
+        """
+        Recherche en une seule passe les groupes de champs stockés pour
+        lesquels cette instance et une autre diffèrent. Les groupes sont
+        'identity' (UID, EPPN et état de pré-suppression), 'mail' (adresse
+        principale), 'password' (empreinte du mot de passe), 'details' (champs
+        de détail), 'aliases' et 'extra' (groupes, adresses LDAP et attributs
+        supplémentaires qui ne sont pas des champs de détail).
+
+        Les champs d'un groupe dont une différence a déjà été trouvée ne sont
+        pas comparés.
+
+        :param SyncAccount other: l'instance avec laquelle on doit comparer
+        :return: l'ensemble des noms des groupes de champs différents, vide \
+                si les comptes sont égaux
+        """
+        if self.fingerprint( ) == other.fingerprint( ):
+            return set( )
+        from .utils import multivalued_check_equals as mce
+        result = set( )
+        for attr , group in SyncAccount.DIFF_GROUPS:
+            if group not in result and not mce( getattr( self , attr ) ,
+                    getattr( other , attr ) ):
+                result.add( group )
+        return result
+
     def details_differ( self , other ):
         """
         Vérifie si des champs à importer dans le compte Partage diffèrent entre
@@ -536,17 +871,187 @@ class SyncAccount:
 #-------------------------------------------------------------------------------
 
 
+class SyncAccountView:
+    """
+    Vue en lecture paresseuse sur l'enregistrement d'un compte de la base de
+    données. Les champs d'un enregistrement binaire sont décodés un par un,
+    lors du premier accès à chacun d'entre eux; un enregistrement JSON est
+    décodé entièrement lors du premier accès. Aucune instance SyncAccount n'est
+    créée tant que le compte n'est pas modifié ou sauvegardé, ou que l'une des
+    méthodes de SyncAccount n'est pas utilisée. Dans ce cas, la vue est
+    convertie en compte complet, vers lequel tous les accès ultérieurs sont
+    redirigés.
+    """
+
+    __slots__ = ( 'cfg_' , 'raw_' , 'index_' , 'fields_' , 'account_' )
+
+    def __init__( self , cfg , raw ):
+        """
+        Initialise la vue.
+
+        :param Config cfg: la configuration
+        :param bytes raw: l'enregistrement encodé, au format JSON ou binaire
+        """
+        if SyncAccount.STORAGE is None:
+            # On s'assure que la liste des champs est prête
+            SyncAccount( cfg )
+        set_ = object.__setattr__
+        set_( self , 'cfg_' , cfg )
+        set_( self , 'raw_' , raw )
+        set_( self , 'index_' , None )
+        set_( self , 'fields_' , None )
+        set_( self , 'account_' , None )
+
+    def field_( self , name ):
+        """
+        Lit la valeur d'un champ de l'enregistrement, en la décodant lors du
+        premier accès. Les valeurs décodées sont conservées, de sorte que les
+        modifications effectuées sur les ensembles renvoyés soient reprises
+        lors de la conversion en compte complet.
+
+        :param str name: le nom du champ
+        :return: la valeur du champ, ou None s'il est absent
+        """
+        fields = self.fields_
+        if fields is None:
+            index = record_index( self.raw_ )
+            if index is None:
+                fields = record_load( self.raw_ )
+                object.__setattr__( self , 'raw_' , None )
+            else:
+                fields = {}
+                object.__setattr__( self , 'index_' , index )
+            object.__setattr__( self , 'fields_' , fields )
+        elif name in fields:
+            return fields[ name ]
+        index = self.index_
+        if index is None:
+            return fields.get( name )
+        pos = index.get( name )
+        if pos is None:
+            value = None
+        else:
+            value = record_field( self.raw_ , pos )
+        fields[ name ] = value
+        return value
+
+    def upgrade( self ):
+        """
+        Convertit la vue en instance SyncAccount si cela n'a pas déjà été fait.
+        L'empreinte de l'enregistrement n'est pas conservée, les valeurs
+        renvoyées par la vue ayant pu être modifiées.
+
+        :return: l'instance SyncAccount correspondant à la vue
+        """
+        if self.account_ is None:
+            data = self.fields_
+            if self.raw_ is not None:
+                data = dict( record_load( self.raw_ ) , **( data or {} ) )
+            account = SyncAccount( self.cfg_ ).from_json_record( data )
+            account.clear_empty_sets( )
+            account.reset_fingerprint( )
+            set_ = object.__setattr__
+            set_( self , 'account_' , account )
+            set_( self , 'raw_' , None )
+            set_( self , 'index_' , None )
+            set_( self , 'fields_' , None )
+        return self.account_
+
+    def __getattr__( self , name ):
+        if self.account_ is not None:
+            return getattr( self.account_ , name )
+        if name in SyncAccount.STORAGE:
+            value = self.field_( name )
+            if isinstance( value , set ) and not value:
+                return None
+            return value
+        if name in SyncAccount.CREATE_ONLY:
+            return None
+        return getattr( self.upgrade( ) , name )
+
+    def __setattr__( self , name , value ):
+        setattr( self.upgrade( ) , name , value )
+
+    def __eq__( self , other ):
+        return self.upgrade( ) == other
+
+    def __ne__( self , other ):
+        return not self.__eq__( other )
+
+    def __str__( self ):
+        if self.eppn is None:
+            return '(compte invalide)'
+        return self.eppn
+
+    def __repr__( self ):
+        return repr( self.upgrade( ) )
+
+
+#-------------------------------------------------------------------------------
+
+
 class LDAPData:
 
-    def __init__( self , cfg , query = "" ):
+    # Définitions de classes LDAP déjà générées, indexées par liste de noms de
+    # classes; chaque valeur contient le schéma utilisé et la définition.
+    DEFINITIONS = {}
+    # Caractères utilisés pour la répartition des entrées entre partitions
+    SHARD_CHARS = 'abcdefghijklmnopqrstuvwxyz0123456789'
+
+    def __init__( self , cfg , query = "" , cache = None , groups = None ,
+            match_filter = None ):
         """
         Charge les données en provenance du serveur LDAP, et permet leur
         modification ultérieure pour adapter les données des comptes en fonction
         de la configuration, des aliases, etc.
 
         :param Config cfg: la configuration du script
+        :param str query: un filtre LDAP limitant les comptes lus
+        :param LDAPCache cache: le cache à utiliser pour un chargement \
+                incrémental, ou None pour lire l'ensemble des comptes
+        :param dict groups: les groupes, s'ils ont déjà été lus lors d'un \
+                chargement précédent, ou None pour les lire
+        :param str match_filter: un filtre LDAP sélectionnant un \
+                sur-ensemble des comptes à synchroniser, ou None; il n'est \
+                pas appliqué lors des chargements incrémentaux, afin que les \
+                entrées ne correspondant plus au filtre soient mises à jour \
+                dans le cache
         """
 
+        try:
+            page_size = int( cfg.get( 'ldap' , 'page-size' , '100' ) )
+            if page_size < 1:
+                raise ValueError
+        except ValueError:
+            raise FatalError( 'Erreur de configuration: '
+                    + 'ldap > page-size invalide' )
+        try:
+            max_conns = int( cfg.get( 'ldap' , 'connections' , '4' ) )
+            if max_conns < 1:
+                raise ValueError
+        except ValueError:
+            raise FatalError( 'Erreur de configuration: '
+                    + 'ldap > connections invalide' )
+        member_of = cfg.get( 'ldap' , 'group-membership' , 'groups' )
+        if member_of not in ( 'groups' , 'member-of' ):
+            raise FatalError( 'Erreur de configuration: '
+                    + 'ldap > group-membership invalide' )
+        member_of = ( member_of == 'member-of' )
+        member_of_attr = cfg.get( 'ldap' , 'member-of-attribute' , 'memberOf' )
+        nested = cfg.has_flag( 'ldap' , 'nested-groups' )
+        fast_loader = cfg.has_flag( 'ldap' , 'fast-loader' )
+        kept = cfg.kept_groups( )
+        try:
+            shard_counts = {
+                'people' : int( cfg.get( 'ldap' , 'shards' , '1' ) ) ,
+                'group' : int( cfg.get( 'ldap' , 'group-shards' , '1' ) ) ,
+            }
+            if min( shard_counts.values( ) ) < 1:
+                raise ValueError
+        except ValueError:
+            raise FatalError( 'Erreur de configuration: '
+                    + 'ldap > shards ou group-shards invalide' )
+
         with cfg.ldap_connection( ) as ldap_conn:
             def get_def_( names ):
                 """
@@ -559,6 +1064,12 @@ class LDAPData:
                 :raises FatalError: une classe LDAP listée n'a pas pu être \
                         trouvée
                 """
+                schema = ldap_conn.server.schema
+                key = tuple( names )
+                cached = LDAPData.DEFINITIONS.get( key )
+                if cached is not None and cached[ 0 ] is schema:
+                    return cached[ 1 ]
+
                 ( first , rest ) = ( names[ 0 ] , names[ 1: ] )
                 try:
                     from ldap3 import ObjectDef
@@ -569,24 +1080,231 @@ class LDAPData:
                 except KeyError as e:
                     raise FatalError( 'Classe LDAP {} inconnue'.format(
                             str( e ) ) )
+                LDAPData.DEFINITIONS[ key ] = ( schema , dfn )
                 return dfn
 
-            def read_accounts_( ):
+            def projection_( dfn , names ):
                 """
-                Lit la liste des comptes depuis l'annuaire LDAP.
+                Restreint une liste d'attributs à ceux qui sont présents dans
+                une définition de classes LDAP.
 
-                :return: un dictionnaire contenant les comptes; les EPPN sont \
-                        utilisés comme clés.
+                :param dfn: la définition de classes LDAP
+                :param names: la liste des noms d'attributs voulus
+                :return: la liste des attributs présents dans la définition
                 """
-                people_dn = cfg.get( 'ldap' , 'people-dn' )
-                mail_domain = '@{}'.format( cfg.get( 'ldap' , 'mail-domain' ) )
-                obj_person = get_def_( cfg.get_list( 'ldap-people-classes' ) )
+                attrs = [ a for a in names if a in dfn ]
+                Logging( 'ldap' ).debug( 'Attributs lus: {}'.format(
+                        ', '.join( attrs ) ) )
+                return attrs
+
+            def convert_entry_( entry , uid , mail_domain ):
+                """
+                Génère un compte à partir d'une entrée LDAP, en ignorant les
+                adresses de redirection externes.
+
+                :param entry: le dictionnaire des attributs de l'entrée LDAP
+                :param str uid: l'UID de l'entrée
+                :param str mail_domain: le suffixe des adresses internes
+                :return: le compte, ou None si l'entrée doit être ignorée
+                """
+                try:
+                    a = SyncAccount( cfg ).from_ldap_attributes( entry )
+                except AttributeError as e:
+                    Logging( 'ldap' ).warning(
+                        'Compte LDAP {}: erreur sur attribut {}'.format(
+                            uid , str( e ) ) )
+                    return None
+
+                # Redirection?
+                if isinstance( a.ldapMail , str ):
+                    a.ldapMail = set([ a.ldapMail ])
+                elif not isinstance( a.ldapMail , set ):
+                    a.ldapMail = set( a.ldapMail )
+                remove = []
+                for ma in a.ldapMail:
+                    if ma.endswith( mail_domain ):
+                        continue
+                    Logging( 'ldap' ).info( (
+                            'Compte LDAP {}: redirection depuis {} vers '
+                            + '{} ignorée'
+                        ).format( uid , a.mail , ma ) )
+                    remove.append( ma )
+                a.ldapMail.difference_update( remove )
+                a.reset_fingerprint( )
+                if not a.ldapMail:
+                    Logging( 'ldap' ).info(
+                            'Compte LDAP {}: purement externe'.format( uid ) )
+                    return None
+                return a
+
+            def run_tasks_( tasks ):
+                """
+                Exécute des lectures depuis l'annuaire. Si plusieurs connexions
+                simultanées sont autorisées, chaque lecture est effectuée dans
+                un fil d'exécution séparé, avec sa propre connexion; le schéma
+                lu par la connexion principale est réutilisé. Dans le cas
+                contraire, les lectures sont effectuées l'une après l'autre
+                sur la connexion principale.
+
+                :param tasks: une liste de fonctions prenant une connexion \
+                        LDAP en paramètre
+                :return: la liste des résultats des fonctions, dans l'ordre
+                """
+                if max_conns == 1 or len( tasks ) == 1:
+                    return [ task( ldap_conn ) for task in tasks ]
+
+                def worker_( task ):
+                    server = cfg.ldap_server( get_info = 'NO_INFO' )
+                    server.attach_dsa_info( ldap_conn.server.info )
+                    server.attach_schema_info( ldap_conn.server.schema )
+                    with cfg.ldap_connection( server ) as conn:
+                        return task( conn )
+
+                from concurrent.futures import ThreadPoolExecutor
+                with ThreadPoolExecutor( min( max_conns , len( tasks ) ) ) as x:
+                    return list( x.map( worker_ , tasks ) )
+
+            def shards_( kind , attr , base ):
+                """
+                Génère la liste des partitions à utiliser pour la lecture d'un
+                type d'entrées. Les partitions sont lues depuis la section
+                'ldap-<type>-shards' de la configuration si elle existe; chaque
+                entrée y est soit un filtre LDAP, soit le DN d'une sous-branche.
+                Dans le cas contraire, les entrées sont réparties selon le
+                premier caractère d'un attribut; la dernière partition inclut
+                les entrées ne commençant par aucun des caractères connus.
+
+                :param str kind: le type d'entrées ('people' ou 'group')
+                :param str attr: l'attribut utilisé pour la répartition
+                :param str base: le DN de base de la recherche
+                :return: une liste de tuples contenant le DN de base et le \
+                        filtre de chaque partition
+                """
+                section = cfg.get_section( 'ldap-{}-shards'.format( kind ) ,
+                        True )
+                if section:
+                    return [ ( base , v ) if v.startswith( '(' ) else ( v , '' )
+                            for v in section.values( ) ]
+                chars = LDAPData.SHARD_CHARS
+                count = min( shard_counts[ kind ] , len( chars ) )
+                if count <= 1:
+                    return [ ( base , '' ) ]
+                size = len( chars ) / count
+                parts = [ chars[ round( i * size ) : round( ( i + 1 ) * size ) ]
+                        for i in range( count ) ]
+                prefix_ = lambda fmt , cs : ''.join([ fmt.format( attr , c )
+                        for c in cs ])
+                filters = [ '(|{})'.format( prefix_( '({}={}*)' , p ) )
+                        for p in parts ]
+                filters[ -1 ] = '(|{}(&{}))'.format(
+                        prefix_( '({}={}*)' , parts[ -1 ] ) ,
+                        prefix_( '(!({}={}*))' , chars ) )
+                return [ ( base , f ) for f in filters ]
+
+            def and_filters_( *filters ):
+                """
+                Combine des filtres LDAP au moyen d'un 'et' logique.
+
+                :param filters: les filtres à combiner; les filtres vides ou \
+                        None sont ignorés
+                :return: le filtre combiné, ou une chaîne vide
+                """
+                filters = [ f for f in filters if f ]
+                if len( filters ) > 1:
+                    return '(&{})'.format( ''.join( filters ) )
+                return ''.join( filters )
 
+            def merge_entries_( entry_lists ):
+                """
+                Fusionne les entrées lues depuis plusieurs partitions. Les
+                entrées lues plusieurs fois sont signalées et ignorées.
+
+                :param entry_lists: la liste des listes d'entrées de chaque \
+                        partition, sous la forme de tuples (DN, attributs)
+                :return: un générateur renvoyant les entrées uniques
+                """
+                seen = set( )
+                for entries in entry_lists:
+                    for ( dn , entry ) in entries:
+                        key = dn.lower( )
+                        if key in seen:
+                            Logging( 'ldap' ).warning( ( 'Entrée {} lue dans '
+                                    + 'plusieurs partitions' ).format( dn ) )
+                            continue
+                        seen.add( key )
+                        yield ( dn , entry )
+
+            def people_entries_( conn , obj_person , base , shard ):
+                """
+                Lit les entrées des comptes depuis l'annuaire LDAP. Si un cache
+                est utilisé, seules les entrées modifiées depuis le chargement
+                précédent sont lues. Si les groupes sont déterminés à partir
+                des comptes, l'attribut listant les groupes de chaque entrée est
+                également lu.
+
+                :param conn: la connexion LDAP à utiliser
+                :param obj_person: la définition des classes LDAP des comptes
+                :param str base: le DN de base de la recherche
+                :param str shard: le filtre de la partition, ou une chaîne vide
+                :return: un générateur renvoyant des tuples contenant le DN \
+                        et le dictionnaire des attributs de chaque entrée
+                """
+                attrs = projection_( obj_person ,
+                        SyncAccount.ldap_attributes( ) )
+
+                # En mode incrémental, on ne lit que les entrées modifiées; la
+                # date de modification est lue dans tous les cas lorsque le
+                # cache est utilisé.
+                incremental = cache is not None and not cache.full
+                if incremental:
+                    search_query = and_filters_( cache.query( ) , shard )
+                else:
+                    search_query = and_filters_( query , match_filter , shard )
+                fetch = list( attrs )
+                if cache is not None:
+                    fetch.append( cache.TIMESTAMP_ATTR )
+                if member_of:
+                    fetch.append( member_of_attr )
+
+                # Le filtre de recherche est toujours généré par le curseur
+                # ldap3; en mode rapide, la recherche est cependant effectuée
+                # directement, et les attributs des réponses sont utilisés
+                # sans passer par les entrées ldap3.
                 from ldap3 import Reader
-                reader = Reader( ldap_conn , obj_person , people_dn , query )
-                cursor = reader.search_paged( 10 , True )
+                reader = Reader( conn , obj_person , base ,
+                        search_query , attributes = attrs )
+                if fast_loader:
+                    results = conn.extend.standard.paged_search( base ,
+                            reader.query_filter , attributes = fetch ,
+                            paged_size = page_size , generator = True )
+                    aliases = LDAPAttr.schema_aliases( conn.server.schema ,
+                            fetch )
+                    return ( ( r[ 'dn' ] , LDAPAttr.from_response(
+                                r[ 'attributes' ] , aliases ) )
+                            for r in results if r[ 'type' ] == 'searchResEntry' )
+                return ( ( e.entry_dn , LDAPAttr.from_entry( e ) )
+                        for e in reader.search_paged( page_size , True ,
+                            attributes = fetch ) )
+
+            def read_accounts_( cursor ):
+                """
+                Génère la liste des comptes à partir des entrées lues depuis
+                l'annuaire LDAP. Si un cache est utilisé, celui-ci est mis à
+                jour; en mode incrémental, les comptes non modifiés sont
+                reconstruits depuis le cache.
+
+                :param cursor: les entrées lues, sous la forme de tuples \
+                        contenant le DN et le dictionnaire des attributs
+                :return: un tuple contenant l'ensemble des UID, le \
+                        dictionnaire des comptes indexé par EPPN et le \
+                        dictionnaire associant à chaque UID les DN des \
+                        groupes dont il est directement membre
+                """
+                mail_domain = '@{}'.format( cfg.get( 'ldap' , 'mail-domain' ) )
+                incremental = cache is not None and not cache.full
                 all_uids = set( )
                 accounts = {}
+                memberships = {}
 
                 # On lit les comptes, en se limitant si nécessaire via la
                 # variable de configuration 'limit'
@@ -595,53 +1313,48 @@ class LDAPData:
                     Logging( 'ldap' ).warning(
                             'synchronisation limitée à {} comptes'.format(
                                 limit ) )
-                for entry in cursor:
-                    all_uids.add( str( entry.uid ) )
-                    try:
-                        a = SyncAccount( cfg ).from_ldap_entry( entry )
-                    except AttributeError as e:
-                        Logging( 'ldap' ).warning(
-                            'Compte LDAP {}: erreur sur attribut {}'.format(
-                                str( entry.uid ) , str( e ) ) )
-                        continue
-
-                    # Redirection?
-                    if isinstance( a.ldapMail , str ):
-                        a.ldapMail = set([ a.ldapMail ])
-                    remove = []
-                    for ma in a.ldapMail:
-                        if ma.endswith( mail_domain ):
-                            continue
-                        Logging( 'ldap' ).info( (
-                                'Compte LDAP {}: redirection depuis {} vers '
-                                + '{} ignorée'
-                            ).format( str( entry.uid ) , a.mail , ma ) )
-                        remove.append( ma )
-                    a.ldapMail.difference_update( remove )
-                    if not a.ldapMail:
-                        Logging( 'ldap' ).info(
-                                'Compte LDAP {}: purement externe'.format(
-                                    entry.uid ) )
+                for ( dn , entry ) in cursor:
+                    uid = LDAPAttr.text( entry , 'uid' )
+                    all_uids.add( uid )
+                    a = convert_entry_( entry , uid , mail_domain )
+                    if member_of:
+                        memberships[ uid ] = entry.get( member_of_attr , [ ] )
+                    if cache is not None:
+                        ts = entry.get( cache.TIMESTAMP_ATTR )
+                        cache.update( dn , uid , a , ts[ 0 ] if ts else None ,
+                                memberships.get( uid ) )
+                    if a is None:
                         continue
 
+                    if a.eppn in accounts:
+                        Logging( 'ldap' ).warning(
+                                'Compte {}: plusieurs entrées LDAP'.format(
+                                    a.eppn ) )
                     accounts[ a.eppn ] = a
                     Logging( 'ldap' ).debug( 'Compte {} chargé'.format(
                             a.eppn ) )
                     if len( accounts ) == limit:
                         break
 
+                if incremental:
+                    ( all_uids , accounts , memberships ) = cache.accounts( )
+                # Les adresses des comptes sont remplacées par leurs instances
+                # enregistrées
+                registry = cfg.address_registry( )
+                accounts = { a.eppn : a
+                        for a in map( registry.account , accounts.values( ) ) }
                 Logging( 'ldap' ).info( '{} comptes chargés sur {} UIDs'.format(
                         len( accounts ) , len( all_uids ) ) )
-                return ( all_uids , accounts )
+                return ( all_uids , accounts , memberships )
 
-            def read_groups_( ):
+            def group_types_( ):
                 """
-                Lit la liste des groupes depuis l'annuaire LDAP.
+                Lit la liste des types de groupes depuis la configuration et
+                génère les définitions correspondantes.
 
-                :return: un dictionnaire associant à chaque groupe la liste \
-                        des comptes qui en font partie
+                :return: une liste de tuples contenant la définition des \
+                        classes LDAP et le nom de l'attribut listant les membres
                 """
-                from ldap3 import Reader
                 group_types = cfg.get_section( 'ldap-group-classes' , True )
                 if not group_types:
                     group_types = {
@@ -651,37 +1364,148 @@ class LDAPData:
                         }
                 Logging( 'ldap' ).debug( 'Types de groupes : {}'.format(
                     ' - '.join( group_types.keys( ) ) ) )
+                # Chaque entrée correspond à une ou plusieurs classes séparées
+                # par des /
+                return [ ( get_def_( group_type.split( '/' ) ) , member_attr )
+                        for group_type , member_attr in group_types.items( ) ]
+
+            def read_groups_( conn , obj_group , member_attr , base , shard ):
+                """
+                Lit la liste des groupes d'un type depuis l'annuaire LDAP.
+
+                :param conn: la connexion LDAP à utiliser
+                :param obj_group: la définition des classes LDAP des groupes
+                :param str member_attr: le nom de l'attribut listant les membres
+                :param str base: le DN de base de la recherche
+                :param str shard: le filtre de la partition, ou une chaîne vide
+                :return: un dictionnaire associant à chaque groupe la liste \
+                        des comptes qui en font partie
+                """
+                from ldap3 import Reader
                 groups = {}
-                group_dn = cfg.get( 'ldap' , 'groups-dn' )
-                for group_type , member_attr in group_types.items( ):
-                    # Chaque entrée correspond à une ou plusieurs classes
-                    # séparées par des /
-                    obj_classes = group_type.split( '/' )
-                    obj_group = get_def_( obj_classes )
-                    reader = Reader( ldap_conn , obj_group , group_dn )
-                    cursor = reader.search_paged( 10 , True )
-
-                    # On parcourt la liste
-                    for entry in cursor:
-                        group_name = entry.cn.value
-                        if group_name in groups:
-                            continue
+                attrs = projection_( obj_group , [ 'cn' , member_attr ] )
+                reader = Reader( conn , obj_group , base , shard ,
+                        attributes = attrs )
+                cursor = reader.search_paged( page_size , True )
+
+                # On parcourt la liste
+                for entry in cursor:
+                    group_name = entry.cn.value
+                    if group_name in groups:
+                        continue
+
+                    # On extrait les membres pour chaque nouveau groupe
+                    groups[ group_name ] = set( )
+                    for member in getattr( entry , member_attr ).values:
+                        member = member.strip( )
+
+                        # Transformation des DN en UID
+                        if '=' in member and ',' in member:
+                            parts_of_dn = member.split( ',' )
+                            attr_val = parts_of_dn[ 0 ].split( '=' )
+                            member = attr_val[ 1 ]
+
+                        groups[ group_name ].add( member )
 
-                        # On extrait les membres pour chaque nouveau groupe
-                        groups[ group_name ] = set( )
-                        for member in getattr( entry , member_attr ).values:
-                            member = member.strip( )
+                    Logging( 'ldap' ).debug( 'Groupe {} chargé'.format(
+                            group_name ) )
+                return groups
 
-                            # Transformation des DN en UID
-                            if '=' in member and ',' in member:
-                                parts_of_dn = member.split( ',' )
-                                attr_val = parts_of_dn[ 0 ].split( '=' )
-                                member = attr_val[ 1 ]
+            def merge_groups_( group_lists , shard_count ):
+                """
+                Fusionne les groupes lus pour chaque type de groupe et chaque
+                partition. Si un groupe apparaît dans plusieurs types, seule la
+                première occurrence (dans l'ordre de la configuration) est
+                conservée; s'il apparaît dans plusieurs partitions d'un même
+                type, un avertissement est affiché.
+
+                :param group_lists: la liste des dictionnaires de groupes, \
+                        pour chaque type puis chaque partition
+                :param int shard_count: le nombre de partitions par type
+                :return: le dictionnaire fusionné
+                """
+                groups = {}
+                for pos in range( 0 , len( group_lists ) , shard_count ):
+                    found = set( )
+                    for group_list in group_lists[ pos : pos + shard_count ]:
+                        for group_name , members in group_list.items( ):
+                            if group_name in found:
+                                Logging( 'ldap' ).warning( ( 'Groupe {} lu '
+                                        + 'dans plusieurs partitions' ).format(
+                                            group_name ) )
+                                continue
+                            found.add( group_name )
+                            if group_name not in groups:
+                                groups[ group_name ] = members
+                return groups
 
-                            groups[ group_name ].add( member )
+            def group_parents_( dn ):
+                """
+                Lit la liste des groupes dont un groupe est directement membre.
 
-                        Logging( 'ldap' ).debug( 'Groupe {} chargé'.format(
-                                group_name ) )
+                :param str dn: le DN du groupe
+                :return: la liste des DN des groupes parents
+                """
+                from ldap3 import BASE
+                from ldap3.core.exceptions import LDAPNoSuchObjectResult
+                try:
+                    ldap_conn.search( dn , '(objectClass=*)' , BASE ,
+                            attributes = [ member_of_attr ] )
+                except LDAPNoSuchObjectResult:
+                    return [ ]
+                if not ldap_conn.response:
+                    return [ ]
+                values = ldap_conn.response[ 0 ].get( 'attributes' , {} ).get(
+                        member_of_attr , [ ] )
+                return [ values ] if isinstance( values , str ) else values
+
+            def groups_from_memberships_( memberships ):
+                """
+                Reconstruit la liste des groupes à partir des groupes dont
+                chaque compte est membre. Seuls les groupes situés sous le DN
+                de base des groupes sont conservés. Si la configuration le
+                demande, les appartenances indirectes (groupes imbriqués) sont
+                également prises en compte.
+
+                :param dict memberships: le dictionnaire associant à chaque \
+                        UID les DN des groupes dont il est directement membre
+                :return: un dictionnaire associant à chaque groupe la liste \
+                        des comptes qui en font partie
+                """
+                from ldap3.utils.dn import parse_dn
+                from ldap3.core.exceptions import LDAPInvalidDnError
+                suffix = ',' + cfg.get( 'ldap' , 'groups-dn' ).lower( )
+                closures = {}
+                names = {}
+                groups = {}
+                for uid , dns in memberships.items( ):
+                    if nested:
+                        found = set( )
+                        for dn in dns:
+                            found |= LDAPData.group_closure( dn , closures ,
+                                    group_parents_ )
+                    else:
+                        found = dns
+                    for dn in found:
+                        key = dn.lower( )
+                        if key not in names:
+                            names[ key ] = None
+                            if key.endswith( suffix ):
+                                try:
+                                    names[ key ] = parse_dn( dn )[ 0 ][ 1 ]
+                                except LDAPInvalidDnError:
+                                    Logging( 'ldap' ).warning(
+                                            'DN de groupe {} invalide'.format(
+                                                dn ) )
+                        if names[ key ] is not None:
+                            groups.setdefault( names[ key ] , set( ) ).add(
+                                    uid )
+                Logging( 'ldap' ).debug( '{} groupes lus depuis {}'.format(
+                        len( groups ) , member_of_attr ) )
+                if nested:
+                    Logging( 'ldap' ).debug(
+                            '{} groupes imbriqués examinés'.format(
+                                len( closures ) ) )
                 return groups
 
             def set_account_groups_( all_uids ):
@@ -703,7 +1527,7 @@ class LDAPData:
                         if eppn in self.accounts:
                             self.accounts[ eppn ].add_group( g )
                             continue
-                        if uid in all_uids or query:
+                        if uid in all_uids or query or match_filter:
                             continue
                         Logging( 'ldap' ).warning(
                                 'Groupe {} - utilisateur {} inconnu'.format( g ,
@@ -712,26 +1536,159 @@ class LDAPData:
             def set_account_cos_( ):
                 """
                 Applique les règles d'attribution de classes de service aux
-                comptes.
+                comptes. Chaque règle est évaluée, dans l'ordre de la
+                configuration, sur l'ensemble des comptes auxquels aucune
+                classe n'a encore été attribuée, au moyen d'index inversés des
+                attributs testés par les règles.
                 """
+                from .rules import RuleIndex
+                from .table import AccountTable
                 def_cos = cfg.get( 'bss' , 'default-cos' )
                 cos_rules = cfg.parse_cos_rules( )
+                fields = set( ).union( *( r.attributes
+                        for r in cos_rules.values( ) ) )
+                index = RuleIndex( AccountTable( self.accounts , fields ) )
+                remaining = set( index.all )
+                for r in cos_rules:
+                    if not remaining:
+                        break
+                    matched = cos_rules[ r ].select( index ) & remaining
+                    remaining -= matched
+                    for eppn in matched:
+                        self.accounts[ eppn ].cos = r
+                for eppn in remaining:
+                    self.accounts[ eppn ].cos = def_cos
                 for a in self.accounts.values( ):
-                    a.cos = def_cos
-                    for r in cos_rules:
-                        if cos_rules[ r ].check( a ):
-                            a.cos = r
-                            break
                     Logging( 'ldap' ).debug( 'Compte {} - CoS {}'.format(
                             a.eppn , a.cos ) )
 
             if query:
                 Logging( 'ldap' ).debug( 'Filtre LDAP: {}'.format( query ) )
-            self.groups = read_groups_( )
-            ( all_uids , self.accounts ) = read_accounts_( )
+            if match_filter:
+                Logging( 'ldap' ).debug( 'Filtre de sélection: {}'.format(
+                        match_filter ) )
+
+            # Les définitions sont générées au préalable; les comptes et
+            # chaque type de groupes sont ensuite lus simultanément. Si les
+            # groupes sont lus depuis les comptes, aucune recherche de
+            # groupes n'est nécessaire.
+            # Si les lectures sont partitionnées, chaque partition est lue
+            # séparément, et les comptes sont générés après la fusion des
+            # entrées.
+            SyncAccount( cfg )
+            obj_person = get_def_( cfg.get_list( 'ldap-people-classes' ) )
+            # Les attributs lus en plus de ceux des classes (date de
+            # modification pour le cache, groupes des comptes) doivent figurer
+            # dans la définition, faute de quoi le curseur ldap3 refuse les
+            # entrées lorsqu'il s'agit d'attributs utilisateur du schéma.
+            extra = [ ]
+            if cache is not None:
+                extra.append( cache.TIMESTAMP_ATTR )
+            if member_of:
+                extra.append( member_of_attr )
+            for name in extra:
+                if name not in obj_person:
+                    from ldap3 import AttrDef
+                    obj_person += AttrDef( name )
+            people_shards = shards_( 'people' , 'uid' ,
+                    cfg.get( 'ldap' , 'people-dn' ) )
+            if len( people_shards ) == 1:
+                tasks = [ lambda conn : read_accounts_( people_entries_( conn ,
+                        obj_person , *people_shards[ 0 ] ) ) ]
+            else:
+                tasks = [ lambda conn , b = base , f = shard : list(
+                            people_entries_( conn , obj_person , b , f ) )
+                        for ( base , shard ) in people_shards ]
+            # Si seuls certains groupes sont utiles, seuls ceux-ci sont lus.
+            read_groups = groups is None and not member_of and kept != set( )
+            if read_groups:
+                group_shards = shards_( 'group' , 'cn' ,
+                        cfg.get( 'ldap' , 'groups-dn' ) )
+                if kept is None:
+                    names = ''
+                else:
+                    from ldap3.utils.conv import escape_filter_chars
+                    names = '(|{})'.format( ''.join([
+                            '(cn={})'.format( escape_filter_chars( g ) )
+                            for g in sorted( kept ) ]) )
+                for ( obj_group , member_attr ) in group_types_( ):
+                    for ( base , shard ) in group_shards:
+                        tasks.append( lambda conn , o = obj_group ,
+                                m = member_attr , b = base ,
+                                f = and_filters_( shard , names ) :
+                                    read_groups_( conn , o , m , b , f ) )
+            results = run_tasks_( tasks )
+            if len( people_shards ) == 1:
+                ( all_uids , self.accounts , memberships ) = results[ 0 ]
+            else:
+                ( all_uids , self.accounts , memberships ) = read_accounts_(
+                        merge_entries_( results[ :len( people_shards ) ] ) )
+            if member_of:
+                self.groups = groups_from_memberships_( memberships )
+            elif read_groups:
+                self.groups = merge_groups_( results[ len( people_shards ): ] ,
+                        len( group_shards ) )
+            elif groups is None:
+                self.groups = {}
+            else:
+                self.groups = groups
+            if kept is not None:
+                self.groups = { g : m for g , m in self.groups.items( )
+                        if g in kept }
             set_account_groups_( all_uids )
             set_account_cos_( )
 
+    @staticmethod
+    def group_closure( dn , closures , parents ):
+        """
+        Calcule l'ensemble des groupes dont un groupe est membre, directement
+        ou indirectement. Le graphe des appartenances est parcouru au moyen de
+        l'algorithme de Tarjan: tous les groupes d'un même cycle (composante
+        fortement connexe) reçoivent le même résultat, qui n'est mémorisé
+        qu'une fois la composante entièrement parcourue, de sorte qu'il ne
+        dépende pas de l'ordre de parcours.
+
+        :param str dn: le DN du groupe
+        :param dict closures: les résultats déjà calculés, indexés par DN en \
+                minuscules; il est mis à jour
+        :param parents: une fonction renvoyant, pour le DN d'un groupe, la \
+                liste des DN des groupes dont il est directement membre
+        :return: l'ensemble des DN des groupes, y compris celui du groupe \
+                lui-même
+        """
+        index = {}
+        low = {}
+        reached = {}
+        stack = []
+
+        def visit_( key , dn ):
+            index[ key ] = low[ key ] = len( index )
+            stack.append( key )
+            reached[ key ] = result = set([ dn ])
+            for parent in parents( dn ):
+                pkey = parent.lower( )
+                if pkey not in closures and pkey not in index:
+                    visit_( pkey , parent )
+                if pkey in closures:
+                    result |= closures[ pkey ]
+                else:
+                    # Groupe de la composante en cours de parcours
+                    low[ key ] = min( low[ key ] , low[ pkey ] )
+            if low[ key ] != index[ key ]:
+                return
+            # Racine d'une composante: ses membres sont dépilés et reçoivent
+            # l'ensemble des groupes atteints par chacun d'entre eux.
+            members = stack[ stack.index( key ): ]
+            del stack[ -len( members ): ]
+            closure = set( ).union( *( reached.pop( m ) for m in members ) )
+            for m in members:
+                closures[ m ] = closure
+
+        key = dn.lower( )
+        if key not in closures:
+            visit_( key , dn )
+        return closures[ key ]
+
     def set_account_aliases_( self , account , aliases , found ):
         """
         Méthode interne qui identifie les aliases correspondant à un compte LDAP
@@ -757,23 +1714,27 @@ class LDAPData:
                     alias ) )
                 delete.append( alias )
         self.accounts[ account ].aliases.difference_update( delete )
+        self.accounts[ account ].reset_fingerprint( )
         if not self.accounts[ account ].aliases:
             return
         Logging( 'ldap' ).debug( 'Aliases pour le compte '
                 + self.accounts[ account ].mail + ': '
                 + ', '.join( self.accounts[ account ].aliases ) )
 
-    def set_aliases( self , aliases ):
+    def set_aliases( self , aliases , eppns = None ):
         """
-        Initialise les aliases pour l'ensemble des comptes.
+        Initialise les aliases pour l'ensemble des comptes, ou pour certains
+        d'entre eux seulement.
 
         :param AliasesMap aliases: l'instance de stockage des aliases
+        :param eppns: les EPPN des comptes à mettre à jour, ou None pour \
+                mettre à jour l'ensemble des comptes
         """
         found = set( )
-        for account in self.accounts:
+        for account in self.accounts if eppns is None else eppns:
             self.set_account_aliases_( account , aliases , found )
 
-    def fix_mail_domain( self , cfg ):
+    def fix_mail_domain( self , cfg , eppns = None ):
         """
         Remplace le nom de domaine provenant du LDAP pour les adresses mail
         par celui configuré pour l'API de Partage. Normalement cette méthode
@@ -781,6 +1742,8 @@ class LDAPData:
         un domaine différent.
 
         :param Config cfg: la configuration
+        :param eppns: les EPPN des comptes à corriger, ou None pour corriger \
+                l'ensemble des comptes
         """
         if cfg.has_flag( 'bss' , 'dont-fix-domains' ): return
 
@@ -793,15 +1756,24 @@ class LDAPData:
                 ldap_dom , bss_dom ) )
         from .utils import get_address_fixer
         fix_it = get_address_fixer( cfg )
-        for account in self.accounts.values( ):
-            account.mail = fix_it( account.mail )
+        registry = cfg.address_registry( )
+        if eppns is None:
+            eppns = self.accounts
+        for account in map( self.accounts.get , eppns ):
+            account.mail = registry.address( fix_it( account.mail ) )
             if account.aliases is not None:
-                account.aliases = set([ fix_it( a ) for a in account.aliases ])
+                account.aliases = set([ registry.address( fix_it( a ) )
+                        for a in account.aliases ])
 
-    def clear_empty_sets( self ):
+    def clear_empty_sets( self , eppns = None ):
         """
         Remplace les ensembles (d'aliases et de groupes) vides par une valeur
         nulle.
+
+        :param eppns: les EPPN des comptes à traiter, ou None pour traiter \
+                l'ensemble des comptes
         """
-        for a in self.accounts.values( ):
+        if eppns is None:
+            eppns = self.accounts
+        for a in map( self.accounts.get , eppns ):
             a.clear_empty_sets( )
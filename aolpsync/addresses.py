@@ -0,0 +1,77 @@
+class AddressRegistry:
+    """
+    Registre des adresses mail et EPPN. Les mêmes adresses apparaissent dans
+    les comptes lus depuis l'annuaire LDAP, depuis la base de données et depuis
+    le serveur Partage, dans les aliases, les listes de diffusion, etc.; chaque
+    source en génère une copie distincte. Le registre associe à chaque adresse
+    une instance unique, qui est utilisée à la place des copies.
+
+    Les domaines sont également enregistrés, ce qui permet de lister les
+    domaines rencontrés et le nombre d'adresses de chacun d'entre eux.
+    """
+
+    def __init__( self ):
+        self.addresses_ = {}
+        self.domains_ = {}
+
+    def __len__( self ):
+        return len( self.addresses_ )
+
+    def __contains__( self , address ):
+        return address in self.addresses_
+
+    def address( self , address ):
+        """
+        Renvoie l'instance unique correspondant à une adresse, en enregistrant
+        cette dernière si elle n'était pas encore connue.
+
+        :param str address: l'adresse, ou None
+        :return: l'instance enregistrée de l'adresse, ou None
+        """
+        if address is None:
+            return None
+        known = self.addresses_.get( address )
+        if known is not None:
+            return known
+        domain = address.rpartition( '@' )[ 2 ]
+        self.domains_[ domain ] = self.domains_.get( domain , 0 ) + 1
+        return self.addresses_.setdefault( address , address )
+
+    def addresses( self , addresses ):
+        """
+        Renvoie un ensemble contenant les instances uniques d'une liste
+        d'adresses.
+
+        :param addresses: les adresses, sous la forme d'une chaîne, d'un \
+                itérable ou de None
+        :return: l'ensemble des instances enregistrées, ou None si la \
+                valeur était None
+        """
+        if addresses is None:
+            return None
+        if isinstance( addresses , str ):
+            return set([ self.address( addresses ) ])
+        return set( map( self.address , addresses ) )
+
+    def account( self , account ):
+        """
+        Remplace les adresses d'un compte (EPPN, adresse principale, adresses
+        LDAP et aliases) par leurs instances uniques.
+
+        :param SyncAccount account: le compte
+        :return: le compte
+        """
+        account.eppn = self.address( account.eppn )
+        account.mail = self.address( account.mail )
+        if account.ldapMail is not None:
+            account.ldapMail = self.addresses( account.ldapMail )
+        if account.aliases is not None:
+            account.aliases = self.addresses( account.aliases )
+        return account
+
+    def domains( self ):
+        """
+        :return: un dictionnaire associant à chaque domaine rencontré le \
+                nombre d'adresses enregistrées dans ce domaine
+        """
+        return dict( self.domains_ )
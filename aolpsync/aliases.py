@@ -23,9 +23,13 @@ class AliasCommands:
         Initialise l'instance en se basant sur la section 'aliases' de la
         configuration. Les commandes présentes dans la section seront lues, et
         la chaîne spéciale "!configdir!" y sera remplacée par le chemin absolu
-        du répertoire de configuration.
+        du répertoire de configuration. Les limites d'exécution (nombre de
+        commandes simultanées, délai et taille de sortie de chaque commande)
+        et les paramètres du cache sont lus depuis la section
+        'alias-commands'.
 
         :param Config cfg: la configuration
+        :raises FatalError: l'une des limites configurées est invalide
         """
         s = cfg.get_section( 'aliases' )
         self.commands = dict( )
@@ -36,6 +40,65 @@ class AliasCommands:
                     'Commande de liste d\'aliases {}: {}'.format(
                         cn , self.commands[ cn ] ) )
 
+        self.parallel = self.get_limit_( cfg , 'parallel' , '4' )
+        if self.parallel is None:
+            from .utils import FatalError
+            raise FatalError( 'Erreur de configuration: '
+                    + 'alias-commands > parallel invalide' )
+        self.limits = dict( )
+        timeout = self.get_limit_( cfg , 'timeout' )
+        max_output = self.get_limit_( cfg , 'max-output' )
+        for cn in self.commands:
+            self.limits[ cn ] = (
+                self.get_limit_( cfg , cn + '.timeout' , timeout ) ,
+                self.get_limit_( cfg , cn + '.max-output' , max_output ) )
+
+        self.cache_path = None
+        self.cache_params = dict( )
+        if cfg.has_section( 'alias-commands' ):
+            self.cache_path = cfg.get( 'alias-commands' , 'cache' )
+        if self.cache_path is None:
+            return
+        ttl = self.get_limit_( cfg , 'ttl' )
+        for cn in self.commands:
+            probes = tuple(
+                tuple( p.replace( '!configdir!' , Config.CONFIG_DIR )
+                    for p in cfg.get( 'alias-commands' ,
+                        '{}.probe-{}'.format( cn , kind ) , '' ).split( )
+                ) for kind in ( 'mtime' , 'checksum' ) )
+            self.cache_params[ cn ] = (
+                    self.get_limit_( cfg , cn + '.ttl' , ttl ) , probes )
+
+    @staticmethod
+    def get_limit_( cfg , name , default = None ):
+        """
+        Lit une limite depuis la section 'alias-commands' de la configuration.
+        Une valeur nulle indique l'absence de limite.
+
+        :param Config cfg: la configuration
+        :param str name: le nom de l'option
+        :param default: la valeur par défaut
+        :return: la valeur entière de la limite, ou None si aucune limite \
+                n'est définie
+        :raises FatalError: la valeur configurée n'est pas un entier positif \
+                ou nul
+        """
+        if not cfg.has_section( 'alias-commands' ):
+            value = default
+        else:
+            value = cfg.get( 'alias-commands' , name , default )
+        if value is None:
+            return None
+        try:
+            value = int( value )
+            if value < 0:
+                raise ValueError
+        except ValueError:
+            from .utils import FatalError
+            raise FatalError( 'Erreur de configuration: '
+                    + 'alias-commands > {} invalide'.format( name ) )
+        return value or None
+
     def get_aliases( self ):
         """
         Accède aux aliases supplémentaires. Ils seront chargés si nécessaire.
@@ -46,36 +109,221 @@ class AliasCommands:
             self.fetched_ = self.fetch_( )
         return self.fetched_
 
+    def run_command_( self , command ):
+        """
+        Exécute l'une des commandes définies dans la configuration, en
+        appliquant les limites de délai et de taille de sortie qui la
+        concernent, puis écrit les éventuels messages d'erreur dans le log.
+
+        :param str command: le nom de la commande
+        :return: la liste des lignes lues sur la sortie standard de la \
+                commande, ou None si son exécution a échoué
+        """
+        from .utils import run_shell_command , ShellCommandError
+        Logging( 'alias' ).info( 'Récupération des aliases: {}'.format(
+                command ) )
+        ( timeout , max_output ) = self.limits[ command ]
+        try:
+            ( ev , output , errors ) = run_shell_command(
+                        self.commands[ command ] ,
+                        timeout = timeout , max_output = max_output )
+        except ShellCommandError as e:
+            Logging( 'alias' ).error(
+                'Exécution de `{}` interrompue: {}'.format(
+                    self.commands[ command ] , str( e ) ) )
+            return None
+        if ev != 0:
+            Logging( 'alias' ).error(
+                'Erreur lors de l\'exécution de `{}`: {}'.format(
+                    self.commands[ command ] , ev ) )
+            dump_err = lambda l : Logging( 'alias' ).error( l )
+        else:
+            dump_err = lambda l : Logging( 'alias' ).warning( l )
+        for l in errors:
+            dump_err( l )
+        if ev != 0:
+            return None
+        return output
+
+    def probe_( self , command ):
+        """
+        Calcule l'état des fichiers dont dépend le résultat d'une commande,
+        tels que définis par les options <commande>.probe-mtime (date de
+        modification et taille) et <commande>.probe-checksum (empreinte
+        SHA-256 du contenu). Un fichier absent ou illisible est représenté
+        par None.
+
+        :param str command: le nom de la commande
+        :return: une liste décrivant l'état de chaque fichier
+        """
+        import hashlib , os
+        ( by_mtime , by_checksum ) = self.cache_params[ command ][ 1 ]
+        state = []
+        for path in by_mtime:
+            try:
+                st = os.stat( path )
+                state.append([ path , st.st_mtime_ns , st.st_size ])
+            except OSError:
+                state.append([ path , None ])
+        for path in by_checksum:
+            try:
+                h = hashlib.sha256( )
+                with open( path , 'rb' ) as f:
+                    for chunk in iter( lambda : f.read( 65536 ) , b'' ):
+                        h.update( chunk )
+                state.append([ path , h.hexdigest( ) ])
+            except OSError:
+                state.append([ path , None ])
+        return state
+
+    def load_cache_( self ):
+        """
+        Lit le fichier de cache des aliases, s'il a été configuré.
+
+        :return: le contenu du cache, sous la forme d'un dictionnaire \
+                associant à chaque nom de commande une entrée; le \
+                dictionnaire est vide si le cache n'existe pas ou n'a pas pu \
+                être lu
+        """
+        import json
+        if self.cache_path is None:
+            return {}
+        try:
+            with open( self.cache_path , 'r' ) as f:
+                data = json.load( f )
+            if not isinstance( data , dict ):
+                raise ValueError( 'format invalide' )
+            return data
+        except FileNotFoundError:
+            pass
+        except ( OSError , ValueError ) as e:
+            Logging( 'alias' ).warning(
+                    'Lecture du cache d\'aliases {}: {}'.format(
+                        self.cache_path , str( e ) ) )
+        return {}
+
+    def save_cache_( self , data ):
+        """
+        Écrit le fichier de cache des aliases. Le fichier est écrit sous un
+        nom temporaire puis renommé, de sorte qu'une exécution simultanée ne
+        puisse pas lire un cache incomplet.
+
+        :param dict data: le contenu du cache
+        """
+        import json , os
+        temp_path = '{}.{}'.format( self.cache_path , os.getpid( ) )
+        try:
+            with open( temp_path , 'w' ) as f:
+                json.dump( data , f )
+            os.replace( temp_path , self.cache_path )
+        except OSError as e:
+            Logging( 'alias' ).warning(
+                    'Écriture du cache d\'aliases {}: {}'.format(
+                        self.cache_path , str( e ) ) )
+
+    def cached_( self , cache , command , now ):
+        """
+        Recherche dans le cache les aliases d'une commande. Une commande n'est
+        mise en cache que si une durée de validité ou des fichiers à surveiller
+        ont été définis pour elle; l'entrée est valide si la ligne de commande
+        n'a pas changé, si sa durée de validité n'est pas dépassée, et si
+        l'état des fichiers surveillés est inchangé.
+
+        :param dict cache: le contenu du cache
+        :param str command: le nom de la commande
+        :param float now: l'heure courante
+        :return: un tuple contenant l'état actuel des fichiers surveillés \
+                (ou None si la commande ne doit pas être mise en cache) et \
+                le dictionnaire des aliases lu depuis le cache (ou None si \
+                l'entrée est absente ou invalide)
+        """
+        if command not in self.cache_params:
+            return ( None , None )
+        ( ttl , probes ) = self.cache_params[ command ]
+        if ttl is None and not ( probes[ 0 ] or probes[ 1 ] ):
+            return ( None , None )
+        state = self.probe_( command )
+        entry = cache.get( command )
+        if not isinstance( entry , dict ):
+            return ( state , None )
+        if ( entry.get( 'command' ) != self.commands[ command ]
+                or entry.get( 'probes' ) != state ):
+            return ( state , None )
+        if ttl is not None and now - entry.get( 'time' , 0 ) >= ttl:
+            return ( state , None )
+        try:
+            aliases = { alias : set( targets )
+                    for alias , targets in entry[ 'aliases' ].items( ) }
+        except ( KeyError , AttributeError , TypeError ):
+            return ( state , None )
+        return ( state , aliases )
+
     def fetch_( self ):
         """
         Récupère les aliases supplémentaires en exécutant chacune des commandes
         définies dans la configuration puis en extrayant les données renvoyées
-        par celles-ci.
+        par celles-ci. Les aliases des commandes dont l'entrée dans le cache
+        est valide sont lus depuis ce dernier, sans exécuter la commande. Les
+        autres commandes sont exécutées simultanément (dans la limite
+        configurée); seules les sorties traitées entièrement sont mises en
+        cache. Les aliases de chaque commande sont ensuite fusionnés
+        dans l'ordre de la configuration, de sorte que la première définition
+        d'un alias présent dans plusieurs sources est toujours celle qui est
+        conservée.
 
         :return: un dictionnaire associant à un alias un ensemble de cibles
         """
-        import subprocess
-        aliases = {}
-        for command in self.commands:
-            Logging( 'alias' ).info( 'Récupération des aliases: {}'.format(
-                    command ) )
-
-            from .utils import run_shell_command
-            ( ev , output , errors ) = run_shell_command(
-                        self.commands[ command ] )
-            if ev != 0:
-                Logging( 'alias' ).error(
-                    'Erreur lors de l\'exécution de `{}`: {}'.format(
-                        self.commands[ command ] , ev ) )
-                dump_err = lambda l : Logging( 'alias' ).error( l )
-            else:
-                dump_err = lambda l : Logging( 'alias' ).warning( l )
-            for l in errors:
-                dump_err( l )
-            if ev != 0:
+        import time
+        commands = list( self.commands )
+        cache = self.load_cache_( )
+        now = time.time( )
+        results = dict( )
+        states = dict( )
+        for command in commands:
+            ( state , aliases ) = self.cached_( cache , command , now )
+            if state is not None:
+                states[ command ] = state
+            if aliases is not None:
+                Logging( 'alias' ).info(
+                        'Aliases lus depuis le cache: {}'.format( command ) )
+                results[ command ] = aliases
+
+        missing = [ c for c in commands if c not in results ]
+        if self.parallel == 1 or len( missing ) < 2:
+            outputs = [ self.run_command_( c ) for c in missing ]
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(
+                    min( self.parallel , len( missing ) ) ) as x:
+                outputs = list( x.map( self.run_command_ , missing ) )
+
+        updated = False
+        for command , output in zip( missing , outputs ):
+            if output is None:
                 continue
+            results[ command ] = dict( )
+            complete = self.process_alias_lines( results[ command ] , output )
+            if complete and command in states:
+                cache[ command ] = {
+                    'command' : self.commands[ command ] ,
+                    'time' : now ,
+                    'probes' : states[ command ] ,
+                    'aliases' : { alias : sorted( targets ) for alias , targets
+                            in results[ command ].items( ) } ,
+                }
+                updated = True
+        if updated:
+            self.save_cache_({ c : cache[ c ] for c in commands
+                    if c in cache })
 
-            self.process_alias_lines( aliases , output )
+        aliases = {}
+        for command in commands:
+            for alias , targets in results.get( command , {} ).items( ):
+                if alias in aliases:
+                    Logging( 'alias' ).warning(
+                            'Alias {}: doublon'.format( alias ) )
+                    continue
+                aliases[ alias ] = targets
         return aliases
 
     def process_alias_lines( self , aliases , output ):
@@ -87,6 +335,8 @@ class AliasCommands:
         :param output: la liste des lignes lues depuis l'une des commandes; \
                 les lignes sont reçues sous forme de binaires, on les décode \
                 donc en considérant qu'il s'agit d'UTF-8
+        :return: True si l'ensemble de la sortie a été traité, False si le \
+                traitement a été interrompu par du contenu non-UTF-8
         """
         import re
         for line in output:
@@ -94,7 +344,7 @@ class AliasCommands:
                 line = line.decode( 'utf-8' )
             except UnicodeDecodeError:
                 Logging( 'alias' ).error( 'Contenu non-UTF-8' )
-                return
+                return False
             line = re.sub( r'#.*$' , '' , line ).strip( )
             if not line: continue
             bits = line.split( ':' )
@@ -117,6 +367,7 @@ class AliasCommands:
                     re.sub( r'\s+' , '' , addresses ).split( ',' ) )
             Logging( 'alias' ).debug( 'Alias {} lu -> {}'.format(
                     alias , ', '.join( aliases[ alias ] ) ) )
+        return True
 
 
 #-------------------------------------------------------------------------------
@@ -136,6 +387,7 @@ class AliasesMap:
         """
         self.aliases_ = {}
         self.reverse_aliases_ = {}
+        self.registry_ = cfg.address_registry( )
         mail_domain = '@{}'.format( cfg.get( 'ldap' , 'mail-domain' ) )
 
         # Recherche les transfers d'aliases
@@ -203,6 +455,8 @@ class AliasesMap:
         :raises AliasError: si une boucle infinie ou un doublon sont détectés
         """
         Logging( 'ldap' ).debug( 'Alias {} -> {}'.format( alias , target ) )
+        target = self.registry_.address( target )
+        alias = self.registry_.address( alias )
         # Si la cible spécifiée est un alias, on récupère sa destination
         oriTarget = target
         while target in self.aliases_:
@@ -255,6 +509,23 @@ class AliasesMap:
         """
         return set( self.aliases_.keys( ) )
 
+    def changed_addresses( self , other ):
+        """
+        Compare cette instance à une autre instance construite à partir d'une
+        version différente des comptes.
+
+        :param AliasesMap other: l'instance avec laquelle comparer
+        :return: l'ensemble des adresses dont les aliases ou la cible \
+                diffèrent entre les deux instances
+        """
+        changed = set( )
+        for mine , theirs in ( ( self.aliases_ , other.aliases_ ) ,
+                ( self.reverse_aliases_ , other.reverse_aliases_ ) ):
+            for address in mine.keys( ) | theirs.keys( ):
+                if mine.get( address ) != theirs.get( address ):
+                    changed.add( address )
+        return changed
+
     def get_main_account( self , address ):
         """
         Tente de récupérer l'adresse réelle correspondant à une adresse. Si un
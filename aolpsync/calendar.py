@@ -395,10 +395,10 @@ class ZimbraCalendarImport( CalendarImport ):
                 raise_missing = True )
         self.read_rule_ = Rule( '{}/read-rule'.format( self.src_section_ ) ,
                 cfg.get( self.src_section_ , 'read-rule' ,
-                        default = '(true)' ) )
+                        default = '(true)' ) , cfg )
         self.write_rule_ = Rule( '{}/write-rule'.format( self.src_section_ ) ,
                 cfg.get( self.src_section_ , 'write-rule' ,
-                        default = '(false)' ) )
+                        default = '(false)' ) , cfg )
 
     def read_data( self , zimbra , address_map ):
         # On lit les informations du dossier depuis l'API Zimbra, et on extrait
@@ -538,6 +538,7 @@ class CalendarSync:
             raise FatalError(
                     'Valeur incorrecte pour calendars.zimbra-max-attempts' )
         self.max_attempts_ = max_attempts
+        self.registry_ = cfg.address_registry( )
 
         # Chargement des sources de données
         src_names = cfg.get( 'calendars' , 'sources' , raise_missing = True )
@@ -687,27 +688,30 @@ class CalendarSync:
         """
         Génère un dictionnaire associant toutes les adresses mail connues aux
         EPPN des utilisateurs correspondants. Les comptes pré-supprimés seront
-        ignorés.
+        ignorés. Les adresses sont celles du registre des adresses.
 
         :param accounts: la liste des comptes, sous la forme d'un dictionnaire \
                 associant les instances SyncAccount aux EPPN
 
         :return: le dictionnaire des adresses associées à leurs EPPN
         """
-        # On génère les correspondances comptes / adresses
+        # On génère les correspondances comptes / adresses; les adresses et
+        # EPPN utilisés sont les instances du registre des adresses.
+        address = self.registry_.address
         address_map = dict( )
         for eppn in accounts:
             account = accounts[ eppn ]
             if account.markedForDeletion is not None:
                 continue
-            address_map[ account.mail ] = eppn
+            eppn = address( eppn )
+            address_map[ address( account.mail ) ] = eppn
             if not account.aliases:
                 continue
             if isinstance( account.aliases , str ):
-                address_map[ account.aliases ] = eppn
+                address_map[ address( account.aliases ) ] = eppn
             else:
                 for alias in account.aliases:
-                    address_map[ alias ] = eppn
+                    address_map[ address( alias ) ] = eppn
         return address_map
 
     def get_user_folders_( self , eppn ):
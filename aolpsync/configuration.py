@@ -148,12 +148,92 @@ class Config:
         section = self.cfg_[ 'cos-rules' ]
         try:
             for r in section:
-                rules[ r ] = Rule( r , section[ r ] )
+                rules[ r ] = Rule( r , section[ r ] , self )
         except RuleError as e:
             Logging( 'cfg' ).critical( str( e ) )
             raise FatalError( 'Erreur dans les règles d\'attribution de CoS' )
         return rules
 
+    def rule_cache_size( self ):
+        """
+        Lit la taille du cache des résultats des règles.
+
+        :return: le nombre maximal de résultats mémorisés pour chaque règle
+        :raises FatalError: la taille configurée est invalide
+        """
+        if not self.has_section( 'rules' ):
+            return Rule.CACHE_SIZE
+        try:
+            size = int( self.get( 'rules' , 'cache-size' ,
+                    str( Rule.CACHE_SIZE ) ) )
+            if size < 0:
+                raise ValueError
+        except ValueError:
+            raise FatalError( 'Erreur de configuration: '
+                    + 'rules > cache-size invalide' )
+        return size
+
+    def rule_profiler( self ):
+        """
+        Accède à l'instance (unique) de profilage des règles, si le drapeau
+        profile de la section rules est présent. Si l'instance n'avait pas
+        encore été créée, elle le sera.
+
+        :return: l'instance de profilage, ou None si le profilage est \
+                désactivé
+        """
+        if not self.has_flag( 'rules' , 'profile' ):
+            return None
+        if not hasattr( self , 'rule_profiler_' ):
+            from .rules import RuleProfiler
+            self.rule_profiler_ = RuleProfiler( )
+        return self.rule_profiler_
+
+    def kept_groups( self ):
+        """
+        Détermine la liste des groupes LDAP à conserver lorsque le drapeau
+        'prune-groups' est présent. Il s'agit des groupes auxquels font
+        référence les règles d'attribution de classes de service, la règle de
+        sélection des comptes et les règles d'accès aux calendriers, ainsi que
+        des groupes listés par l'option 'kept-groups'.
+
+        :return: l'ensemble des noms de groupes à conserver, ou None si tous \
+                les groupes doivent l'être
+        :raises FatalError: une règle est incorrecte
+        """
+        if not self.has_flag( 'ldap' , 'prune-groups' ):
+            return None
+        rules = list( self.parse_cos_rules( ).values( ) )
+        texts = [ ( 'account selection' ,
+                self.get( 'ldap' , 'match-rule' , '(true)' ) ) ]
+        for section in self.cfg_.sections( ):
+            if not section.startswith( 'calendars-' ):
+                continue
+            for name in ( 'read-rule' , 'write-rule' ):
+                if name in self.cfg_[ section ]:
+                    texts.append(( '{}/{}'.format( section , name ) ,
+                            self.cfg_[ section ][ name ] ))
+        try:
+            rules.extend([ Rule( name , text , self )
+                    for name , text in texts ])
+        except RuleError as e:
+            Logging( 'cfg' ).critical( str( e ) )
+            raise FatalError( 'Erreur dans les règles' )
+
+        kept = set([ x
+            for x in self.get( 'ldap' , 'kept-groups' , '' ).split( ' ' )
+            if x != '' ])
+        for rule in rules:
+            values = rule.referenced_values( 'groups' )
+            if values is None:
+                Logging( 'cfg' ).warning( 'Une règle teste l\'absence de '
+                        + 'groupes; tous les groupes sont conservés' )
+                return None
+            kept.update( values )
+        Logging( 'cfg' ).debug( 'Groupes conservés: {}'.format(
+                ', '.join( sorted( kept ) ) ) )
+        return kept
+
     def check_coses( self , coses ):
         """
         Vérifie que l'ensemble des classes de service référencées dans la
@@ -271,11 +351,13 @@ class Config:
 
     #---------------------------------------------------------------------------
 
-    def ldap_server( self ):
+    def ldap_server( self , get_info = 'ALL' ):
         """
         Crée l'instance qui représente le serveur LDAP à partir de la
         configuration.
 
+        :param str get_info: les informations à lire depuis le serveur lors \
+                de la connexion (schéma et DSE par défaut)
         :return: une instance de ldap3.Server configurée
         """
         import ldap3
@@ -283,20 +365,152 @@ class Config:
         return ldap3.Server( lc[ 'host' ] ,
                 port = int( lc.get( 'port' , 636 ) ) ,
                 use_ssl = bool( int( lc.get( 'ssl' , '1' ) ) ) ,
-                get_info = 'ALL' )
+                get_info = get_info )
 
-    def ldap_connection( self ):
+    def ldap_connection( self , server = None , **options ):
         """
         Établit la connexion au serveur LDAP, en utilisant la configuration.
 
+        Si un fichier de cache du schéma est configuré, le schéma et les
+        informations du DSE ne seront téléchargés que s'ils ont été modifiés
+        sur le serveur depuis leur mise en cache.
+
+        :param server: l'instance de ldap3.Server à utiliser; si elle n'est \
+                pas spécifiée, elle sera créée à partir de la configuration
+        :param options: des paramètres supplémentaires à transmettre à \
+                ldap3.Connection (par exemple client_strategy)
         :return: la connexion
         """
         import ldap3
-        server = self.ldap_server( )
+        cache_path = self.get( 'ldap' , 'schema-cache' )
+        use_cache = server is None and not options and cache_path is not None
+        if server is None:
+            server = self.ldap_server( 'NO_INFO' if use_cache else 'ALL' )
         Logging( 'ldap' ).info( 'Connexion au serveur LDAP: ' + str( server ) )
         lc = self.cfg_[ 'ldap' ]
-        return ldap3.Connection( self.ldap_server( ) ,
-                lc[ 'user' ] , lc[ 'pass' ] , auto_bind = True )
+        conn = ldap3.Connection( server ,
+                lc[ 'user' ] , lc[ 'pass' ] , auto_bind = True , **options )
+        if use_cache:
+            self.ldap_schema_cache_( conn , cache_path )
+        return conn
+
+    def ldap_schema_key_( self , conn ):
+        """
+        Génère la clé identifiant la version du schéma du serveur LDAP, à
+        partir de l'adresse du serveur et de la date de modification de
+        l'entrée de sous-schéma.
+
+        :param conn: la connexion LDAP
+        :return: la clé, ou None si la date de modification n'a pas pu être \
+                lue
+        """
+        import ldap3
+        def read_( dn , attribute ):
+            if not conn.search( dn , '(objectClass=*)' ,
+                    search_scope = ldap3.BASE , attributes = [ attribute ] ):
+                return None
+            value = conn.response[ 0 ][ 'attributes' ].get( attribute )
+            if isinstance( value , list ):
+                value = value[ 0 ] if value else None
+            return None if value is None else str( value )
+
+        subschema = read_( '' , 'subschemaSubentry' )
+        if subschema is None:
+            return None
+        stamp = read_( subschema , 'modifyTimestamp' )
+        if stamp is None:
+            return None
+        return '{}:{}/{}@{}'.format( conn.server.host , conn.server.port ,
+                subschema , stamp )
+
+    def ldap_schema_cache_( self , conn , cache_path ):
+        """
+        Associe au serveur d'une connexion les informations du DSE et le
+        schéma, en les lisant depuis le cache s'il correspond à la version
+        actuelle du schéma, ou depuis le serveur dans le cas contraire. Le
+        cache est alors mis à jour. Les informations sont également conservées
+        en mémoire pour les connexions suivantes.
+
+        :param conn: la connexion LDAP
+        :param str cache_path: le chemin du fichier de cache
+        """
+        import json , os , ldap3
+        from ldap3.protocol.rfc4512 import DsaInfo , SchemaInfo
+        key = self.ldap_schema_key_( conn )
+        cached = getattr( self , 'ldap_info_' , None )
+        if key is None or cached is None or cached[ 0 ] != key:
+            cached = None
+            data = None
+            if key is not None:
+                try:
+                    with open( cache_path , 'r' ) as f:
+                        data = json.load( f )
+                except FileNotFoundError:
+                    pass
+                except ( OSError , ValueError ) as e:
+                    Logging( 'ldap' ).warning(
+                            'Lecture du cache de schéma {}: {}'.format(
+                                cache_path , str( e ) ) )
+            if data is not None and data.get( 'key' ) == key:
+                Logging( 'ldap' ).debug( 'Schéma LDAP lu depuis le cache' )
+                schema = SchemaInfo.from_json( data[ 'schema' ] )
+                dsa = DsaInfo.from_json( data[ 'dsa' ] , schema = schema )
+                cached = ( key , dsa , schema )
+
+        if cached is None:
+            Logging( 'ldap' ).info( 'Téléchargement du schéma LDAP' )
+            conn.server.get_info = ldap3.ALL
+            conn.refresh_server_info( )
+            cached = ( key , conn.server.info , conn.server.schema )
+            if key is not None:
+                data = {
+                    'key' : key ,
+                    'dsa' : conn.server.info.to_json( ) ,
+                    'schema' : conn.server.schema.to_json( ) ,
+                }
+                temp_path = '{}.{}'.format( cache_path , os.getpid( ) )
+                try:
+                    with open( temp_path , 'w' ) as f:
+                        json.dump( data , f )
+                    os.replace( temp_path , cache_path )
+                except OSError as e:
+                    Logging( 'ldap' ).warning(
+                            'Écriture du cache de schéma {}: {}'.format(
+                                cache_path , str( e ) ) )
+        else:
+            conn.server.attach_schema_info( cached[ 2 ] )
+            conn.server.attach_dsa_info( cached[ 1 ] )
+        self.ldap_info_ = cached
+
+    def ldap_substring_attributes( self , names ):
+        """
+        Détermine, à partir du schéma du serveur LDAP, ceux des attributs
+        spécifiés qui disposent d'une règle de correspondance par sous-chaîne
+        (SUBSTR), éventuellement héritée d'un type d'attribut parent.
+
+        :param names: les noms des attributs LDAP à examiner
+        :return: l'ensemble des noms, en minuscules, des attributs disposant \
+                d'une telle règle; il est vide si le schéma n'a pas pu être lu
+        """
+        with self.ldap_connection( ) as conn:
+            schema = conn.server.schema
+        if schema is None:
+            Logging( 'ldap' ).warning( 'Schéma LDAP indisponible, recherches '
+                    + 'par sous-chaîne non utilisées' )
+            return set( )
+        types = schema.attribute_types
+        result = set( )
+        for name in names:
+            at = types.get( name )
+            seen = set( )
+            while at is not None and at.oid not in seen:
+                # ldap3 ne renseigne l'attribut substr que s'il est défini
+                if getattr( at , 'substr' , None ) or at.substring:
+                    result.add( name.lower( ) )
+                    break
+                seen.add( at.oid )
+                at = types.get( at.superior[ 0 ] ) if at.superior else None
+        return result
 
     def lmdb_env( self ):
         """
@@ -342,3 +556,16 @@ class Config:
             from .aliases import AliasCommands
             self.alias_commands_ = AliasCommands( self )
         return self.alias_commands_
+
+    def address_registry( self ):
+        """
+        Accède à l'instance (unique) du registre des adresses, partagée entre
+        les différentes sources de comptes. Si l'instance n'avait pas encore
+        été créée, elle le sera.
+
+        :return: le registre des adresses
+        """
+        if not hasattr( self , 'address_registry_' ):
+            from .addresses import AddressRegistry
+            self.address_registry_ = AddressRegistry( )
+        return self.address_registry_
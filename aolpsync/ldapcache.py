@@ -0,0 +1,269 @@
+from .logging import Logging
+from .utils import FatalError
+
+
+class LDAPCache:
+    """
+    Cache des comptes lus depuis l'annuaire LDAP, utilisé pour le chargement
+    incrémental. Les entrées sont stockées dans la base de données sous la forme
+    d'informations supplémentaires de type 'ldap-cache', indexées par leurs DN;
+    l'état du cache (date de la dernière modification vue, date du dernier
+    chargement complet) est stocké dans l'information 'ldap%%%state'.
+
+    Lorsque le cache est utilisé, seules les entrées modifiées depuis le
+    dernier passage sont lues depuis l'annuaire; les autres comptes sont
+    reconstruits à partir du cache. Un rechargement complet est effectué
+    périodiquement afin de prendre en compte les suppressions.
+    """
+
+    # Type d'informations supplémentaires contenant les entrées
+    DATA_TYPE = 'ldap-cache'
+    # Préfixe des clés correspondant aux entrées dans la base
+    DB_PREFIX = '{}%%%'.format( DATA_TYPE ).encode( 'utf-8' )
+    # Type et identifiant de l'état du cache
+    STATE = ( 'ldap' , 'state' )
+    # Attribut opérationnel utilisé pour détecter les modifications
+    TIMESTAMP_ATTR = 'modifyTimestamp'
+    # Format des dates généralisées LDAP
+    TIMESTAMP_FORMAT = '%Y%m%d%H%M%SZ'
+
+    @staticmethod
+    def load( cfg , query = '' ):
+        """
+        Crée une instance du cache et lit son contenu depuis la base de données
+        si le chargement incrémental est activé. Il ne peut pas l'être si un
+        filtre LDAP ou une limite sur le nombre de comptes sont utilisés.
+
+        :param Config cfg: la configuration
+        :param str query: le filtre LDAP éventuellement utilisé
+        :return: l'instance du cache, ou None si le chargement incrémental \
+                est désactivé
+        """
+        if not cfg.has_flag( 'ldap' , 'incremental' ):
+            return None
+        if query or int( cfg.get( 'ldap' , 'limit' , 0 ) ) > 0:
+            Logging( 'ldap' ).info( 'Chargement incrémental désactivé '
+                    + '(filtre ou limite)' )
+            return None
+        cache = LDAPCache( cfg )
+        cache.read_( )
+        return cache
+
+    def __init__( self , cfg ):
+        """
+        Initialise un cache vide.
+
+        :param Config cfg: la configuration
+        :raises FatalError: les paramètres du chargement incrémental sont \
+                invalides
+        """
+        self.cfg = cfg
+        try:
+            self.interval = int( cfg.get( 'ldap' , 'full-reload' , '86400' ) )
+            self.overlap = int( cfg.get( 'ldap' , 'incremental-overlap' ,
+                    '300' ) )
+            if self.interval < 0 or self.overlap < 0:
+                raise ValueError
+        except ValueError:
+            raise FatalError( 'Erreur de configuration: '
+                    + 'ldap > full-reload ou incremental-overlap invalide' )
+        self.entries = {}
+        self.updated = set( )
+        self.timestamp = None
+        self.full = True
+
+    def signature_( self ):
+        """
+        Calcule une signature des éléments de configuration affectant le contenu
+        des comptes mis en cache. Une modification de cette signature provoque
+        un rechargement complet.
+
+        :return: la signature, sous la forme d'une chaîne hexadécimale
+        """
+        import hashlib , json
+        from .account import SyncAccount
+        SyncAccount( self.cfg )
+        data = [
+            SyncAccount.ldap_attributes( ) ,
+            sorted( SyncAccount.STORAGE | SyncAccount.CREATE_ONLY ) ,
+            self.cfg.get_list( 'ldap-people-classes' ) ,
+            self.cfg.get( 'ldap' , 'people-dn' ) ,
+            self.cfg.get( 'ldap' , 'mail-domain' ) ,
+            self.cfg.get( 'ldap' , 'eppn-domain' ) ,
+            self.cfg.get( 'bss' , 'domain' ) ,
+            self.cfg.has_flag( 'bss' , 'dont-fix-domains' ) ,
+            self.cfg.get_section( 'ldap-extra-attributes' , True ) ,
+            self.cfg.get( 'ldap' , 'group-membership' , 'groups' ) ,
+            self.cfg.get( 'ldap' , 'member-of-attribute' , 'memberOf' ) ,
+            self.cfg.get( 'ldap' , 'match-rule' , '' ) ,
+            self.cfg.has_flag( 'ldap' , 'no-match-filter' ) ,
+        ]
+        return hashlib.sha1( json.dumps( data , sort_keys = True )
+                .encode( 'utf-8' ) ).hexdigest( )
+
+    def read_( self ):
+        """
+        Lit l'état et les entrées du cache depuis la base de données, puis
+        détermine si un chargement complet est nécessaire.
+        """
+        import time
+        from .utils import record_load
+        state = None
+        unreadable = False
+        state_key = '{}%%%{}'.format( *LDAPCache.STATE ).encode( 'utf-8' )
+        with self.cfg.lmdb_env( ) as db:
+            with db.begin( write = False ) as txn:
+                try:
+                    data = txn.get( state_key )
+                    if data is not None:
+                        state = record_load( data )
+                    cursor = txn.cursor( )
+                    if state is not None and cursor.set_range(
+                            LDAPCache.DB_PREFIX ):
+                        for key , value in cursor:
+                            if not key.startswith( LDAPCache.DB_PREFIX ):
+                                break
+                            dn = key[ len( LDAPCache.DB_PREFIX ): ].decode(
+                                    'utf-8' )
+                            self.entries[ dn ] = record_load( value )
+                except ValueError as e:
+                    # Enregistrements dans un format inconnu (par exemple
+                    # écrits par une version antérieure): le cache est
+                    # reconstruit.
+                    Logging( 'ldap' ).warning( 'Cache illisible: {}'.format(
+                            e ) )
+                    unreadable = True
+
+        if unreadable:
+            reason = 'cache illisible'
+        elif state is None:
+            reason = 'cache absent'
+        elif state.get( 'signature' ) != self.signature_( ):
+            reason = 'configuration modifiée'
+        elif time.time( ) - state.get( 'full' , 0 ) >= self.interval:
+            reason = 'délai dépassé'
+        elif state.get( 'timestamp' ) is None:
+            reason = 'pas de date de modification'
+        else:
+            reason = None
+
+        if reason is None:
+            self.full = False
+            self.timestamp = state[ 'timestamp' ]
+            self.last_full = state[ 'full' ]
+            Logging( 'ldap' ).info( ( 'Chargement incrémental depuis {} '
+                    + '({} entrées en cache)' ).format(
+                        self.timestamp , len( self.entries ) ) )
+        else:
+            self.entries = {}
+            Logging( 'ldap' ).info( 'Chargement complet ({})'.format( reason ) )
+
+    def query( self ):
+        """
+        Génère le filtre LDAP permettant de lire les entrées modifiées depuis le
+        dernier chargement. La date de dernière modification connue est
+        diminuée de la durée de recouvrement configurée, afin de ne pas ignorer
+        les modifications effectuées pendant le chargement précédent.
+
+        :return: le filtre LDAP
+        """
+        assert not self.full
+        from datetime import datetime , timedelta
+        since = datetime.strptime( self.timestamp , LDAPCache.TIMESTAMP_FORMAT )
+        since -= timedelta( seconds = self.overlap )
+        return '({}>={})'.format( LDAPCache.TIMESTAMP_ATTR ,
+                since.strftime( LDAPCache.TIMESTAMP_FORMAT ) )
+
+    def update( self , dn , uid , account , timestamp , member_of = None ):
+        """
+        Met à jour une entrée du cache à partir d'une entrée lue depuis
+        l'annuaire.
+
+        :param str dn: le DN de l'entrée LDAP
+        :param str uid: l'UID de l'entrée
+        :param SyncAccount account: le compte généré à partir de l'entrée, ou \
+                None si l'entrée a été ignorée
+        :param timestamp: la date de dernière modification de l'entrée, sous \
+                la forme d'un datetime ou d'une chaîne
+        :param list member_of: les DN des groupes dont l'entrée est membre, \
+                ou None si les groupes ne sont pas lus depuis les comptes
+        """
+        entry = { 'uid' : uid }
+        if account is not None:
+            entry[ 'account' ] = account.to_json_record( all_fields = True )
+        if member_of is not None:
+            entry[ 'member-of' ] = list( member_of )
+        self.entries[ dn ] = entry
+        self.updated.add( dn )
+
+        if timestamp is None:
+            return
+        from datetime import datetime , timezone
+        if isinstance( timestamp , datetime ):
+            if timestamp.tzinfo is not None:
+                timestamp = timestamp.astimezone( timezone.utc )
+            timestamp = timestamp.strftime( LDAPCache.TIMESTAMP_FORMAT )
+        else:
+            timestamp = str( timestamp )[ :14 ] + 'Z'
+        if self.timestamp is None or timestamp > self.timestamp:
+            self.timestamp = timestamp
+
+    def accounts( self ):
+        """
+        Reconstruit l'ensemble des comptes à partir du contenu du cache.
+
+        :return: un tuple contenant l'ensemble des UID, le dictionnaire des \
+                comptes indexé par EPPN et le dictionnaire associant à chaque \
+                UID les DN des groupes dont il est membre
+        """
+        from .account import SyncAccount
+        all_uids = set( )
+        accounts = {}
+        memberships = {}
+        for entry in self.entries.values( ):
+            all_uids.add( entry[ 'uid' ] )
+            if 'member-of' in entry:
+                memberships[ entry[ 'uid' ] ] = entry[ 'member-of' ]
+            if 'account' not in entry:
+                continue
+            a = SyncAccount( self.cfg ).from_json_record( entry[ 'account' ] ,
+                    all_fields = True )
+            accounts[ a.eppn ] = a
+        Logging( 'ldap' ).info( '{} entrées modifiées, {} en cache'.format(
+                len( self.updated ) , len( self.entries ) ) )
+        return ( all_uids , accounts , memberships )
+
+    def save( self ):
+        """
+        Sauvegarde les entrées modifiées et l'état du cache dans la base de
+        données. En cas de chargement complet, les entrées précédentes sont
+        supprimées. Si le drapeau de simulation est présent dans la
+        configuration, l'opération ne sera pas réellement effectuée.
+        """
+        sim = self.cfg.has_flag( 'bss' , 'simulate' )
+        mode = 'simulée ' if sim else ''
+        Logging( 'db' ).debug( 'Sauvegarde {}du cache LDAP ({} entrées)'.format(
+                mode , len( self.updated ) ) )
+        if sim: return
+
+        import time
+        from .utils import record_dump , record_format
+        fmt = record_format( self.cfg )
+        state = {
+            'timestamp' : self.timestamp ,
+            'full' : time.time( ) if self.full else self.last_full ,
+            'signature' : self.signature_( ) ,
+        }
+        state_key = '{}%%%{}'.format( *LDAPCache.STATE ).encode( 'utf-8' )
+        with self.cfg.lmdb_env( ) as db:
+            with db.begin( write = True ) as txn:
+                if self.full:
+                    cursor = txn.cursor( )
+                    if cursor.set_range( LDAPCache.DB_PREFIX ):
+                        while cursor.key( ).startswith( LDAPCache.DB_PREFIX ):
+                            if not cursor.delete( ):
+                                break
+                for dn in self.updated:
+                    txn.put( LDAPCache.DB_PREFIX + dn.encode( 'utf-8' ) ,
+                            record_dump( self.entries[ dn ] , fmt ) )
+                txn.put( state_key , record_dump( state , fmt ) )
@@ -0,0 +1,276 @@
+from .logging import Logging
+from .utils import FatalError
+
+
+class LDAPListener:
+    """
+    Surveillance des modifications de l'annuaire LDAP. Les modifications des
+    entrées de la branche des utilisateurs sont détectées, soit au moyen d'une
+    recherche persistante (mode 'psearch'), soit en interrogeant régulièrement
+    l'annuaire à propos des entrées dont l'attribut modifyTimestamp a changé
+    (mode 'poll').
+
+    Les modifications sont regroupées par lots; chaque lot est renvoyé sous la
+    forme d'un ensemble d'UID. Les suppressions d'entrées sont ignorées; elles
+    sont prises en compte lors des synchronisations complètes.
+    """
+
+    # Modes de surveillance supportés
+    MODES = ( 'psearch' , 'poll' )
+    # Format des dates généralisées LDAP
+    TIMESTAMP_FORMAT = '%Y%m%d%H%M%SZ'
+    # OID du contrôle EntryChangeNotification joint aux notifications des
+    # recherches persistantes
+    ECN_OID = '2.16.840.1.113730.3.4.7'
+    # Types de modifications du contrôle EntryChangeNotification
+    CHANGE_ADD = 1
+    CHANGE_DELETE = 2
+    CHANGE_MODIFY = 4
+    CHANGE_MODDN = 8
+    # Noms des types de modifications utilisés par ldap3 lorsqu'il décode
+    # lui-même le contrôle
+    CHANGE_NAMES = {
+        'add' : CHANGE_ADD ,
+        'delete' : CHANGE_DELETE ,
+        'modify' : CHANGE_MODIFY ,
+        'modify dn' : CHANGE_MODDN ,
+    }
+
+    def __init__( self , cfg , since = None ):
+        """
+        Initialise la surveillance à partir de la configuration.
+
+        :param Config cfg: la configuration
+        :param since: la date (UTC, sans fuseau horaire) à partir de laquelle \
+                les modifications doivent être détectées, en général celle du \
+                début du chargement complet précédent; si elle n'est pas \
+                spécifiée, la date courante est utilisée
+        :raises FatalError: les paramètres de surveillance sont invalides
+        """
+        from datetime import datetime , timezone
+        self.cfg = cfg
+        if since is None:
+            since = datetime.now( timezone.utc ).replace( tzinfo = None )
+        self.since = since
+        self.mode = cfg.get( 'ldap' , 'listen-mode' , 'psearch' )
+        if self.mode not in LDAPListener.MODES:
+            raise FatalError( 'Erreur de configuration: '
+                    + 'ldap > listen-mode invalide' )
+        try:
+            self.interval = int( cfg.get( 'ldap' , 'listen-interval' , '5' ) )
+            self.duration = int( cfg.get( 'ldap' , 'listen-duration' ,
+                    '3600' ) )
+            self.overlap = int( cfg.get( 'ldap' , 'incremental-overlap' ,
+                    '300' ) )
+            if self.interval < 1 or self.duration < 0 or self.overlap < 0:
+                raise ValueError
+        except ValueError:
+            raise FatalError( 'Erreur de configuration: ldap > listen-interval'
+                    + ', listen-duration ou incremental-overlap invalide' )
+        self.people_dn = cfg.get( 'ldap' , 'people-dn' )
+
+    def changes( self ):
+        """
+        Générateur renvoyant les lots de modifications au fur et à mesure de
+        leur détection. Il se termine lorsque la durée de surveillance
+        configurée est écoulée.
+
+        :return: un générateur d'ensembles d'UID
+        """
+        import time
+        end = time.time( ) + self.duration
+        Logging( 'ldap' ).info( ( 'Surveillance des modifications ({}) '
+                + '- {} secondes' ).format( self.mode , self.duration ) )
+        if self.mode == 'psearch':
+            source = self.psearch_( end )
+        else:
+            source = self.poll_( end )
+        for uids in source:
+            if not uids:
+                continue
+            Logging( 'ldap' ).info( '{} entrée(s) modifiée(s): {}'.format(
+                    len( uids ) , ', '.join( sorted( uids ) ) ) )
+            yield uids
+        Logging( 'ldap' ).info( 'Fin de la surveillance des modifications' )
+
+    def psearch_( self , end ):
+        """
+        Détecte les modifications au moyen d'une recherche persistante. Après
+        la réception d'une notification, les notifications suivantes sont
+        accumulées pendant le délai configuré afin de constituer un lot.
+
+        Les modifications effectuées entre la date de départ et le lancement
+        de la recherche persistante sont lues au préalable, au moyen d'une
+        unique interrogation sur l'attribut modifyTimestamp. Celle-ci est
+        effectuée après le lancement de la recherche, de sorte qu'aucune
+        modification ne soit perdue; une entrée peut alors être signalée
+        deux fois.
+
+        :param float end: la date de fin de la surveillance
+        :return: un générateur d'ensembles d'UID
+        """
+        import ldap3 , time
+        conn = self.cfg.ldap_connection( client_strategy = ldap3.ASYNC_STREAM )
+        search = conn.extend.standard.persistent_search( self.people_dn ,
+                '(objectClass=*)' , attributes = [ 'uid' ] ,
+                show_deletions = False , streaming = False )
+        try:
+            with self.cfg.ldap_connection( ) as poll_conn:
+                yield self.query_changes_( poll_conn , self.since , {} )[ 0 ]
+            while time.time( ) < end:
+                event = search.next( block = True ,
+                        timeout = max( 1 , end - time.time( ) ) )
+                uids = set( )
+                batch_end = time.time( ) + self.interval
+                while event is not None:
+                    if event.get( 'type' ) != 'searchResEntry':
+                        raise FatalError( 'Recherche persistante interrompue '
+                                + 'par le serveur: {}'.format(
+                                    event.get( 'description' ) ) )
+                    uids.update( self.event_uids_( event ) )
+                    timeout = batch_end - time.time( )
+                    if timeout <= 0:
+                        break
+                    event = search.next( block = True , timeout = timeout )
+                yield uids
+        finally:
+            search.stop( )
+
+    @staticmethod
+    def change_notification_( event ):
+        """
+        Lit le contrôle EntryChangeNotification d'une notification de
+        recherche persistante. Le contrôle est cherché dans les contrôles de la
+        notification, où sa valeur peut être décodée ou brute; lorsque ldap3
+        l'a déjà décodé, il le retire des contrôles et place son contenu
+        (type de modification sous forme de nom, DN précédent) à la racine de
+        la notification.
+
+        :param dict event: la notification
+        :return: un tuple contenant le type de modification (CHANGE_ADD, \
+                CHANGE_DELETE, CHANGE_MODIFY ou CHANGE_MODDN) et le DN \
+                précédent de l'entrée; le type vaut None si la notification \
+                n'indique pas de type, ou un type inconnu
+        """
+        control = ( event.get( 'controls' ) or {} ).get( LDAPListener.ECN_OID )
+        if control is None:
+            value = event
+        elif isinstance( control.get( 'value' ) , dict ):
+            value = control[ 'value' ]
+        else:
+            from ldap3.core.exceptions import LDAPException
+            from ldap3.protocol.rfc2849 import decode_persistent_search_control
+            from pyasn1.error import PyAsn1Error
+            try:
+                value = decode_persistent_search_control( event )
+            except ( LDAPException , PyAsn1Error ) as e:
+                Logging( 'ldap' ).warning( ( 'Notification de modification '
+                        + 'de {} illisible: {}' ).format(
+                            event.get( 'dn' ) , str( e ) ) )
+                return ( None , None )
+        change = value.get( 'changeType' )
+        if isinstance( change , str ):
+            change = LDAPListener.CHANGE_NAMES.get( change )
+        elif change is not None:
+            change = int( change )
+        previous = value.get( 'previousDN' )
+        if previous is not None:
+            previous = str( previous )
+        return ( change , previous )
+
+    def event_uids_( self , event ):
+        """
+        Extrait l'UID d'une notification de recherche persistante ou d'une
+        entrée lue lors d'une interrogation. Le type de modification est lu
+        depuis le contrôle EntryChangeNotification: les suppressions sont
+        ignorées, et les entrées renommées ou déplacées sont relues sous leur
+        nouvel UID (l'ancien compte n'est traité que lors de la
+        synchronisation complète suivante). Les notifications sans type de
+        modification sont traitées comme des modifications.
+
+        :param dict event: la notification
+        :return: la liste des UID trouvés (vide pour une suppression)
+        """
+        ( change , previous ) = LDAPListener.change_notification_( event )
+        if change == LDAPListener.CHANGE_DELETE:
+            Logging( 'ldap' ).debug( 'Suppression de {} ignorée'.format(
+                    event.get( 'dn' ) ) )
+            return [ ]
+        if change == LDAPListener.CHANGE_MODDN:
+            Logging( 'ldap' ).debug( 'Entrée {} renommée en {}'.format(
+                    previous , event.get( 'dn' ) ) )
+        uid = ( event.get( 'attributes' ) or {} ).get( 'uid' )
+        if uid is None:
+            return [ ]
+        if isinstance( uid , str ):
+            return [ uid ]
+        return list( uid )
+
+    def poll_( self , end ):
+        """
+        Détecte les modifications en interrogeant l'annuaire à intervalles
+        réguliers, à partir de la date de départ. Les entrées dont l'attribut
+        modifyTimestamp est postérieur à la dernière date vue (diminuée de la
+        durée de recouvrement) sont lues; celles dont la date n'a pas changé
+        depuis la lecture précédente sont ignorées.
+
+        :param float end: la date de fin de la surveillance
+        :return: un générateur d'ensembles d'UID
+        """
+        import time
+        from datetime import datetime , timedelta
+        since = self.since
+        seen = {}
+        with self.cfg.ldap_connection( ) as conn:
+            while time.time( ) < end:
+                time.sleep( min( self.interval ,
+                        max( 0 , end - time.time( ) ) ) )
+                ( uids , since ) = self.query_changes_( conn , since , seen )
+
+                # On oublie les entrées qui sont sorties de la fenêtre de
+                # recouvrement
+                oldest = since - timedelta( seconds = self.overlap )
+                seen = { dn : stamp for dn , stamp in seen.items( )
+                        if not isinstance( stamp , datetime )
+                            or stamp >= oldest }
+                yield uids
+
+    def query_changes_( self , conn , since , seen ):
+        """
+        Recherche les entrées dont l'attribut modifyTimestamp est postérieur à
+        une date (diminuée de la durée de recouvrement). Les entrées dont la
+        date n'a pas changé depuis une lecture précédente sont ignorées.
+
+        :param conn: la connexion LDAP
+        :param since: la dernière date vue (UTC, sans fuseau horaire)
+        :param dict seen: les dates de modification déjà vues, indexées par \
+                DN; il est mis à jour
+        :return: un tuple contenant l'ensemble des UID modifiés et la \
+                dernière date vue
+        """
+        from datetime import datetime , timedelta , timezone
+        query = '(modifyTimestamp>={})'.format( ( since
+                - timedelta( seconds = self.overlap ) ).strftime(
+                    LDAPListener.TIMESTAMP_FORMAT ) )
+        results = conn.extend.standard.paged_search( self.people_dn ,
+                query , attributes = [ 'uid' , 'modifyTimestamp' ] ,
+                generator = True )
+        uids = set( )
+        for entry in results:
+            if entry.get( 'type' ) != 'searchResEntry':
+                continue
+            attrs = entry[ 'attributes' ]
+            stamp = attrs.get( 'modifyTimestamp' )
+            if isinstance( stamp , list ):
+                stamp = stamp[ 0 ] if stamp else None
+            if isinstance( stamp , datetime ):
+                if stamp.tzinfo is not None:
+                    stamp = stamp.astimezone( timezone.utc ).replace(
+                            tzinfo = None )
+                since = max( since , stamp )
+            dn = entry[ 'dn' ]
+            if stamp is not None and seen.get( dn ) == stamp:
+                continue
+            seen[ dn ] = stamp
+            uids.update( self.event_uids_( entry ) )
+        return ( uids , since )
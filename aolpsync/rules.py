@@ -14,6 +14,35 @@ class RuleParser:
     """
     Implémentation de l'extraction des règles d'assignement de classe de
     service.
+
+    Chaque vérificateur dispose d'une méthode check(), qui évalue la règle pour
+    un compte, et d'une méthode ldap_filter(), qui tente de traduire la règle
+    en un filtre LDAP. Cette dernière reçoit un dictionnaire associant aux
+    attributs des comptes lus directement depuis l'annuaire les noms des
+    attributs LDAP correspondants, ainsi que l'ensemble (éventuellement nul)
+    des noms, en minuscules, des attributs LDAP disposant d'une règle de
+    correspondance par sous-chaîne; les opérateurs prefix et suffix ne sont
+    traduits que pour ces derniers. Elle renvoie None si la règle ne peut être
+    traduite, ou bien un tuple contenant le filtre et un booléen indiquant si
+    le filtre est exact. Un filtre non exact sélectionne un sur-ensemble des
+    entrées pour lesquelles la règle est vraie (par exemple parce que les
+    comparaisons LDAP ne sont pas sensibles à la casse).
+
+    La méthode referenced_values() renvoie l'ensemble des valeurs d'un
+    attribut auxquelles la règle fait référence, ou None si le résultat de la
+    règle peut dépendre d'autres valeurs de l'attribut (opérateur empty).
+
+    La méthode compile() génère une fonction équivalente à check(), qui
+    évalue la règle sans passer par les vérificateurs; les opérateurs logiques
+    n'évaluent que les opérandes nécessaires à la détermination du résultat.
+
+    La méthode tests() renvoie la liste des tests élémentaires effectués par la
+    règle, sous la forme de tuples contenant le nom de l'opérateur et celui de
+    l'attribut testé.
+
+    Enfin, la méthode select() évalue la règle sur un ensemble de comptes à la
+    fois: elle reçoit une instance de RuleIndex et renvoie l'ensemble des EPPN
+    des comptes pour lesquels la règle est vraie.
     """
 
     class ConstantChecker:
@@ -24,6 +53,17 @@ class RuleParser:
             self.value = ( word == 'true' )
         def check( self , account ):
             return self.value
+        def compile( self ):
+            value = self.value
+            return lambda account : value
+        def tests( self ):
+            return [ ]
+        def select( self , index ):
+            return set( index.all ) if self.value else set( )
+        def ldap_filter( self , attrs , substr = None ):
+            return None
+        def referenced_values( self , attr_name ):
+            return set( )
         def __repr__( self ):
             return 'true' if self.value else 'false'
 
@@ -42,6 +82,36 @@ class RuleParser:
             if not isinstance( val , str ):
                 return False
             return self.eq == ( val == self.value )
+        def compile( self ):
+            from operator import attrgetter
+            ( get , value ) = ( attrgetter( self.attr_name ) , self.value )
+            if self.eq:
+                def eq_( account ):
+                    val = get( account )
+                    return isinstance( val , str ) and val == value
+                return eq_
+            def ne_( account ):
+                val = get( account )
+                return isinstance( val , str ) and val != value
+            return ne_
+        def ldap_filter( self , attrs , substr = None ):
+            if self.attr_name not in attrs:
+                return None
+            if not self.eq:
+                return ( '({}=*)'.format( attrs[ self.attr_name ] ) , False )
+            from ldap3.utils.conv import escape_filter_chars
+            return ( '({}={})'.format( attrs[ self.attr_name ] ,
+                    escape_filter_chars( self.value ) ) , False )
+        def referenced_values( self , attr_name ):
+            if attr_name != self.attr_name:
+                return set( )
+            return set([ self.value ])
+        def tests( self ):
+            return [ ( 'eq' if self.eq else 'ne' , self.attr_name ) ]
+        def select( self , index ):
+            if self.eq:
+                return index.equal( self.attr_name , self.value )
+            return index.not_equal( self.attr_name , self.value )
         def __repr__( self ):
             return '({} {} {})'.format(
                     'eq' if self.eq else 'ne' ,
@@ -58,6 +128,22 @@ class RuleParser:
         def check( self , account ):
             v = getattr( account , self.attr_name )
             return v is None or not v
+        def compile( self ):
+            from operator import attrgetter
+            get = attrgetter( self.attr_name )
+            return lambda account : not get( account )
+        def ldap_filter( self , attrs , substr = None ):
+            if self.attr_name not in attrs:
+                return None
+            return ( '(!({}=*))'.format( attrs[ self.attr_name ] ) , True )
+        def referenced_values( self , attr_name ):
+            if attr_name != self.attr_name:
+                return set( )
+            return None
+        def tests( self ):
+            return [ ( 'empty' , self.attr_name ) ]
+        def select( self , index ):
+            return index.empty( self.attr_name )
         def __repr__( self ):
             return '(empty {})'.format( self.attr_name )
 
@@ -77,9 +163,154 @@ class RuleParser:
             if v is None: return False
             if isinstance( v , str ): return v == self.value
             return self.value in v
+        def compile( self ):
+            from operator import attrgetter
+            ( get , value ) = ( attrgetter( self.attr_name ) , self.value )
+            def contains_( account ):
+                v = get( account )
+                if v is None: return False
+                if isinstance( v , str ): return v == value
+                return value in v
+            return contains_
+        def ldap_filter( self , attrs , substr = None ):
+            if self.attr_name not in attrs:
+                return None
+            from ldap3.utils.conv import escape_filter_chars
+            return ( '({}={})'.format( attrs[ self.attr_name ] ,
+                    escape_filter_chars( self.value ) ) , False )
+        def referenced_values( self , attr_name ):
+            if attr_name != self.attr_name:
+                return set( )
+            return set([ self.value ])
+        def tests( self ):
+            return [ ( 'contains' , self.attr_name ) ]
+        def select( self , index ):
+            return index.contains( self.attr_name , self.value )
         def __repr__( self ):
             return '(contains {} {})'.format( self.attr_name , self.value )
 
+    class AttrValueSetChecker:
+        """
+        Vérifie si la valeur d'un attribut fait partie d'un ensemble de valeurs
+        (opérateur in), ou si un attribut de type liste ou ensemble contient au
+        moins l'une de ces valeurs (opérateur contains-any; si l'attribut est
+        une simple chaîne, il est équivalent à l'opérateur in). Les valeurs
+        sont recherchées dans un ensemble figé.
+        """
+        def __init__( self , word , attr_name , value , *values ):
+            self.word = word
+            self.attr_name = attr_name
+            self.values = frozenset( ( value , ) + values )
+            if attr_name not in SyncAccount.STORAGE:
+                raise RuleError( 'Attribut {} inexistant'.format( attr_name ) )
+            self.compiled_ = self.compile( )
+        def check( self , account ):
+            return self.compiled_( account )
+        def compile( self ):
+            from operator import attrgetter
+            ( get , values ) = ( attrgetter( self.attr_name ) , self.values )
+            if self.word == 'in':
+                def in_( account ):
+                    v = get( account )
+                    return isinstance( v , str ) and v in values
+                return in_
+            def contains_any_( account ):
+                v = get( account )
+                if v is None: return False
+                if isinstance( v , str ): return v in values
+                return not values.isdisjoint( v )
+            return contains_any_
+        def ldap_filter( self , attrs , substr = None ):
+            if self.attr_name not in attrs:
+                return None
+            from ldap3.utils.conv import escape_filter_chars
+            subs = [ '({}={})'.format( attrs[ self.attr_name ] ,
+                        escape_filter_chars( v ) )
+                    for v in sorted( self.values ) ]
+            if len( subs ) == 1:
+                return ( subs[ 0 ] , False )
+            return ( '(|{})'.format( ''.join( subs ) ) , False )
+        def referenced_values( self , attr_name ):
+            if attr_name != self.attr_name:
+                return set( )
+            return set( self.values )
+        def tests( self ):
+            return [ ( self.word , self.attr_name ) ]
+        def select( self , index ):
+            if self.word == 'in':
+                return index.equal_any( self.attr_name , self.values )
+            return index.contains_any( self.attr_name , self.values )
+        def __repr__( self ):
+            return '({} {} {})'.format( self.word , self.attr_name ,
+                    ' '.join( sorted( self.values ) ) )
+
+    class AttrPatternChecker:
+        """
+        Vérifie si la valeur d'un attribut commence par une chaîne (opérateur
+        prefix), se termine par une chaîne (opérateur suffix) ou contient une
+        expression régulière (opérateur match). L'expression régulière est
+        compilée lors de la lecture de la règle. Pour un attribut de type liste
+        ou ensemble, la règle est vraie si au moins l'un des éléments vérifie
+        la condition.
+        """
+        def __init__( self , word , attr_name , value ):
+            self.word = word
+            self.attr_name = attr_name
+            self.value = value
+            if attr_name not in SyncAccount.STORAGE:
+                raise RuleError( 'Attribut {} inexistant'.format( attr_name ) )
+            if word == 'prefix':
+                self.test = lambda v : v.startswith( value )
+            elif word == 'suffix':
+                self.test = lambda v : v.endswith( value )
+            else: # word == 'match'
+                import re
+                try:
+                    self.test = re.compile( value ).search
+                except re.error as e:
+                    raise RuleError( 'Expression régulière {} invalide: {}'
+                            .format( value , str( e ) ) )
+            self.compiled_ = self.compile( )
+        def check( self , account ):
+            return self.compiled_( account )
+        def compile( self ):
+            from operator import attrgetter
+            ( get , test ) = ( attrgetter( self.attr_name ) , self.test )
+            def pattern_( account ):
+                v = get( account )
+                if v is None: return False
+                if isinstance( v , str ): return bool( test( v ) )
+                for item in v:
+                    if isinstance( item , str ) and test( item ):
+                        return True
+                return False
+            return pattern_
+        def ldap_filter( self , attrs , substr = None ):
+            # Sans règle de correspondance par sous-chaîne, le serveur
+            # évaluerait le filtre comme indéfini et éliminerait des entrées
+            # pour lesquelles la règle est vraie.
+            if self.word == 'match' or self.attr_name not in attrs:
+                return None
+            if substr is None or attrs[ self.attr_name ].lower( ) not in substr:
+                return None
+            from ldap3.utils.conv import escape_filter_chars
+            fmt = '({}={}*)' if self.word == 'prefix' else '({}=*{})'
+            return ( fmt.format( attrs[ self.attr_name ] ,
+                    escape_filter_chars( self.value ) ) , False )
+        def referenced_values( self , attr_name ):
+            if attr_name != self.attr_name:
+                return set( )
+            return None
+        def tests( self ):
+            return [ ( self.word , self.attr_name ) ]
+        def select( self , index ):
+            test = self.test
+            return index.matching( self.attr_name ,
+                    lambda v : isinstance( v , str ) and bool( test( v ) ) )
+        def __repr__( self ):
+            return '({} {} {})'.format( self.word , self.attr_name ,
+                    self.value )
+
     class LogicalNotChecker:
         """
         Inversion d'une condition
@@ -88,26 +319,120 @@ class RuleParser:
             self.rule = rule
         def check( self , account ):
             return not self.rule.check( account )
+        def compile( self ):
+            sub = self.rule.compile( )
+            return lambda account : not sub( account )
+        def ldap_filter( self , attrs , substr = None ):
+            # Seul l'inverse d'un filtre exact est un sur-ensemble valable
+            sub = self.rule.ldap_filter( attrs , substr )
+            if sub is None or not sub[ 1 ]:
+                return None
+            return ( '(!{})'.format( sub[ 0 ] ) , True )
+        def referenced_values( self , attr_name ):
+            return self.rule.referenced_values( attr_name )
+        def tests( self ):
+            return self.rule.tests( )
+        def select( self , index ):
+            return index.all - self.rule.select( index )
         def __repr__( self ):
             return '(not {})'.format( repr( self.rule ) )
 
     class LogicalBinaryChecker:
         """
-        Opération logique binaire (opérateurs and, or et xor)
+        Opération logique binaire (opérateurs and, or et xor). L'opérateur xor
+        est vrai si exactement un de ses opérandes est vrai.
         """
         def __init__( self , word , rule1 , rule2 , *rules ):
             self.word = word
-            if word == 'and':
-                self.check_op = lambda r : False not in r
-            elif word == 'or':
-                self.check_op = lambda r : True in r
-            else: # word == 'xor'
-                self.check_op = lambda r : 1 == len([
-                        x for x in r if r ])
             self.rules = ( rule1 , rule2 ) + rules
         def check( self , account ):
-            checks = [ r.check( account ) for r in self.rules ]
-            return self.check_op( checks )
+            if self.word == 'and':
+                return all( r.check( account ) for r in self.rules )
+            if self.word == 'or':
+                return any( r.check( account ) for r in self.rules )
+            found = False
+            for r in self.rules:
+                if r.check( account ):
+                    if found:
+                        return False
+                    found = True
+            return found
+        def compile( self ):
+            subs = tuple( r.compile( ) for r in self.rules )
+            if self.word == 'xor':
+                def xor_( account ):
+                    found = False
+                    for sub in subs:
+                        if sub( account ):
+                            if found:
+                                return False
+                            found = True
+                    return found
+                return xor_
+            # Les opérateurs à deux opérandes, les plus fréquents, sont
+            # traités séparément afin d'éviter la boucle.
+            if len( subs ) == 2:
+                ( s1 , s2 ) = subs
+                if self.word == 'and':
+                    return lambda account : s1( account ) and s2( account )
+                return lambda account : s1( account ) or s2( account )
+            if self.word == 'and':
+                def and_( account ):
+                    for sub in subs:
+                        if not sub( account ):
+                            return False
+                    return True
+                return and_
+            def or_( account ):
+                for sub in subs:
+                    if sub( account ):
+                        return True
+                return False
+            return or_
+        def ldap_filter( self , attrs , substr = None ):
+            if self.word == 'xor':
+                return None
+            subs = [ r.ldap_filter( attrs , substr )
+                    for r in self.rules ]
+            # Pour un 'et', les opérandes non traduisibles peuvent être
+            # ignorés; pour un 'ou', ils doivent tous être traduits.
+            found = [ f for f in subs if f is not None ]
+            if not found or ( self.word == 'or' and len( found ) < len( subs ) ):
+                return None
+            exact = len( found ) == len( subs ) and all( f[ 1 ] for f in found )
+            if len( found ) == 1:
+                return ( found[ 0 ][ 0 ] , exact )
+            return ( '({}{})'.format( '&' if self.word == 'and' else '|' ,
+                    ''.join( f[ 0 ] for f in found ) ) , exact )
+        def referenced_values( self , attr_name ):
+            values = set( )
+            for r in self.rules:
+                sub = r.referenced_values( attr_name )
+                if sub is None:
+                    return None
+                values.update( sub )
+            return values
+        def tests( self ):
+            return [ t for r in self.rules for t in r.tests( ) ]
+        def select( self , index ):
+            result = self.rules[ 0 ].select( index )
+            if self.word == 'and':
+                for r in self.rules[ 1: ]:
+                    if not result:
+                        break
+                    result &= r.select( index )
+            elif self.word == 'or':
+                for r in self.rules[ 1: ]:
+                    result |= r.select( index )
+            else:
+                # xor: comptes sélectionnés par exactement un opérande
+                many = set( )
+                for r in self.rules[ 1: ]:
+                    sub = r.select( index )
+                    many |= result & sub
+                    result |= sub
+                    result -= many
+            return result
         def __repr__( self ):
             return '({} {})'.format( self.word ,
                     ' '.join([ repr( r ) for r in self.rules ] ) )
@@ -124,6 +449,11 @@ class RuleParser:
         'ne' : ( AttrValueChecker , 'WW' ) ,
         'empty' : ( AttrNoneChecker , 'W' ) ,
         'contains' : ( AttrContainsChecker , 'WW' ) ,
+        'in' : ( AttrValueSetChecker , 'WW+' ) ,
+        'contains-any' : ( AttrValueSetChecker , 'WW+' ) ,
+        'prefix' : ( AttrPatternChecker , 'WW' ) ,
+        'suffix' : ( AttrPatternChecker , 'WW' ) ,
+        'match' : ( AttrPatternChecker , 'WW' ) ,
         'not' : ( LogicalNotChecker , 'R' ) ,
         'and' : ( LogicalBinaryChecker , 'RR+' ) ,
         'or' : ( LogicalBinaryChecker , 'RR+' ) ,
@@ -192,6 +522,11 @@ class RuleParser:
                 check = self.rdp_( check )
             args.append( check )
             pos = pos + 1
+        required = len( pattern.rstrip( '+' ) )
+        if len( args ) < required:
+            raise parse_error_(
+                    'opérateur {}: au moins {} opérande(s) attendue(s)'
+                        .format( ast[ 0 ] , required ) )
         return cls( ast[ 0 ] , *args )
 
     def read_ast_( self ):
@@ -232,10 +567,10 @@ class RuleParser:
                     state = 2
                 elif not char.isspace( ):
                     raise rule_error_( 'nom attendu' )
-            # État 2: on attend des caractères alpha, du blanc, ou une
-            # parenthèse.
+            # État 2: on attend des caractères alphanumériques (ou '_', '-',
+            # '.' et '@'), du blanc, ou une parenthèse.
             elif state == 2:
-                if char.isalnum( ) or char in '_-':
+                if char.isalnum( ) or char in '_-.@':
                     accum += char
                     continue
                 stack[ -1 ].append( accum )
@@ -258,7 +593,7 @@ class RuleParser:
             elif state == 3:
                 if char.isspace( ):
                     continue
-                if char.isalpha( ):
+                if char.isalnum( ):
                     state = 2
                     accum = char
                 elif char == '"':
@@ -272,7 +607,8 @@ class RuleParser:
                     stack.append( stack[ -1 ][ -1 ] )
                     state = 1
                 else:
-                    raise rule_error_( 'lettre, \'"\' ou parenthèse attendu' )
+                    raise rule_error_( 'caractère alphanumérique, \'"\' ou '
+                            + 'parenthèse attendu' )
             # État 4: on est dans une chaîne de caractères délimitée
             elif state == 4:
                 if char == '"':
@@ -299,22 +635,441 @@ class RuleParser:
 
 #-------------------------------------------------------------------------------
 
+class RuleIndex:
+    """
+    Index inversés permettant l'évaluation des règles sur un ensemble de comptes
+    à la fois. Pour chaque attribut testé, l'index associe à chaque valeur
+    simple l'ensemble des EPPN des comptes ayant cette valeur, et à chaque
+    élément des valeurs multiples (ensembles ou listes) l'ensemble des EPPN des
+    comptes dont la valeur contient cet élément. Les index sont générés à la
+    demande à partir des colonnes d'une table de comptes.
+
+    Les ensembles renvoyés par les méthodes de l'index sont des copies, qui
+    peuvent être modifiées par l'appelant; l'ensemble de tous les EPPN (attribut
+    all) ne doit en revanche pas l'être.
+    """
+
+    def __init__( self , table ):
+        """
+        Initialise l'index.
+
+        :param AccountTable table: la table des comptes; elle doit contenir \
+                les colonnes des attributs testés par les règles évaluées
+        """
+        self.table = table
+        self.all = set( table.eppns )
+        self.indexes_ = {}
+
+    def column_( self , attr_name ):
+        """
+        :return: un itérateur sur les tuples (EPPN, valeur) d'un attribut
+        """
+        return zip( self.table.eppns , self.table.column( attr_name ) )
+
+    def values_( self , attr_name ):
+        """
+        Génère ou renvoie les index d'un attribut. Les valeurs simples et les
+        éléments des valeurs multiples sont indexés lors d'un même parcours
+        de la colonne; les comptes ayant la même valeur multiple (par exemple
+        le même ensemble de groupes) ne sont traités qu'une fois.
+
+        :param str attr_name: le nom de l'attribut
+        :return: un tuple contenant le dictionnaire associant à chaque valeur \
+                simple l'ensemble des comptes correspondants, l'ensemble des \
+                comptes ayant une valeur simple, et le dictionnaire associant \
+                à chaque élément des valeurs multiples l'ensemble des comptes \
+                dont la valeur le contient
+        """
+        indexes = self.indexes_.get( attr_name )
+        if indexes is None:
+            scalars = {}
+            multiple = {}
+            for eppn , value in self.column_( attr_name ):
+                if type( value ) is str:
+                    eppns = scalars.get( value )
+                    if eppns is None:
+                        scalars[ value ] = set([ eppn ])
+                    else:
+                        eppns.add( eppn )
+                elif value:
+                    multiple.setdefault( frozenset( value ) , [ ] ).append(
+                            eppn )
+            members = {}
+            for value , eppns in multiple.items( ):
+                for item in value:
+                    if item in members:
+                        members[ item ].update( eppns )
+                    else:
+                        members[ item ] = set( eppns )
+            strings = set( ).union( *scalars.values( ) )
+            indexes = self.indexes_[ attr_name ] = ( scalars , strings ,
+                    members )
+        return indexes
+
+    def scalars_( self , attr_name ):
+        """
+        :return: un tuple contenant le dictionnaire associant à chaque valeur \
+                simple d'un attribut l'ensemble des comptes correspondants, \
+                et l'ensemble des comptes ayant une valeur simple
+        """
+        return self.values_( attr_name )[ :2 ]
+
+    def members_( self , attr_name ):
+        """
+        :return: le dictionnaire associant à chaque élément des valeurs \
+                multiples d'un attribut l'ensemble des comptes dont la valeur \
+                le contient
+        """
+        return self.values_( attr_name )[ 2 ]
+
+    def equal( self , attr_name , value ):
+        """
+        :return: l'ensemble des comptes dont l'attribut est une valeur simple \
+                égale à la valeur spécifiée
+        """
+        return set( self.scalars_( attr_name )[ 0 ].get( value , ( ) ) )
+
+    def not_equal( self , attr_name , value ):
+        """
+        :return: l'ensemble des comptes dont l'attribut est une valeur simple \
+                différente de la valeur spécifiée
+        """
+        ( scalars , strings ) = self.scalars_( attr_name )
+        return strings - scalars.get( value , set( ) )
+
+    def empty( self , attr_name ):
+        """
+        :return: l'ensemble des comptes pour lesquels l'attribut est vide
+        """
+        key = ( 'empty' , attr_name )
+        if key not in self.indexes_:
+            self.indexes_[ key ] = set([ eppn
+                    for eppn , value in self.column_( attr_name )
+                    if not value ])
+        return set( self.indexes_[ key ] )
+
+    def equal_any( self , attr_name , values ):
+        """
+        :return: l'ensemble des comptes dont l'attribut est une valeur simple \
+                faisant partie des valeurs spécifiées
+        """
+        scalars = self.scalars_( attr_name )[ 0 ]
+        return set( ).union( *( scalars[ v ] for v in values if v in scalars ) )
+
+    def contains_any( self , attr_name , values ):
+        """
+        :return: l'ensemble des comptes dont l'attribut est égal à l'une des \
+                valeurs spécifiées ou contient l'une d'entre elles
+        """
+        scalars = self.scalars_( attr_name )[ 0 ]
+        members = self.members_( attr_name )
+        return set( ).union(
+                *( scalars[ v ] for v in values if v in scalars ) ,
+                *( members[ v ] for v in values if v in members ) )
+
+    def matching( self , attr_name , predicate ):
+        """
+        Sélectionne les comptes en appliquant un prédicat à chaque valeur
+        distincte d'un attribut (ou élément distinct, pour les valeurs
+        multiples).
+
+        :param str attr_name: le nom de l'attribut
+        :param predicate: une fonction recevant une valeur et renvoyant un \
+                booléen
+        :return: l'ensemble des comptes dont l'attribut est une valeur \
+                vérifiant le prédicat ou contient une telle valeur
+        """
+        scalars = self.scalars_( attr_name )[ 0 ]
+        members = self.members_( attr_name )
+        return set( ).union(
+                *( eppns for v , eppns in scalars.items( ) if predicate( v ) ) ,
+                *( eppns for v , eppns in members.items( ) if predicate( v ) ) )
+
+    def contains( self , attr_name , value ):
+        """
+        :return: l'ensemble des comptes dont l'attribut est égal à la valeur \
+                spécifiée ou la contient
+        """
+        empty = set( )
+        return ( self.scalars_( attr_name )[ 0 ].get( value , empty )
+                | self.members_( attr_name ).get( value , empty ) )
+
+#-------------------------------------------------------------------------------
+
+class RuleProfiler:
+    """
+    Mesure de l'évaluation des règles. Chaque nœud de l'arbre d'une règle est
+    instrumenté afin de compter ses évaluations, ses résultats vrais et le
+    temps cumulé passé à l'évaluer (y compris ses opérandes), que la règle soit
+    évaluée compte par compte ou sur un ensemble de comptes à la fois. Un
+    rapport trié par temps cumulé peut ensuite être écrit dans le journal.
+    """
+
+    def __init__( self ):
+        # Statistiques indexées par nom de règle et position du nœud; chaque
+        # entrée est une liste contenant l'expression, le nombre
+        # d'évaluations, le nombre de résultats vrais et le temps cumulé.
+        self.stats_ = {}
+
+    def instrument( self , name , tree ):
+        """
+        Instrumente l'arbre d'une règle. Les méthodes compile() et select() de
+        chaque nœud sont remplacées par des versions mesurant l'évaluation;
+        les fonctions compilées à partir de l'arbre après l'appel à cette
+        méthode sont donc instrumentées.
+
+        :param str name: le nom de la règle
+        :param tree: la racine de l'arbre de vérificateurs
+        """
+        nodes = [ ( '0' , tree ) ]
+        while nodes:
+            ( path , node ) = nodes.pop( )
+            if hasattr( node , 'rules' ):
+                nodes.extend( ( '{}.{}'.format( path , i ) , r )
+                        for i , r in enumerate( node.rules ) )
+            elif hasattr( node , 'rule' ):
+                nodes.append( ( path + '.0' , node.rule ) )
+            # Les instances successives d'une même règle partagent leurs
+            # statistiques
+            stats = self.stats_.setdefault( ( name , path ) ,
+                    [ repr( node ) , 0 , 0 , 0.0 ] )
+            node.compile = self.compile_( node.compile , stats )
+            node.select = self.select_( node.select , stats )
+
+    @staticmethod
+    def compile_( compile , stats ):
+        """
+        Génère une version instrumentée de la méthode compile() d'un nœud.
+
+        :param compile: la méthode d'origine
+        :param list stats: les statistiques du nœud
+        :return: la méthode instrumentée
+        """
+        from time import perf_counter
+        def profiled_compile_( ):
+            evaluate = compile( )
+            def profiled_( account ):
+                start = perf_counter( )
+                result = evaluate( account )
+                stats[ 3 ] += perf_counter( ) - start
+                stats[ 1 ] += 1
+                if result:
+                    stats[ 2 ] += 1
+                return result
+            return profiled_
+        return profiled_compile_
+
+    @staticmethod
+    def select_( select , stats ):
+        """
+        Génère une version instrumentée de la méthode select() d'un nœud. Les
+        comptes de l'index sont comptabilisés comme autant d'évaluations.
+
+        :param select: la méthode d'origine
+        :param list stats: les statistiques du nœud
+        :return: la méthode instrumentée
+        """
+        from time import perf_counter
+        def profiled_select_( index ):
+            start = perf_counter( )
+            result = select( index )
+            stats[ 3 ] += perf_counter( ) - start
+            stats[ 1 ] += len( index.all )
+            stats[ 2 ] += len( result )
+            return result
+        return profiled_select_
+
+    def report( self ):
+        """
+        Écrit dans le journal les statistiques de chaque nœud évalué au moins
+        une fois, triées par temps cumulé décroissant.
+        """
+        entries = sorted( ( ( stats[ 3 ] , name , path , stats )
+                    for ( name , path ) , stats in self.stats_.items( )
+                    if stats[ 1 ] ) ,
+                key = lambda e : -e[ 0 ] )
+        Logging( 'cfg' ).info( 'Profil des règles: {} nœud(s) évalué(s)'
+                .format( len( entries ) ) )
+        for ( total , name , path , stats ) in entries:
+            ( expr , count , true ) = stats[ :3 ]
+            Logging( 'cfg' ).info( ( '{} [{}] {:.6f}s, {} évaluation(s), '
+                    + '{:.1%} de résultats vrais, {:.3f}µs/évaluation: {}' )
+                    .format( name , path , total , count , true / count ,
+                        1e6 * total / count , expr ) )
+
+#-------------------------------------------------------------------------------
+
 class Rule:
     """
     Règle utilisable pour déterminer les classes de services associées aux
-    comptes.
+    comptes, ou pour sélectionner des comptes.
+
+    La règle est lue sous la forme d'un arbre de vérificateurs, qui est ensuite
+    compilé en une fonction unique; celle-ci est accessible via l'attribut
+    check de l'instance, et reçoit le compte à vérifier en paramètre.
+
+    Les résultats de la règle peuvent être mémorisés en fonction des valeurs
+    des attributs qu'elle lit, les ensembles étant remplacés par des ensembles
+    figés. Générer la clé du cache a un coût; le cache n'est donc utilisé que
+    si la règle effectue suffisamment de tests élémentaires. Le nombre de
+    résultats mémorisés est limité; la taille du cache peut être configurée
+    via l'option cache-size de la section rules (0 désactive le cache).
+
+    Si le profilage des règles est activé (drapeau profile de la section
+    rules), l'arbre de la règle est instrumenté (voir RuleProfiler) et le
+    cache n'est pas utilisé.
     """
 
-    def __new__( cls , name , rule ):
+    # Taille par défaut du cache des résultats
+    CACHE_SIZE = 1024
+    # Coût estimé de la génération de la clé du cache, exprimé en nombre de
+    # tests élémentaires: coût d'un attribut simple, d'un attribut multivalué
+    # (testé via contains ou contains-any) et de chaque attribut supplémentaire.
+    # Le cache est utilisé si la règle effectue au moins trois fois plus de
+    # tests que ce coût.
+    KEY_COSTS = ( 1 , 4 , 2 )
+
+    def __init__( self , name , rule , cfg = None ):
         """
-        Crée une règle, sous la forme d'un objet implémentant une méthode
-        check(), à partir d'une chaîne de caractères.
+        Lit et compile une règle à partir d'une chaîne de caractères.
 
         :param str name: le nom de la règle
         :param str rule: le texte de la règle
-        :return: la règle 'compilée'
+        :param Config cfg: la configuration, utilisée pour lire la taille du \
+                cache et activer le profilage; si elle n'est pas spécifiée, \
+                la taille par défaut est utilisée et la règle n'est pas \
+                profilée
+        :raises RuleError: la règle est incorrecte
+        :raises FatalError: la taille du cache configurée est invalide
         """
-        parsed = RuleParser( name , rule ).out
+        self.name = name
+        self.text = rule
+        self.tree = RuleParser( name , rule ).out
+        tests = self.tree.tests( )
+        self.attributes = tuple( sorted( set( a for _ , a in tests ) ) )
+        profiler = None if cfg is None else cfg.rule_profiler( )
+        if profiler is not None:
+            profiler.instrument( name , self.tree )
+        self.evaluate = self.tree.compile( )
+        if profiler is not None:
+            cache_size = 0
+        elif cfg is None:
+            cache_size = Rule.CACHE_SIZE
+        else:
+            cache_size = cfg.rule_cache_size( )
+        if cache_size and self.attributes and self.worth_caching_( tests ):
+            self.check = self.memoize_( cache_size )
+        else:
+            self.check = self.evaluate
+            self.cached_ = None
         Logging( 'cfg' ).debug( 'Régle {} lue: {}'.format(
-                name , repr( parsed ) ) )
-        return parsed
+                name , repr( self.tree ) ) )
+
+    def worth_caching_( self , tests ):
+        """
+        Détermine si l'utilisation du cache est susceptible d'accélérer
+        l'évaluation de la règle, en comparant le nombre de tests élémentaires
+        au coût estimé de la génération de la clé.
+
+        :param list tests: la liste des tests élémentaires de la règle
+        :return: True si le cache doit être utilisé
+        """
+        ( simple , multi , extra ) = Rule.KEY_COSTS
+        multivalued = set( a for op , a in tests
+                if op in ( 'contains' , 'contains-any' ) )
+        cost = sum( multi if a in multivalued else simple
+                for a in self.attributes )
+        cost += extra * ( len( self.attributes ) - 1 )
+        return len( tests ) >= 3 * cost
+
+    def memoize_( self , cache_size ):
+        """
+        Génère une fonction de vérification utilisant un cache des résultats,
+        indexé par les valeurs des attributs lus par la règle. Si ces valeurs
+        ne peuvent être utilisées comme clé, la règle est évaluée directement.
+
+        :param int cache_size: le nombre maximal de résultats mémorisés
+        :return: la fonction de vérification
+        """
+        from functools import lru_cache
+        from operator import attrgetter
+        from types import SimpleNamespace
+        ( attrs , evaluate ) = ( self.attributes , self.evaluate )
+
+        get = attrgetter( *attrs )
+        if len( attrs ) == 1:
+            # Un seul attribut: sa valeur est utilisée directement comme clé
+            attr = attrs[ 0 ]
+            @lru_cache( maxsize = cache_size )
+            def cached_( value ):
+                return evaluate( SimpleNamespace( **{ attr : value } ) )
+            def check_( account ):
+                v = get( account )
+                if isinstance( v , ( set , list ) ):
+                    v = frozenset( v )
+                try:
+                    return cached_( v )
+                except TypeError:
+                    return evaluate( account )
+        else:
+            @lru_cache( maxsize = cache_size )
+            def cached_( key ):
+                values = dict( zip( attrs , key ) )
+                return evaluate( SimpleNamespace( **values ) )
+            def check_( account ):
+                key = tuple([ frozenset( v ) if isinstance( v , ( set , list ) )
+                        else v for v in get( account ) ])
+                try:
+                    return cached_( key )
+                except TypeError:
+                    return evaluate( account )
+        self.cached_ = cached_
+        return check_
+
+    def cache_stats( self ):
+        """
+        :return: un tuple contenant le nombre de résultats lus depuis le \
+                cache et le nombre de résultats calculés, ou None si le \
+                cache n'est pas utilisé
+        """
+        if self.cached_ is None:
+            return None
+        info = self.cached_.cache_info( )
+        return ( info.hits , info.misses )
+
+    def select( self , index ):
+        """
+        Évalue la règle sur l'ensemble des comptes d'un index.
+
+        :param RuleIndex index: l'index des comptes
+        :return: l'ensemble des EPPN des comptes pour lesquels la règle est \
+                vraie
+        """
+        return self.tree.select( index )
+
+    def ldap_filter( self , attrs , substr = None ):
+        """
+        Tente de traduire la règle en un filtre LDAP (voir RuleParser).
+
+        :param dict attrs: le dictionnaire associant aux attributs des \
+                comptes les noms des attributs LDAP correspondants
+        :param substr: l'ensemble des noms (en minuscules) des attributs LDAP \
+                qui disposent d'une règle de correspondance par sous-chaîne, \
+                ou None si aucun attribut n'est connu comme tel
+        :return: None si la règle ne peut être traduite, ou un tuple \
+                contenant le filtre et un booléen indiquant s'il est exact
+        """
+        return self.tree.ldap_filter( attrs , substr )
+
+    def referenced_values( self , attr_name ):
+        """
+        Liste les valeurs d'un attribut auxquelles la règle fait référence.
+
+        :param str attr_name: le nom de l'attribut
+        :return: l'ensemble des valeurs, ou None si le résultat de la règle \
+                peut dépendre d'autres valeurs de l'attribut
+        """
+        return self.tree.referenced_values( attr_name )
+
+    def __repr__( self ):
+        return repr( self.tree )
@@ -1,6 +1,8 @@
 from .aliases import AliasesMap
 from .configuration import Config , CfgOverride
-from .account import SyncAccount , LDAPData
+from .account import SyncAccount , SyncAccountView , LDAPData
+from .ldapcache import LDAPCache
+from .snapshot import LDAPSnapshot
 from .logging import Logging
 from .rules import Rule , RuleError
 from .utils import BSSAction , FatalError
@@ -12,6 +14,16 @@ class ProcessSkeleton:
     certain nombre de méthodes communes.
     """
 
+    # Les comptes LDAP peuvent-ils être lus depuis l'instantané écrit par le
+    # script de synchronisation? Doit être surchargé par les outils de
+    # diagnostic.
+    LDAP_SNAPSHOT = False
+
+    # Les comptes de la base de données doivent-ils être lus sous la forme de
+    # vues paresseuses (SyncAccountView)? Peut être activé par les scripts qui
+    # n'utilisent que quelques champs des comptes.
+    LAZY_DB = False
+
     def parse_arguments( self ):
         """
         Configure le lecteur d'arguments puis l'exécute. Les valeurs lues seront
@@ -33,7 +45,13 @@ class ProcessSkeleton:
         ajouté;
 
         * un argument '-U' permettant de supprimer un drapeau ou une option de
-        configuration est ajouté.
+        configuration est ajouté;
+
+        * un argument '--profile-rules' permettant d'activer le profilage des
+        règles (équivalent à '-D rules profile') est ajouté;
+
+        * si la classe l'autorise, un argument '--ldap-snapshot' permettant
+        d'utiliser l'instantané des comptes LDAP est ajouté.
 
         D'autres arguments peuvent être ajoutés en surchargeant la méthode
         cli_register_arguments().
@@ -62,6 +80,16 @@ class ProcessSkeleton:
                 action = 'append' , nargs = 2 ,
                 metavar = ( 'section' , 'name' ) ,
                 help = 'Supprime une option ou un drapeau de configuration.' )
+        cfg_group.add_argument( '--profile-rules' ,
+                action = 'store_true' ,
+                help = '''Mesure l'évaluation des règles et écrit un rapport
+                          dans le journal à la fin de l'exécution.''' )
+        if self.LDAP_SNAPSHOT:
+            parser.add_argument( '--ldap-snapshot' ,
+                    action = 'store_true' ,
+                    help = '''Lit les comptes depuis l'instantané écrit lors de
+                              la dernière synchronisation plutôt que depuis
+                              l'annuaire.''' )
 
         self.cli_register_arguments( parser )
         self.arguments = parser.parse_args( )
@@ -96,7 +124,7 @@ class ProcessSkeleton:
     def get_cfg_overrides( self ):
         """
         Génère une liste d'objets représentant des surcharges de configuration à
-        partir des arguments -S/-U/-D du programme.
+        partir des arguments -S/-U/-D et --profile-rules du programme.
 
         :raises FatalError: si plusieurs arguments font référence à la même \
                 option
@@ -113,6 +141,10 @@ class ProcessSkeleton:
         if self.arguments.cfg_undefine:
             for co_undef in self.arguments.cfg_undefine:
                 col.append( CfgOverride( *co_undef , undef = True ) )
+        profile = CfgOverride( 'rules' , 'profile' )
+        if ( self.arguments.profile_rules
+                and profile.key not in [ co.key for co in col ] ):
+            col.append( profile )
         cod = {}
         for co in col:
             if co.key in cod:
@@ -153,12 +185,42 @@ class ProcessSkeleton:
         """
         try:
             return Rule( 'account selection' ,
-                    self.cfg.get( 'ldap' , 'match-rule' , '(true)' ) )
+                    self.cfg.get( 'ldap' , 'match-rule' , '(true)' ) ,
+                    self.cfg )
         except RuleError as e:
             Logging( 'cfg' ).critical( str( e ) )
             raise FatalError( 'Erreur dans la règle de sélection des comptes' )
 
-    def load_from_ldap( self ):
+    def get_match_filter_( self , match_rule ):
+        """
+        Tente de traduire la règle de filtrage des comptes en un filtre LDAP
+        sélectionnant un sur-ensemble des comptes acceptés, sauf si le drapeau
+        'no-match-filter' est présent dans la configuration. Si la règle
+        utilise les opérateurs prefix ou suffix, le schéma de l'annuaire est
+        consulté afin de déterminer si les attributs concernés supportent la
+        recherche par sous-chaîne.
+
+        :param match_rule: la règle de filtrage
+        :return: le filtre LDAP, ou None si la règle ne peut être traduite
+        """
+        if self.cfg.has_flag( 'ldap' , 'no-match-filter' ):
+            return None
+        SyncAccount( self.cfg )
+        attrs = SyncAccount.ldap_sources( )
+        names = set([ attrs[ a ] for op , a in match_rule.tree.tests( )
+                if op in ( 'prefix' , 'suffix' ) and a in attrs ])
+        substr = None
+        if names:
+            substr = self.cfg.ldap_substring_attributes( names )
+        result = match_rule.ldap_filter( attrs , substr )
+        if result is None:
+            Logging( 'ldap' ).debug( 'Règle de sélection non traduisible' )
+            return None
+        Logging( 'ldap' ).debug( 'Règle de sélection traduite: {} ({})'.format(
+                result[ 0 ] , 'exacte' if result[ 1 ] else 'approchée' ) )
+        return result[ 0 ]
+
+    def load_from_ldap( self , groups = None ):
         """
         Charge les données depuis le serveur LDAP. Les comptes et groupes
         seront chargés, puis la liste des aliases sera établie. Les comptes ne
@@ -169,15 +231,48 @@ class ProcessSkeleton:
 
         Il est possible de limiter les entrées lues depuis l'annuaire ldap en
         écrivant un filtre dans self.ldap_query pendant la préinitialisation.
+
+        Si le chargement incrémental est activé, seules les entrées modifiées
+        depuis le chargement précédent seront lues; le cache sera ensuite mis
+        à jour.
+
+        Les groupes lus sont conservés dans self.ldap_groups. L'ensemble des
+        comptes lus, y compris ceux qui ne sont pas sélectionnés par la règle,
+        est conservé dans self.ldap_data, et les aliases dans
+        self.ldap_aliases; ils sont utilisés par reload_from_ldap().
+
+        Si la classe l'autorise, les comptes peuvent être lus depuis
+        l'instantané écrit par le script de synchronisation (voir
+        load_ldap_snapshot_()); les groupes ne sont alors pas disponibles.
+
+        :param dict groups: les groupes à utiliser, s'ils ont déjà été lus \
+                lors d'un chargement précédent, ou None pour les lire
         """
-        ldap_data = LDAPData( self.cfg , self.ldap_query )
+        if self.LDAP_SNAPSHOT:
+            accounts = self.load_ldap_snapshot_( )
+            if accounts is not None:
+                self.ldap_accounts = accounts
+                self.ldap_groups = None
+                self.ldap_data = None
+                self.ldap_aliases = None
+                return
+
+        match_rule = self.get_match_rule( )
+        cache = LDAPCache.load( self.cfg , self.ldap_query )
+        ldap_data = LDAPData( self.cfg , self.ldap_query , cache , groups ,
+                self.get_match_filter_( match_rule ) )
+        if cache is not None:
+            cache.save( )
+        self.ldap_groups = ldap_data.groups
         aliases = AliasesMap( self.cfg , ldap_data.accounts )
         ldap_data.set_aliases( aliases )
         ldap_data.fix_mail_domain( self.cfg )
         ldap_data.clear_empty_sets( )
+        self.ldap_data = ldap_data
+        self.ldap_aliases = aliases
 
-        # Sélection des comptes
-        match_rule = self.get_match_rule( )
+        # Sélection des comptes; la règle est vérifiée même si elle a été
+        # traduite en filtre LDAP.
         self.ldap_accounts = {}
         for eppn in ldap_data.accounts:
             a = ldap_data.accounts[ eppn ]
@@ -186,6 +281,75 @@ class ProcessSkeleton:
             else:
                 Logging( 'ldap' ).debug( 'Compte {} éliminé via règle'.format(
                         eppn ) )
+        stats = match_rule.cache_stats( )
+        if stats is not None:
+            Logging( 'ldap' ).debug( ( 'Règle de sélection: {} résultat(s) '
+                    + 'en cache, {} calculé(s)' ).format( *stats ) )
+
+    def reload_from_ldap( self , query ):
+        """
+        Relit depuis l'annuaire les comptes correspondant à un filtre et les
+        intègre aux données du chargement complet précédent, dont les groupes
+        sont réutilisés. Les aliases sont ensuite recalculés sur l'ensemble
+        des comptes, de sorte que les transferts d'adresses entre un compte
+        relu et un compte qui ne l'a pas été soient traités comme lors d'un
+        chargement complet. Les comptes non relus dont les aliases changent
+        sont copiés avant d'être modifiés, car ils peuvent être partagés avec
+        la base de données. La règle de sélection est enfin appliquée aux
+        comptes mis à jour.
+
+        :param str query: le filtre LDAP sélectionnant les comptes à relire
+        :return: l'ensemble des EPPN des comptes sélectionnés qui ont été \
+                relus ou dont les aliases ont été recalculés
+        """
+        import copy
+        match_rule = self.get_match_rule( )
+        batch = LDAPData( self.cfg , query , None , self.ldap_groups )
+        accounts = self.ldap_data.accounts
+        accounts.update( batch.accounts )
+        aliases = AliasesMap( self.cfg , accounts )
+        updated = set( batch.accounts )
+        for eppn in self.ldap_aliases.changed_addresses( aliases ):
+            if eppn in accounts and eppn not in updated:
+                accounts[ eppn ] = copy.copy( accounts[ eppn ] )
+                accounts[ eppn ].aliases = None
+                updated.add( eppn )
+        self.ldap_aliases = aliases
+        self.ldap_data.set_aliases( aliases , updated )
+        self.ldap_data.fix_mail_domain( self.cfg , updated )
+        self.ldap_data.clear_empty_sets( updated )
+
+        selected = set( )
+        for eppn in updated:
+            a = accounts[ eppn ]
+            a.reset_fingerprint( )
+            if match_rule.check( a ):
+                self.ldap_accounts[ eppn ] = a
+                selected.add( eppn )
+            else:
+                self.ldap_accounts.pop( eppn , None )
+                Logging( 'ldap' ).debug( 'Compte {} éliminé via règle'.format(
+                        eppn ) )
+        return selected
+
+    def load_ldap_snapshot_( self ):
+        """
+        Tente de lire les comptes LDAP depuis l'instantané. L'instantané est
+        utilisé quel que soit son âge si l'argument --ldap-snapshot est
+        présent, ou automatiquement s'il est plus récent que la durée indiquée
+        par l'option 'snapshot-ttl'.
+
+        :return: les comptes lus, ou None si l'annuaire doit être utilisé
+        """
+        forced = self.arguments.ldap_snapshot
+        ttl = LDAPSnapshot.max_age( self.cfg )
+        if not ( forced or ttl ):
+            return None
+        accounts = LDAPSnapshot.load( self.cfg , 0 if forced else ttl )
+        if accounts is None and forced:
+            Logging( 'ldap' ).warning( 'Instantané inutilisable, lecture '
+                    + 'depuis l\'annuaire' )
+        return accounts
 
     def load_db( self , txn ):
         """
@@ -193,7 +357,13 @@ class ProcessSkeleton:
         données. Les comptes chargés seront désérialisés sous la forme
         d'instances SyncAccount; les autres informations seront stockées dans le
         dictionnaire misc_data, dans une table correspondant à l'identificateur
-        du type de données et sous la forme de données JSON décodées.
+        du type de données et sous la forme de données décodées. Les
+        enregistrements peuvent être au format JSON ou au format binaire.
+
+        Si la classe l'autorise (LAZY_DB), les comptes sont chargés sous la
+        forme de vues qui ne décodent les enregistrements qu'à la demande; la
+        transaction doit alors fournir des tampons plutôt que des copies des
+        données.
 
         :param txn: la transaction LightningDB
         :return: la liste des comptes lus depuis la base
@@ -203,19 +373,25 @@ class ProcessSkeleton:
         acc = { }
         md = { }
         md_tot = 0
-        from .utils import json_load
+        from .utils import record_load
         with txn.cursor( ) as cursor:
             for a in cursor:
-                identifier = d_( a[ 0 ] )
-                data = d_( a[ 1 ] )
+                key = bytes( a[ 0 ] )
+                if key.startswith( LDAPCache.DB_PREFIX ):
+                    continue
+                identifier = d_( key )
                 if '%%%' in identifier:
                     ( mdt , rid ) = identifier.split( '%%%' )
                     if mdt not in md:
                         md[ mdt ] = {}
-                    md[ mdt ][ rid ] = json_load( data )
+                    md[ mdt ][ rid ] = record_load( a[ 1 ] )
                     md_tot += 1
+                elif self.LAZY_DB:
+                    acc[ identifier ] = SyncAccountView( self.cfg ,
+                            bytes( a[ 1 ] ) )
                 else:
-                    account = SyncAccount( self.cfg ).from_json( data )
+                    account = SyncAccount( self.cfg ).from_json_record(
+                            record_load( a[ 1 ] ) )
                     account.clear_empty_sets( )
                     acc[ identifier ] = account
 
@@ -229,12 +405,17 @@ class ProcessSkeleton:
 
     def save_account( self , account ):
         """
-        Sauvegarde les informations d'un compte dans la base de données. Si le
-        drapeau de simulation est présent dans la configuration, l'opération ne
-        sera pas réellement effectuée.
+        Sauvegarde les informations d'un compte dans la base de données, avec
+        l'empreinte de ses attributs. Si le drapeau de simulation est présent
+        dans la configuration, l'opération ne sera pas réellement effectuée.
 
-        :param SyncAccount account: le compte à sauvegarder
+        :param SyncAccount account: le compte à sauvegarder; s'il s'agit \
+                d'une vue, elle est d'abord convertie en compte complet
         """
+        if isinstance( account , SyncAccountView ):
+            account = account.upgrade( )
+        # Le compte vient d'être modifié, son empreinte doit être recalculée
+        account.reset_fingerprint( )
         sim = self.cfg.has_flag( 'bss' , 'simulate' )
         mode = 'simulée ' if sim else ''
         Logging( 'db' ).debug( 'Sauvegarde {}du compte {} (mail {})'.format(
@@ -243,10 +424,14 @@ class ProcessSkeleton:
             Logging( 'db' ).debug( 'Données: {}'.format( account.to_json( ) ) )
             return
 
+        from .utils import record_dump , record_format
         db_key = account.eppn.encode( 'utf-8' )
         account.clear_empty_sets( )
+        record = account.to_json_record( )
+        record[ '__fp__' ] = account.compute_fingerprint( )
         with self.db.begin( write = True ) as txn:
-            txn.put( db_key , account.to_json( ).encode( 'utf-8' ) )
+            txn.put( db_key , record_dump( record ,
+                    record_format( self.cfg ) ) )
 
     def remove_account( self , account ):
         """
@@ -279,10 +464,11 @@ class ProcessSkeleton:
                 mode , identifier , d_type ) )
         if sim: return
 
-        from .utils import json_dump
+        from .utils import record_dump , record_format
         db_key = '{}%%%{}'.format( d_type , identifier ).encode( 'utf-8' )
         with self.db.begin( write = True ) as txn:
-            txn.put( db_key , json_dump( data ).encode( 'utf-8' ) )
+            txn.put( db_key , record_dump( data ,
+                    record_format( self.cfg ) ) )
 
     def remove_data( self , d_type , identifier ):
         """
@@ -382,11 +568,16 @@ class ProcessSkeleton:
         self.init( )
         with self.cfg.lmdb_env( ) as db:
             self.db = db
-            with db.begin( write = False ) as txn:
+            with db.begin( write = False , buffers = self.LAZY_DB ) as txn:
                 self.load_db( txn )
             self.process( )
         self.postprocess( )
 
+        # Rapport de profilage des règles
+        profiler = self.cfg.rule_profiler( )
+        if profiler is not None:
+            profiler.report( )
+
     def get_error_lock_( self ):
         """
         Retourne le chemin du fichier servant de vérou d'erreurs.
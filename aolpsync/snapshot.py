@@ -0,0 +1,124 @@
+from .logging import Logging
+from .utils import FatalError
+
+
+class LDAPSnapshot:
+    """
+    Instantané des comptes LDAP traités lors de la dernière synchronisation.
+    L'instantané est écrit par le script de synchronisation dans le fichier
+    indiqué par l'option 'snapshot-path' de la section 'ldap'; il contient les
+    comptes après application des aliases, des corrections de domaine et de la
+    règle de sélection. Les outils de diagnostic peuvent l'utiliser à la place
+    de l'annuaire.
+
+    Le fichier est un document JSON compressé (gzip) contenant la date de sa
+    création et les enregistrements complets des comptes. Comme il contient
+    les empreintes des mots de passe, il n'est lisible que par son
+    propriétaire.
+    """
+
+    # Version du format de l'instantané
+    VERSION = 1
+
+    @staticmethod
+    def save( cfg , accounts ):
+        """
+        Écrit l'instantané des comptes si un chemin est configuré. Le fichier
+        est d'abord écrit sous un nom temporaire puis renommé.
+
+        :param Config cfg: la configuration
+        :param dict accounts: les comptes LDAP, indexés par EPPN
+        """
+        path = cfg.get( 'ldap' , 'snapshot-path' , '' )
+        if not path:
+            return
+
+        import gzip , os , time
+        from .utils import json_dump
+        data = {
+            'version' : LDAPSnapshot.VERSION ,
+            'timestamp' : time.time( ) ,
+            'accounts' : { eppn : account.to_json_record( all_fields = True )
+                    for eppn , account in accounts.items( ) } ,
+        }
+        temp_path = '{}.{}'.format( path , os.getpid( ) )
+        try:
+            fd = os.open( temp_path , os.O_WRONLY | os.O_CREAT | os.O_TRUNC ,
+                    0o600 )
+            with gzip.open( os.fdopen( fd , 'wb' ) , 'wb' ) as f:
+                f.write( json_dump( data ).encode( 'utf-8' ) )
+            os.replace( temp_path , path )
+        except OSError as e:
+            Logging( 'ldap' ).error(
+                    'Impossible d\'écrire l\'instantané {}: {}'.format(
+                        path , str( e ) ) )
+            try:
+                os.unlink( temp_path )
+            except OSError:
+                pass
+            return
+        Logging( 'ldap' ).info( 'Instantané de {} comptes écrit'.format(
+                len( accounts ) ) )
+
+    @staticmethod
+    def max_age( cfg ):
+        """
+        Lit l'âge maximal des instantanés depuis la configuration.
+
+        :param Config cfg: la configuration
+        :return: l'âge maximal en secondes, ou 0 si l'utilisation \
+                automatique des instantanés est désactivée
+        :raises FatalError: la valeur configurée est invalide
+        """
+        try:
+            ttl = int( cfg.get( 'ldap' , 'snapshot-ttl' , '0' ) )
+            if ttl < 0:
+                raise ValueError
+        except ValueError:
+            raise FatalError( 'Erreur de configuration: '
+                    + 'ldap > snapshot-ttl invalide' )
+        return ttl
+
+    @staticmethod
+    def load( cfg , max_age = 0 ):
+        """
+        Lit les comptes depuis l'instantané.
+
+        :param Config cfg: la configuration
+        :param int max_age: l'âge maximal de l'instantané en secondes, ou 0 \
+                pour accepter un instantané de n'importe quel âge
+        :return: les comptes LDAP indexés par EPPN, ou None si l'instantané \
+                n'est pas configuré, n'existe pas, est illisible ou trop ancien
+        """
+        path = cfg.get( 'ldap' , 'snapshot-path' , '' )
+        if not path:
+            Logging( 'ldap' ).info( 'Pas d\'instantané configuré' )
+            return None
+
+        import gzip , time
+        from .account import SyncAccount
+        from .utils import json_load
+        try:
+            with gzip.open( path , 'rb' ) as f:
+                data = json_load( f.read( ).decode( 'utf-8' ) )
+        except ( OSError , ValueError ) as e:
+            Logging( 'ldap' ).info( 'Instantané {} illisible: {}'.format(
+                    path , str( e ) ) )
+            return None
+        if data.get( 'version' ) != LDAPSnapshot.VERSION:
+            Logging( 'ldap' ).info( 'Instantané {}: version {} ignorée'.format(
+                    path , data.get( 'version' ) ) )
+            return None
+
+        age = time.time( ) - data[ 'timestamp' ]
+        if max_age and age > max_age:
+            Logging( 'ldap' ).info( 'Instantané {} trop ancien ({}s)'.format(
+                    path , int( age ) ) )
+            return None
+
+        accounts = { eppn : SyncAccount( cfg ).from_json_record( record ,
+                    all_fields = True )
+                for eppn , record in data[ 'accounts' ].items( ) }
+        Logging( 'ldap' ).info( ( '{} comptes lus depuis l\'instantané '
+                + '(âge: {}s)' ).format( len( accounts ) , int( age ) ) )
+        return accounts
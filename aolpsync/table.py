@@ -0,0 +1,106 @@
+from .account import SyncAccount
+
+
+class AccountTable:
+    """
+    Représentation en colonnes d'un ensemble de comptes: chaque champ est
+    stocké dans une liste, dont les lignes correspondent aux comptes, et un
+    index associe à chaque EPPN le numéro de sa ligne. Les valeurs de type
+    chaîne de caractères sont internées, de sorte que des valeurs égales lues
+    depuis des sources différentes sont un même objet.
+
+    Une table peut être construite à partir de n'importe quel dictionnaire de
+    comptes indexé par EPPN (comptes de LDAPData, comptes chargés depuis la
+    base de données ou comptes lus depuis le serveur Partage). Elle permet
+    d'effectuer les comparaisons entre sources champ par champ, sur
+    l'ensemble des comptes à la fois.
+    """
+
+    def __init__( self , accounts , fields = None ):
+        """
+        Construit la table à partir d'un dictionnaire de comptes.
+
+        :param dict accounts: les comptes (instances SyncAccount ou vues), \
+                indexés par EPPN
+        :param fields: la liste des champs à inclure, ou None pour inclure \
+                l'ensemble des champs des comptes
+        """
+        from operator import attrgetter
+        from sys import intern
+        if fields is None:
+            fields = SyncAccount.ALL_ATTRS
+        self.fields = tuple( fields )
+        self.eppns = [ intern( eppn ) if type( eppn ) is str else eppn
+                for eppn in accounts ]
+        self.index = { eppn : row for row , eppn in enumerate( self.eppns ) }
+        rows = list( accounts.values( ) )
+        self.columns = {
+            field : [ intern( v ) if type( v ) is str else v
+                        for v in map( attrgetter( field ) , rows ) ]
+                for field in self.fields
+        }
+
+    def __len__( self ):
+        return len( self.eppns )
+
+    def __contains__( self , eppn ):
+        return eppn in self.index
+
+    def column( self , field ):
+        """
+        Renvoie la colonne correspondant à un champ.
+
+        :param str field: le nom du champ
+        :return: la liste des valeurs du champ, dans l'ordre des lignes
+        """
+        return self.columns[ field ]
+
+    def get( self , eppn , field ):
+        """
+        Lit la valeur d'un champ pour un compte.
+
+        :param str eppn: l'EPPN du compte
+        :param str field: le nom du champ
+        :return: la valeur du champ
+        :raises KeyError: le compte ou le champ n'existent pas dans la table
+        """
+        return self.columns[ field ][ self.index[ eppn ] ]
+
+    def select( self , field , predicate ):
+        """
+        Sélectionne les comptes dont la valeur d'un champ vérifie un prédicat.
+
+        :param str field: le nom du champ
+        :param predicate: une fonction recevant la valeur du champ et \
+                renvoyant un booléen
+        :return: l'ensemble des EPPN des comptes sélectionnés
+        """
+        eppns = self.eppns
+        return set([ eppns[ row ]
+                for row , value in enumerate( self.columns[ field ] )
+                if predicate( value ) ])
+
+    def equal_rows( self , other , fields ):
+        """
+        Compare, pour les comptes présents dans les deux tables, les valeurs
+        d'un ensemble de champs. La comparaison est effectuée colonne par
+        colonne, de la même manière que SyncAccount.compare_; une ligne dont
+        une différence a déjà été trouvée n'est plus comparée.
+
+        :param AccountTable other: la table avec laquelle comparer
+        :param fields: les noms des champs à comparer
+        :return: l'ensemble des EPPN des comptes présents dans les deux \
+                tables et pour lesquels les champs sont égaux
+        """
+        from .utils import multivalued_check_equals as mce
+        other_index = other.index
+        pending = [ ( row , other_index[ eppn ] )
+                for row , eppn in enumerate( self.eppns )
+                if eppn in other_index ]
+        for field in fields:
+            ca = self.columns[ field ]
+            cb = other.columns[ field ]
+            pending = [ ( ra , rb ) for ra , rb in pending
+                    if ca[ ra ] is cb[ rb ] or mce( ca[ ra ] , cb[ rb ] ) ]
+        eppns = self.eppns
+        return set([ eppns[ row ] for row , _ in pending ])
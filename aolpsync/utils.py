@@ -1,5 +1,6 @@
 from .logging import Logging
 import json
+import struct
 
 class FatalError( Exception ):
     """
@@ -37,6 +38,18 @@ def json_load( data ):
     return json.loads( data , object_hook = json_decoder_ )
 
 
+class JSONSetEncoder_( json.JSONEncoder ):
+    """
+    Encodeur JSON qui transforme les ensembles et les binaires en
+    dictionnaires contenant un champ '__ext__' et les données
+    correspondantes.
+    """
+    def default( self , obj ):
+        if type( obj ) in ( set , bytes ):
+            return { '__ext__' : type( obj ).__name__ ,
+                    'data' : list( obj ) }
+        return json.JSONEncoder.default( self , obj )
+
 def json_dump( data ):
     """
     Sérialise des données contenant éventuellement des ensembles ou des données
@@ -45,17 +58,6 @@ def json_dump( data ):
     :param data: les données à encoder
     :return: les données sous la forme de JSON
     """
-    class JSONSetEncoder_( json.JSONEncoder ):
-        """
-        Encodeur JSON qui transforme les ensembles et les binaires en
-        dictionnaires contenant un champ '__ext__' et les données
-        correspondantes.
-        """
-        def default( self , obj ):
-            if type( obj ) in ( set , bytes ):
-                return { '__ext__' : type( obj ).__name__ ,
-                        'data' : list( obj ) }
-            return json.JSONEncoder.default( self , obj )
     return json.dumps( data ,
             separators = ( ',' , ':' ) ,
             cls = JSONSetEncoder_ )
@@ -64,6 +66,331 @@ def json_dump( data ):
 #-------------------------------------------------------------------------------
 
 
+# Formats d'enregistrement disponibles pour la base de données
+RECORD_FORMATS = ( 'json' , 'binary' )
+# Préfixe des enregistrements binaires, suivi de la version du format
+RECORD_MAGIC = b'\0PSR'
+RECORD_VERSION = 2
+
+# Format binaire des enregistrements (version 2). Chaque valeur est codée par
+# un octet de type suivi de son contenu; les entiers de longueur sont non
+# signés sur 32 bits, petit-boutiens.
+#   N / T / F       None, True, False
+#   i <q>           entier signé sur 64 bits
+#   I <len> <ascii> entier hors de cette plage, sous forme décimale
+#   f <d>           flottant double précision
+#   a <n> <utf-8>   chaîne de caractères d'au plus 255 octets (n sur un octet)
+#   s <len> <utf-8> chaîne de caractères plus longue
+#   b <len> <data>  données binaires
+#   l <n> valeurs   liste (les tuples sont enregistrés comme des listes)
+#   e <n> valeurs   ensemble
+#   d <n> paires    dictionnaire, chaque clé étant suivie de sa valeur
+RECORD_LEN_ = struct.Struct( '<I' )
+RECORD_INT_ = struct.Struct( '<q' )
+RECORD_FLOAT_ = struct.Struct( '<d' )
+
+def record_encode_( out , value ):
+    """
+    Ajoute le codage binaire d'une valeur à un tampon.
+
+    :param bytearray out: le tampon de sortie
+    :param value: la valeur à coder
+    :raises TypeError: la valeur, ou l'une des valeurs qu'elle contient, \
+            n'est pas d'un type supporté
+    """
+    vt = type( value )
+    if vt is str:
+        data = value.encode( 'utf-8' )
+        n = len( data )
+        if n < 256:
+            out += b'a'
+            out.append( n )
+        else:
+            out += b's'
+            out += RECORD_LEN_.pack( n )
+        out += data
+    elif value is None:
+        out += b'N'
+    elif vt is bool:
+        out += b'T' if value else b'F'
+    elif vt is int:
+        if -0x8000000000000000 <= value <= 0x7fffffffffffffff:
+            out += b'i'
+            out += RECORD_INT_.pack( value )
+        else:
+            data = str( value ).encode( 'ascii' )
+            out += b'I'
+            out += RECORD_LEN_.pack( len( data ) )
+            out += data
+    elif vt is float:
+        out += b'f'
+        out += RECORD_FLOAT_.pack( value )
+    elif vt is dict:
+        out += b'd'
+        out += RECORD_LEN_.pack( len( value ) )
+        for k , v in value.items( ):
+            record_encode_( out , k )
+            record_encode_( out , v )
+    elif vt in ( list , tuple , set , frozenset ):
+        out += b'e' if vt in ( set , frozenset ) else b'l'
+        out += RECORD_LEN_.pack( len( value ) )
+        for v in value:
+            record_encode_( out , v )
+    elif vt in ( bytes , bytearray ):
+        out += b'b'
+        out += RECORD_LEN_.pack( len( value ) )
+        out += value
+    else:
+        raise TypeError( 'Type {} non supporté'.format( vt.__name__ ) )
+
+def record_decode_( raw , pos ):
+    """
+    Décode une valeur binaire. Les chaînes courtes, de loin les valeurs les
+    plus fréquentes, sont décodées directement dans les boucles de lecture des
+    conteneurs. Les données tronquées ne sont pas détectées ici; elles
+    provoquent une erreur lors de la lecture de la valeur suivante ou lors de
+    la vérification de la longueur totale par record_load.
+
+    :param raw: les données (chaîne d'octets ou tampon)
+    :param int pos: la position du début de la valeur
+    :return: un tuple contenant la valeur décodée et la position suivant \
+            la fin de son codage
+    :raises ValueError: le type de la valeur est inconnu
+    :raises IndexError: les données sont tronquées
+    :raises struct.error: les données sont tronquées
+    """
+    tag = raw[ pos ]
+    if tag == 0x61: # a
+        end = pos + 2 + raw[ pos + 1 ]
+        return ( str( raw[ pos + 2:end ] , 'utf-8' ) , end )
+    pos += 1
+    if tag == 0x65 or tag == 0x6c: # e, l
+        ( n , ) = RECORD_LEN_.unpack_from( raw , pos )
+        pos += 4
+        items = []
+        for _ in range( n ):
+            if raw[ pos ] == 0x61:
+                end = pos + 2 + raw[ pos + 1 ]
+                items.append( str( raw[ pos + 2:end ] , 'utf-8' ) )
+                pos = end
+            else:
+                ( v , pos ) = record_decode_( raw , pos )
+                items.append( v )
+        return ( set( items ) if tag == 0x65 else items , pos )
+    if tag == 0x64: # d
+        ( n , ) = RECORD_LEN_.unpack_from( raw , pos )
+        pos += 4
+        result = {}
+        for _ in range( n ):
+            if raw[ pos ] == 0x61:
+                end = pos + 2 + raw[ pos + 1 ]
+                k = str( raw[ pos + 2:end ] , 'utf-8' )
+                pos = end
+            else:
+                ( k , pos ) = record_decode_( raw , pos )
+            if raw[ pos ] == 0x61:
+                end = pos + 2 + raw[ pos + 1 ]
+                result[ k ] = str( raw[ pos + 2:end ] , 'utf-8' )
+                pos = end
+            else:
+                ( result[ k ] , pos ) = record_decode_( raw , pos )
+        return ( result , pos )
+    if tag == 0x4e: # N
+        return ( None , pos )
+    if tag == 0x54: # T
+        return ( True , pos )
+    if tag == 0x46: # F
+        return ( False , pos )
+    if tag == 0x69: # i
+        return ( RECORD_INT_.unpack_from( raw , pos )[ 0 ] , pos + 8 )
+    if tag == 0x66: # f
+        return ( RECORD_FLOAT_.unpack_from( raw , pos )[ 0 ] , pos + 8 )
+    if tag in ( 0x73 , 0x62 , 0x49 ): # s, b, I
+        ( n , ) = RECORD_LEN_.unpack_from( raw , pos )
+        pos += 4
+        end = pos + n
+        if tag == 0x73:
+            return ( str( raw[ pos:end ] , 'utf-8' ) , end )
+        data = bytes( raw[ pos:end ] )
+        return ( data if tag == 0x62 else int( data ) , end )
+    raise ValueError( 'Type de valeur {:#04x} inconnu'.format( tag ) )
+
+def record_format( cfg ):
+    """
+    Lit le format d'enregistrement à utiliser depuis la configuration.
+
+    :param Config cfg: la configuration
+    :return: le nom du format
+    :raises FatalError: le format configuré est invalide
+    """
+    fmt = cfg.get( 'db' , 'record-format' , 'json' )
+    if fmt not in RECORD_FORMATS:
+        raise FatalError( 'Erreur de configuration: '
+                + 'db > record-format invalide' )
+    return fmt
+
+def record_dump( data , fmt = 'json' ):
+    """
+    Sérialise un enregistrement destiné à la base de données. Le format
+    binaire préfixe les données, codées selon le format décrit ci-dessus,
+    d'un identifiant et d'un numéro de version.
+
+    :param data: les données à encoder
+    :param str fmt: le format à utiliser ('json' ou 'binary')
+    :return: l'enregistrement sous la forme d'une chaîne d'octets
+    :raises TypeError: les données contiennent une valeur dont le type \
+            n'est pas supporté par le format binaire
+    """
+    if fmt == 'binary':
+        out = bytearray( RECORD_MAGIC )
+        out.append( RECORD_VERSION )
+        record_encode_( out , data )
+        return bytes( out )
+    return json_dump( data ).encode( 'utf-8' )
+
+def record_skip_( raw , pos ):
+    """
+    Détermine la position de la fin du codage d'une valeur binaire, sans la
+    décoder.
+
+    :param raw: les données (chaîne d'octets ou tampon)
+    :param int pos: la position du début de la valeur
+    :return: la position suivant la fin du codage de la valeur
+    :raises ValueError: le type de la valeur est inconnu
+    :raises IndexError: les données sont tronquées
+    :raises struct.error: les données sont tronquées
+    """
+    tag = raw[ pos ]
+    if tag == 0x61: # a
+        return pos + 2 + raw[ pos + 1 ]
+    pos += 1
+    if tag == 0x65 or tag == 0x6c or tag == 0x64: # e, l, d
+        ( n , ) = RECORD_LEN_.unpack_from( raw , pos )
+        pos += 4
+        if tag == 0x64:
+            n *= 2
+        for _ in range( n ):
+            if raw[ pos ] == 0x61:
+                pos += 2 + raw[ pos + 1 ]
+            else:
+                pos = record_skip_( raw , pos )
+        return pos
+    if tag == 0x4e or tag == 0x54 or tag == 0x46: # N, T, F
+        return pos
+    if tag == 0x69 or tag == 0x66: # i, f
+        return pos + 8
+    if tag in ( 0x73 , 0x62 , 0x49 ): # s, b, I
+        return pos + 4 + RECORD_LEN_.unpack_from( raw , pos )[ 0 ]
+    raise ValueError( 'Type de valeur {:#04x} inconnu'.format( tag ) )
+
+def record_start_( raw ):
+    """
+    Vérifie l'en-tête d'un enregistrement binaire.
+
+    :param raw: l'enregistrement (chaîne d'octets ou tampon)
+    :return: la position du début des données, ou None si l'enregistrement \
+            est au format JSON
+    :raises ValueError: l'enregistrement utilise une version inconnue du \
+            format binaire
+    """
+    ml = len( RECORD_MAGIC )
+    if bytes( raw[ :ml ] ) != RECORD_MAGIC:
+        return None
+    if raw[ ml ] != RECORD_VERSION:
+        raise ValueError( 'Version d\'enregistrement {} inconnue'.format(
+                raw[ ml ] ) )
+    return ml + 1
+
+def record_end_( raw , end ):
+    """
+    Vérifie que le codage d'un enregistrement binaire en occupe la totalité.
+
+    :param raw: l'enregistrement (chaîne d'octets ou tampon)
+    :param int end: la position de la fin du codage
+    :raises ValueError: l'enregistrement est tronqué ou contient des \
+            données superflues
+    """
+    if end < len( raw ):
+        raise ValueError( 'Données superflues en fin d\'enregistrement' )
+    if end > len( raw ):
+        raise ValueError( 'Enregistrement tronqué' )
+
+def record_load( raw ):
+    """
+    Charge un enregistrement lu depuis la base de données, quel que soit son
+    format.
+
+    :param raw: l'enregistrement (chaîne d'octets ou tampon)
+    :return: les données décodées
+    :raises ValueError: l'enregistrement binaire utilise une version \
+            inconnue du format ou contient des données invalides
+    """
+    start = record_start_( raw )
+    if start is None:
+        return json_load( str( raw , 'utf-8' ) )
+    try:
+        ( data , end ) = record_decode_( raw , start )
+    except ( IndexError , struct.error , UnicodeDecodeError ) as e:
+        raise ValueError( 'Enregistrement invalide: {}'.format( e ) )
+    record_end_( raw , end )
+    return data
+
+def record_index( raw ):
+    """
+    Indexe les champs d'un enregistrement binaire contenant un dictionnaire,
+    sans décoder leurs valeurs; celles-ci peuvent ensuite être lues une par
+    une au moyen de record_field.
+
+    :param raw: l'enregistrement (chaîne d'octets ou tampon)
+    :return: un dictionnaire associant à chaque clé la position de sa \
+            valeur, ou None si l'enregistrement est au format JSON ou ne \
+            contient pas un dictionnaire
+    :raises ValueError: l'enregistrement binaire utilise une version \
+            inconnue du format ou contient des données invalides
+    """
+    pos = record_start_( raw )
+    if pos is None or pos >= len( raw ) or raw[ pos ] != 0x64: # d
+        return None
+    index = {}
+    try:
+        ( n , ) = RECORD_LEN_.unpack_from( raw , pos + 1 )
+        pos += 5
+        for _ in range( n ):
+            if raw[ pos ] == 0x61:
+                end = pos + 2 + raw[ pos + 1 ]
+                key = str( raw[ pos + 2:end ] , 'utf-8' )
+                pos = end
+            else:
+                ( key , pos ) = record_decode_( raw , pos )
+            index[ key ] = pos
+            if raw[ pos ] == 0x61:
+                pos += 2 + raw[ pos + 1 ]
+            else:
+                pos = record_skip_( raw , pos )
+    except ( IndexError , struct.error , UnicodeDecodeError ) as e:
+        raise ValueError( 'Enregistrement invalide: {}'.format( e ) )
+    record_end_( raw , pos )
+    return index
+
+def record_field( raw , pos ):
+    """
+    Décode l'un des champs d'un enregistrement binaire indexé par
+    record_index.
+
+    :param raw: l'enregistrement (chaîne d'octets ou tampon)
+    :param int pos: la position de la valeur du champ
+    :return: la valeur décodée
+    :raises ValueError: la valeur est invalide
+    """
+    try:
+        return record_decode_( raw , pos )[ 0 ]
+    except ( IndexError , struct.error , UnicodeDecodeError ) as e:
+        raise ValueError( 'Enregistrement invalide: {}'.format( e ) )
+
+
+#-------------------------------------------------------------------------------
+
+
 def multivalued_check_equals( a , b ):
     # Valeurs égales => identique
     if a == b: return True
@@ -141,24 +468,121 @@ def get_eppn_fixer( cfg ):
 #-------------------------------------------------------------------------------
 
 
-def run_shell_command( command ):
+class ShellCommandError( Exception ):
+    """
+    Exception levée lorsqu'une commande exécutée via le shell a dépassé le
+    délai ou la taille de sortie qui lui étaient accordés. La commande a été
+    interrompue.
     """
-    Exécute une commande via le shell.
+    pass
+
+
+def run_shell_command( command , timeout = None , max_output = None ):
+    """
+    Exécute une commande via le shell. Si un délai ou une taille de sortie
+    maximale sont spécifiés, la commande est lancée dans son propre groupe de
+    processus, qui sera tué en cas de dépassement; les sous-processus lancés
+    par le shell (ssh, par exemple) sont donc interrompus également.
 
     :param str command: la ligne de commande à exécuter
+    :param timeout: le délai maximal d'exécution de la commande, en secondes, \
+            ou None pour ne pas limiter la durée d'exécution
+    :param max_output: la taille maximale, en octets, de la sortie standard \
+            de la commande, ou None pour ne pas la limiter
 
     :return: un tuple contenant le code de retour, la sortie standard sous la \
             forme d'une liste, et l'erreur standard sous la forme d'une liste
+
+    :raises ShellCommandError: la commande a dépassé le délai ou la taille \
+            de sortie maximale
     """
     import subprocess
-    child = subprocess.Popen( command , shell = True ,
-            stdout = subprocess.PIPE ,
-            stderr = subprocess.PIPE )
-    ( output , errors ) = child.communicate( )
-    rc = child.wait( )
     fix = lambda x : [ l + b'\n'
             for l in x.replace( b'\r\n' , b'\n' ).split( b'\n' ) ]
-    return ( rc , fix( output ) , fix( errors ) )
+    if timeout is None and max_output is None:
+        child = subprocess.Popen( command , shell = True ,
+                stdout = subprocess.PIPE ,
+                stderr = subprocess.PIPE )
+        ( output , errors ) = child.communicate( )
+        rc = child.wait( )
+        return ( rc , fix( output ) , fix( errors ) )
+
+    import os , signal , threading , time
+    child = subprocess.Popen( command , shell = True ,
+            stdout = subprocess.PIPE ,
+            stderr = subprocess.PIPE ,
+            start_new_session = True )
+    lock = threading.Lock( )
+    state = { 'reaped' : False , 'timed_out' : False }
+
+    def kill_group_( ):
+        try:
+            os.killpg( child.pid , signal.SIGKILL )
+        except ProcessLookupError:
+            pass
+
+    def timeout_( ):
+        # Rien à faire si la commande s'est déjà terminée
+        with lock:
+            if state[ 'reaped' ]:
+                return
+            state[ 'timed_out' ] = True
+            kill_group_( )
+
+    errors = []
+    err_reader = threading.Thread( target = lambda : errors.append(
+            child.stderr.read( ) ) , daemon = True )
+    err_reader.start( )
+    timer = None
+    if timeout is not None:
+        deadline = time.monotonic( ) + timeout
+        timer = threading.Timer( timeout , timeout_ )
+        timer.daemon = True
+        timer.start( )
+    overflow = False
+    try:
+        output = []
+        size = 0
+        while True:
+            chunk = child.stdout.read1( 65536 )
+            if not chunk:
+                break
+            size += len( chunk )
+            if max_output is not None and size > max_output:
+                overflow = True
+                with lock:
+                    kill_group_( )
+                break
+            output.append( chunk )
+        rc = child.wait( )
+        with lock:
+            state[ 'reaped' ] = True
+        if timer is not None:
+            timer.cancel( )
+
+        # Des processus lancés en arrière-plan par la commande peuvent encore
+        # utiliser l'erreur standard; ils sont interrompus si le délai est
+        # dépassé, sans que cela ne constitue un échec de la commande.
+        if timer is None:
+            err_reader.join( )
+        else:
+            err_reader.join( max( 0 , deadline - time.monotonic( ) ) )
+            if err_reader.is_alive( ):
+                kill_group_( )
+                err_reader.join( )
+    finally:
+        if timer is not None:
+            timer.cancel( )
+        child.stdout.close( )
+        child.stderr.close( )
+    if overflow:
+        raise ShellCommandError( 'sortie supérieure à {} octets'.format(
+                max_output ) )
+    # La commande n'a été interrompue que si elle a effectivement été tuée;
+    # elle a pu se terminer normalement juste avant l'expiration du délai.
+    if state[ 'timed_out' ] and rc == -signal.SIGKILL:
+        raise ShellCommandError( 'délai de {} s dépassé'.format( timeout ) )
+    return ( rc , fix( b''.join( output ) ) , fix( b''.join( errors ) ) )
 
 
 #-------------------------------------------------------------------------------
@@ -0,0 +1,52 @@
+#!/usr/bin/python3
+"""
+Mesure l'occupation mémoire des comptes de synchronisation: instances de la
+sous-classe générée, dont les champs sont déclarés au moyen de __slots__,
+comparées à des instances stockant les mêmes champs dans un dictionnaire
+d'attributs (représentation utilisée auparavant). Les valeurs des attributs
+sont partagées avec les enregistrements d'origine; seul le coût des instances
+elles-mêmes est mesuré.
+
+Usage: python3 benchmarks/account_memory.py [nombre de comptes]
+"""
+import tracemalloc
+
+from common import *
+
+
+class DictAccount( SyncAccount ):
+    """
+    Compte de synchronisation dont les champs sont stockés dans le
+    dictionnaire d'attributs de l'instance.
+    """
+    pass
+
+def build_( cls , cfg , records ):
+    return [ cls( cfg ).from_json_record( r ) for r in records ]
+
+def measure_( cls , cfg , records ):
+    tracemalloc.start( )
+    before = tracemalloc.get_traced_memory( )[ 0 ]
+    accounts = build_( cls , cfg , records )
+    size = tracemalloc.get_traced_memory( )[ 0 ] - before
+    tracemalloc.stop( )
+    assert all( a == b for a , b in zip( accounts ,
+            build_( SyncAccount , cfg , records ) ) )
+    return ( size , accounts )
+
+
+count = count_argument( 100000 )
+cfg = make_config( )
+records = make_records( count )
+print( '{} comptes, {} attributs'.format( count ,
+        len( SyncAccount.ALL_ATTRS ) ) )
+for label , cls in ( ( 'dictionnaire' , DictAccount ) ,
+        ( '__slots__' , SyncAccount ) ):
+    ( size , accounts ) = measure_( cls , cfg , records )
+    assert ( type( accounts[ 0 ] ) is SyncAccount.SLOTTED ) == (
+            cls is SyncAccount )
+    report( '{}: mémoire par compte'.format( label ) , size // count ,
+            'octets' )
+    report( '{}: création des comptes'.format( label ) ,
+            best_of( lambda : build_( cls , cfg , records ) , 3 ) )
+    del accounts
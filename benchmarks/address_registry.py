@@ -0,0 +1,49 @@
+#!/usr/bin/python3
+"""
+Mesure la mémoire économisée par le registre des adresses (AddressRegistry).
+Les mêmes comptes sont lus depuis trois sources (annuaire LDAP, base de
+données, serveur Partage), chacune produisant ses propres copies des chaînes;
+les adresses des trois copies sont ensuite partagées au moyen du registre,
+comme le font LDAPData et les scripts. Le résultat tient compte de la mémoire
+occupée par le registre lui-même.
+
+Usage: python3 benchmarks/address_registry.py [nombre de comptes]
+"""
+import tracemalloc
+
+from common import *
+
+from aolpsync.addresses import AddressRegistry
+
+
+SOURCES = 3
+
+def load_( cfg , count , registry ):
+    tracemalloc.start( )
+    before = tracemalloc.get_traced_memory( )[ 0 ]
+    copies = []
+    for _ in range( SOURCES ):
+        accounts = make_accounts( cfg , count )
+        if registry is not None:
+            accounts = { registry.address( eppn ) : registry.account( a )
+                    for eppn , a in accounts.items( ) }
+        copies.append( accounts )
+    size = tracemalloc.get_traced_memory( )[ 0 ] - before
+    tracemalloc.stop( )
+    return ( size , copies )
+
+
+count = count_argument( 38000 )
+cfg = make_config( )
+( plain , copies ) = load_( cfg , count , None )
+del copies
+registry = AddressRegistry( )
+( shared , copies ) = load_( cfg , count , registry )
+assert all( c == copies[ 0 ] for c in copies )
+print( '{} comptes, {} sources, {} adresses distinctes'.format( count ,
+        SOURCES , len( registry ) ) )
+report( 'sans registre' , plain // 1024 , 'Kio' )
+report( 'avec registre' , shared // 1024 , 'Kio' )
+report( 'économie' , ( plain - shared ) // 1024 , 'Kio' )
+report( 'économie par adresse' , ( plain - shared ) // len( registry ) ,
+        'octets' )
@@ -0,0 +1,232 @@
+"""
+Outils communs aux scripts de mesure de performances: configuration
+minimale, génération d'un jeu de comptes synthétiques et chronométrage.
+
+Les scripts de ce répertoire se lancent depuis la racine du dépôt, par exemple
+"python3 benchmarks/record_format.py 50000". Ils n'accèdent ni à l'annuaire ni
+à l'API de Partage: la configuration et la base de données sont créées dans un
+répertoire temporaire.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+if ROOT not in sys.path:
+    sys.path.insert( 0 , ROOT )
+
+from aolpsync.configuration import Config
+from aolpsync.account import SyncAccount
+
+
+#-------------------------------------------------------------------------------
+
+
+# Domaines utilisés pour les adresses générées
+DOMAINS = ( 'univ-test.fr' , 'etu.univ-test.fr' , 'labo.univ-test.fr' )
+# Groupes et valeurs d'attributs supplémentaires des comptes générés
+GROUPS = ( 'staff' , 'students' , 'faculty' , 'admins' , 'guests' ,
+        'library' , 'research' , 'alumni' )
+TITLES = ( 'Enseignant' , 'Etudiant' , 'Administratif' , 'Technicien' ,
+        'Chercheur' )
+COS = ( 'default' , 'staff' , 'faculty' , 'student' , 'guest' )
+# Règles de sélection des comptes (ldap > match-rule) et de droits d'accès
+# aux calendriers, en complément des règles d'attribution des classes de
+# service de la configuration
+RULES = (
+    ( 'match-rule' , '(and (not (empty mail)) (or (contains groups staff) '
+            + '(contains groups faculty) (contains groups research)) '
+            + '(not (contains groups alumni)))' ) ,
+    ( 'calendar/read-rule' , '(or {})'.format( ' '.join(
+            '(and (eq title {}) (eq cos {}))'.format( t , c )
+                for t in TITLES for c in COS[ 1: ] ) ) ) ,
+    ( 'calendar/write-rule' , '(and (suffix mail "@univ-test.fr") '
+            + '(xor (contains groups staff) (contains groups library)))' ) ,
+)
+
+CONFIG = '''
+[ldap]
+host=localhost
+user=cn=admin,dc=univ-test,dc=fr
+pass=x
+people-dn=ou=people,dc=univ-test,dc=fr
+groups-dn=ou=groups,dc=univ-test,dc=fr
+mail-domain={domain}
+eppn-domain={domain}
+
+[db]
+path={path}
+
+[bss]
+domain={domain}
+token=x
+default-cos=default
+deletion-threshold=5
+
+[ldap-people-classes]
+inetOrgPerson
+
+[ldap-group-classes]
+groupOfNames = member
+
+[cos-rules]
+staff = (and (contains groups staff) (not (contains groups alumni)))
+faculty = (or (contains groups faculty) (in title Enseignant Chercheur))
+student = (and (contains groups students) (eq title Etudiant))
+guest = (and (contains groups guests)
+    (not (contains-any groups staff faculty students)))
+
+[extra-attributes]
+title
+
+[ldap-extra-attributes]
+title=title
+
+{extra}
+'''
+
+def make_config( extra = '' ):
+    """
+    Écrit une configuration minimale dans un répertoire temporaire puis la
+    charge. La base de données LMDB est placée dans le même répertoire.
+
+    :param str extra: des sections supplémentaires à ajouter à la \
+            configuration
+    :return: l'instance de configuration
+    """
+    tmp = tempfile.mkdtemp( prefix = 'psync-bench-' )
+    path = os.path.join( tmp , 'partage-sync.ini' )
+    with open( path , 'w' ) as f:
+        f.write( CONFIG.format( domain = DOMAINS[ 0 ] ,
+                path = os.path.join( tmp , 'db' ) , extra = extra ) )
+    Config.FILE_NAME = path
+    cfg = Config( )
+    SyncAccount( cfg )
+    return cfg
+
+def make_records( count , seed = 0 ):
+    """
+    Génère des enregistrements de comptes synthétiques, tels qu'ils seraient
+    sauvegardés dans la base de données.
+
+    :param int count: le nombre de comptes
+    :param int seed: la graine du générateur aléatoire
+    :return: la liste des enregistrements
+    """
+    rnd = random.Random( seed )
+    records = []
+    for i in range( count ):
+        uid = 'user{:06d}'.format( i )
+        domain = DOMAINS[ i % len( DOMAINS ) ]
+        mail = '{}@{}'.format( uid , domain )
+        aliases = set([ 'alias{}.{}@{}'.format( j , uid ,
+                    rnd.choice( DOMAINS ) )
+                for j in range( rnd.randrange( 3 ) ) ])
+        groups = set( rnd.sample( GROUPS , rnd.randrange( 1 , 4 ) ) )
+        record = {
+            'uid' : uid ,
+            'eppn' : '{}@{}'.format( uid , DOMAINS[ 0 ] ) ,
+            'mail' : mail ,
+            'ldapMail' : set([ mail ]) | aliases ,
+            'surname' : 'Nom{}'.format( i ) ,
+            'givenName' : 'Prenom{}'.format( i % 997 ) ,
+            'displayName' : 'Prenom{} Nom{}'.format( i % 997 , i ) ,
+            'passwordHash' : '{{SSHA}}{:032x}'.format(
+                    rnd.getrandbits( 128 ) ) ,
+            'groups' : groups ,
+            'title' : rnd.choice( TITLES ) ,
+            'cos' : rnd.choice( COS ) ,
+        }
+        if aliases:
+            record[ 'aliases' ] = aliases
+        if rnd.random( ) < .05:
+            record[ 'markedForDeletion' ] = 1700000000 + i
+        records.append( record )
+    return records
+
+def make_accounts( cfg , count , seed = 0 ):
+    """
+    Génère des comptes de synchronisation synthétiques.
+
+    :param Config cfg: la configuration
+    :param int count: le nombre de comptes
+    :param int seed: la graine du générateur aléatoire
+    :return: un dictionnaire associant les comptes à leurs EPPN
+    """
+    accounts = {}
+    for record in make_records( count , seed ):
+        account = SyncAccount( cfg ).from_json_record( record )
+        account.clear_empty_sets( )
+        accounts[ account.eppn ] = account
+    return accounts
+
+def write_db( cfg , records , fmt ):
+    """
+    Remplace le contenu de la base de données par des enregistrements de
+    comptes, comme le ferait ProcessSkeleton.save_account.
+
+    :param Config cfg: la configuration
+    :param records: les enregistrements à écrire
+    :param str fmt: le format d'enregistrement ('json' ou 'binary')
+    :return: la taille totale des enregistrements, en octets
+    """
+    from aolpsync.utils import record_dump
+    size = 0
+    with cfg.lmdb_env( ) as db:
+        with db.begin( write = True ) as txn:
+            txn.drop( db.open_db( ) , delete = False )
+            for record in records:
+                account = SyncAccount( cfg ).from_json_record( record )
+                data = account.to_json_record( )
+                data[ '__fp__' ] = account.compute_fingerprint( )
+                raw = record_dump( data , fmt )
+                size += len( raw )
+                txn.put( account.eppn.encode( 'utf-8' ) , raw )
+    return size
+
+
+#-------------------------------------------------------------------------------
+
+
+def best_of( function , repeat = 5 ):
+    """
+    Exécute plusieurs fois une fonction et renvoie la durée de l'exécution la
+    plus rapide.
+
+    :param function: la fonction à mesurer, appelée sans arguments
+    :param int repeat: le nombre d'exécutions
+    :return: la durée minimale, en secondes
+    """
+    best = None
+    for _ in range( repeat ):
+        start = time.perf_counter( )
+        function( )
+        elapsed = time.perf_counter( ) - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def report( label , value , unit = 's' ):
+    """
+    Affiche le résultat d'une mesure.
+
+    :param str label: la description de la mesure
+    :param value: la valeur mesurée
+    :param str unit: l'unité de la valeur
+    """
+    if isinstance( value , float ):
+        value = '{:.3f}'.format( value )
+    print( '{:<48} {:>12} {}'.format( label , value , unit ) )
+
+def count_argument( default ):
+    """
+    Lit le nombre de comptes à générer depuis la ligne de commande.
+
+    :param int default: la valeur par défaut
+    :return: le nombre de comptes
+    """
+    if len( sys.argv ) > 1:
+        return int( sys.argv[ 1 ] )
+    return default
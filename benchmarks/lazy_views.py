@@ -0,0 +1,53 @@
+#!/usr/bin/python3
+"""
+Compare le chargement des comptes de la base de données sous la forme
+d'instances SyncAccount (chargement complet) et sous la forme de vues
+paresseuses (SyncAccountView), pour des accès correspondant à ceux des
+scripts qui n'utilisent que quelques champs: purge.py (markedForDeletion),
+calendars.py (mail, aliases, markedForDeletion) et cos-migration.py (cos).
+Le dernier cas convertit toutes les vues en comptes complets, comme le ferait
+un script sauvegardant chaque compte.
+
+Usage: python3 benchmarks/lazy_views.py [nombre de comptes]
+"""
+from common import *
+
+from aolpsync.skel import ProcessSkeleton
+
+
+class Loader( ProcessSkeleton ):
+    """
+    Squelette réduit au chargement de la base de données.
+    """
+
+    def __init__( self , cfg , lazy ):
+        self.cfg = cfg
+        self.LAZY_DB = lazy
+
+    def load( self , access ):
+        with self.cfg.lmdb_env( ) as db:
+            with db.begin( write = False , buffers = self.LAZY_DB ) as txn:
+                self.load_db( txn )
+        return [ access( a ) for a in self.db_accounts.values( ) ]
+
+
+ACCESSES = (
+    ( 'purge' , lambda a : a.markedForDeletion ) ,
+    ( 'calendars' , lambda a : ( a.mail , a.aliases , a.markedForDeletion ) ) ,
+    ( 'cos-migration' , lambda a : a.cos ) ,
+    ( 'tous les champs' , lambda a : a.to_json_record( ) ) ,
+)
+
+count = count_argument( 50000 )
+cfg = make_config( )
+records = make_records( count )
+print( '{} comptes'.format( count ) )
+for fmt in ( 'json' , 'binary' ):
+    write_db( cfg , records , fmt )
+    ( full , lazy ) = ( Loader( cfg , False ) , Loader( cfg , True ) )
+    for label , access in ACCESSES:
+        assert full.load( access ) == lazy.load( access )
+        report( '{}, {}: complet'.format( fmt , label ) ,
+                best_of( lambda : full.load( access ) , 3 ) )
+        report( '{}, {}: vues'.format( fmt , label ) ,
+                best_of( lambda : lazy.load( access ) , 3 ) )
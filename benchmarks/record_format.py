@@ -0,0 +1,49 @@
+#!/usr/bin/python3
+"""
+Compare les formats d'enregistrement JSON et binaire: taille de la base, temps
+de décodage de l'ensemble des enregistrements, et temps de chargement de
+l'ensemble des comptes (lecture LMDB, décodage et création des instances
+SyncAccount, comme dans ProcessSkeleton.load_db).
+
+Usage: python3 benchmarks/record_format.py [nombre de comptes]
+"""
+from common import *
+
+from aolpsync.utils import record_dump , record_load
+
+
+def read_all_( cfg ):
+    with cfg.lmdb_env( ) as db:
+        with db.begin( write = False ) as txn:
+            return [ value for key , value in txn.cursor( ) ]
+
+def load_accounts_( cfg ):
+    accounts = {}
+    with cfg.lmdb_env( ) as db:
+        with db.begin( write = False ) as txn:
+            for key , value in txn.cursor( ):
+                account = SyncAccount( cfg ).from_json_record(
+                        record_load( value ) )
+                account.clear_empty_sets( )
+                accounts[ key ] = account
+    return accounts
+
+
+count = count_argument( 50000 )
+cfg = make_config( )
+records = make_records( count )
+print( '{} comptes'.format( count ) )
+for fmt in ( 'json' , 'binary' ):
+    size = write_db( cfg , records , fmt )
+    raw = read_all_( cfg )
+    decoded = [ record_load( r ) for r in raw ]
+    assert all( record_load( record_dump( d , fmt ) ) == d
+            for d in decoded )
+    report( '{}: taille des enregistrements'.format( fmt ) ,
+            size // 1024 , 'Kio' )
+    report( '{}: encodage'.format( fmt ) , best_of( lambda : [
+            record_dump( d , fmt ) for d in decoded ] ) )
+    report( '{}: décodage'.format( fmt ) ,
+            best_of( lambda : [ record_load( r ) for r in raw ] ) )
+    report( '{}: chargement des comptes'.format( fmt ) ,
+            best_of( lambda : load_accounts_( cfg ) ) )
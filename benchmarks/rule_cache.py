@@ -0,0 +1,46 @@
+#!/usr/bin/python3
+"""
+Mesure l'effet du cache des résultats des règles, indexé par les valeurs des
+attributs lus par chaque règle. Pour chaque règle, l'évaluation directe de la
+fonction compilée (Rule.evaluate) est comparée à l'évaluation via le cache,
+en partant d'un cache vide, pour plusieurs tailles de cache. Les règles que
+Rule ne juge pas assez coûteuses pour utiliser le cache sont mesurées avec un
+cache forcé, afin de vérifier ce choix.
+
+Usage: python3 benchmarks/rule_cache.py [nombre de comptes]
+"""
+from common import *
+
+from aolpsync.rules import Rule
+
+
+def run_( cfg , name , text , accounts ):
+    rule = Rule( name , text , cfg )
+    check = rule.check
+    if rule.cache_stats( ) is None:
+        check = rule.memoize_( cfg.rule_cache_size( ) )
+    result = [ check( a ) for a in accounts ]
+    return ( rule , result )
+
+
+count = count_argument( 50000 )
+cfg = make_config( )
+accounts = list( make_accounts( cfg , count ).values( ) )
+rules = [ ( name , rule.text )
+        for name , rule in cfg.parse_cos_rules( ).items( ) ] + list( RULES )
+print( '{} comptes'.format( count ) )
+for name , text in rules:
+    rule = Rule( name , text , cfg )
+    forced = ' (forcé)' if rule.cache_stats( ) is None else ''
+    expected = [ rule.evaluate( a ) for a in accounts ]
+    report( '{}: sans cache'.format( name ) , best_of(
+            lambda : [ rule.evaluate( a ) for a in accounts ] , 3 ) )
+    for size in ( 16 , Rule.CACHE_SIZE ):
+        scfg = make_config( '[rules]\ncache-size={}'.format( size ) )
+        ( cached , result ) = run_( scfg , name , text , accounts )
+        assert result == expected
+        ( hits , misses ) = cached.cache_stats( )
+        report( '{}: cache de {}{}'.format( name , size , forced ) ,
+                best_of( lambda : run_( scfg , name , text , accounts ) , 3 ) )
+        report( '{}: cache de {}, succès / échecs'.format( name , size ) ,
+                '{} / {}'.format( hits , misses ) , '' )
@@ -0,0 +1,50 @@
+#!/usr/bin/python3
+"""
+Compare l'évaluation des règles par l'arbre des vérificateurs produit par
+RuleParser et par la fonction compilée à partir de celui-ci (Rule.evaluate,
+sans cache des résultats): règles d'attribution des classes de service,
+appliquées compte par compte dans l'ordre de la configuration, règle de
+sélection des comptes et règles de droits d'accès aux calendriers.
+
+Usage: python3 benchmarks/rule_compile.py [nombre de comptes]
+"""
+from common import *
+
+from aolpsync.rules import Rule
+
+
+def assign_cos_( accounts , rules , check ):
+    result = []
+    for a in accounts:
+        for name , rule in rules:
+            if check( rule )( a ):
+                result.append( name )
+                break
+        else:
+            result.append( None )
+    return result
+
+
+count = count_argument( 50000 )
+cfg = make_config( )
+accounts = list( make_accounts( cfg , count ).values( ) )
+cos_rules = list( cfg.parse_cos_rules( ).items( ) )
+print( '{} comptes'.format( count ) )
+
+tree = lambda rule : rule.tree.check
+compiled = lambda rule : rule.evaluate
+assert assign_cos_( accounts , cos_rules , tree ) == assign_cos_(
+        accounts , cos_rules , compiled )
+report( 'classes de service: arbre' , best_of(
+        lambda : assign_cos_( accounts , cos_rules , tree ) , 3 ) )
+report( 'classes de service: compilée' , best_of(
+        lambda : assign_cos_( accounts , cos_rules , compiled ) , 3 ) )
+
+for name , text in RULES:
+    rule = Rule( name , text , cfg )
+    assert [ rule.tree.check( a ) for a in accounts ] == [
+            rule.evaluate( a ) for a in accounts ]
+    report( '{}: arbre'.format( name ) , best_of(
+            lambda : [ rule.tree.check( a ) for a in accounts ] , 3 ) )
+    report( '{}: compilée'.format( name ) , best_of(
+            lambda : [ rule.evaluate( a ) for a in accounts ] , 3 ) )
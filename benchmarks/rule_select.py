@@ -0,0 +1,77 @@
+#!/usr/bin/python3
+"""
+Compare l'évaluation des règles compte par compte (Rule.check) à leur
+évaluation sur l'ensemble des comptes au moyen d'index inversés (Rule.select
+sur un RuleIndex): attribution des classes de service, règle par règle dans
+l'ordre de la configuration comme dans LDAPData (avec les règles de la
+configuration, puis précédées de règles par groupe et fonction), puis règle
+de sélection et règles de droits d'accès aux calendriers. La construction
+de la table des comptes et des index est incluse dans les mesures.
+
+Usage: python3 benchmarks/rule_select.py [nombre de comptes]
+"""
+from common import *
+
+from aolpsync.rules import Rule , RuleIndex
+from aolpsync.table import AccountTable
+
+
+def cos_by_account_( accounts , rules ):
+    result = {}
+    for eppn , a in accounts.items( ):
+        for name , rule in rules.items( ):
+            if rule.check( a ):
+                result[ eppn ] = name
+                break
+    return result
+
+def cos_by_rule_( accounts , rules ):
+    fields = set( ).union( *( r.attributes for r in rules.values( ) ) )
+    index = RuleIndex( AccountTable( accounts , fields ) )
+    remaining = set( index.all )
+    result = {}
+    for name , rule in rules.items( ):
+        matched = rule.select( index ) & remaining
+        remaining -= matched
+        result.update( ( eppn , name ) for eppn in matched )
+    return result
+
+def by_account_( accounts , rule ):
+    return set([ eppn for eppn , a in accounts.items( ) if rule.check( a ) ])
+
+def by_rule_( accounts , rule ):
+    return rule.select( RuleIndex( AccountTable( accounts ,
+            rule.attributes ) ) )
+
+
+count = count_argument( 50000 )
+cfg = make_config( )
+accounts = make_accounts( cfg , count )
+cos_rules = cfg.parse_cos_rules( )
+print( '{} comptes'.format( count ) )
+
+many_rules = {}
+for group in GROUPS[ 3: ]:
+    for title in TITLES:
+        name = '{}-{}'.format( group , title )
+        many_rules[ name ] = Rule( name ,
+                '(and (contains groups {}) (eq title {}))'.format(
+                    group , title ) , cfg )
+many_rules.update( cos_rules )
+
+for rules in ( cos_rules , many_rules ):
+    assert cos_by_account_( accounts , rules ) == cos_by_rule_( accounts ,
+            rules )
+    label = 'classes de service ({} règles)'.format( len( rules ) )
+    report( '{}: compte par compte'.format( label ) , best_of(
+            lambda : cos_by_account_( accounts , rules ) , 3 ) )
+    report( '{}: index'.format( label ) , best_of(
+            lambda : cos_by_rule_( accounts , rules ) , 3 ) )
+
+for name , text in RULES:
+    rule = Rule( name , text , cfg )
+    assert by_account_( accounts , rule ) == by_rule_( accounts , rule )
+    report( '{}: compte par compte'.format( name ) , best_of(
+            lambda : by_account_( accounts , rule ) , 3 ) )
+    report( '{}: index'.format( name ) , best_of(
+            lambda : by_rule_( accounts , rule ) , 3 ) )
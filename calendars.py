@@ -8,6 +8,8 @@ from aolpsync import *
 
 class CalendarsSynchronizer( ProcessSkeleton ):
 
+    LAZY_DB = True
+
     def cli_description( self ):
         return '''Effectue la synchronisation des calendriers, si l'option
                   est activée dans la configuration.'''
@@ -514,19 +514,31 @@ class Consolidator( ProcessSkeleton ):
         self.checked = set( )
         self.results = dict( )
 
+        # Comparaisons entre les sources, effectuées en colonnes sur
+        # l'ensemble des comptes
+        ( ldap_t , db_t , bss_t ) = (
+                AccountTable( accounts , SyncAccount.STORAGE_ATTRS )
+                    for accounts in ( self.ldap_accounts ,
+                        self.db_accounts , self.bss_accounts ) )
+        bss_fields = ( ( 'mail' , 'markedForDeletion' , 'aliases' )
+                + SyncAccount.DETAILS )
+        db_bss_equal = db_t.equal_rows( bss_t , bss_fields )
+        ldap_bss_equal = ldap_t.equal_rows( bss_t , bss_fields )
+        db_ldap_equal = db_t.equal_rows( ldap_t , SyncAccount.STORAGE_ATTRS )
+
         def check_common_accounts_( eppn , ldap , db , bss ):
             """
             Vérification des comptes existants dans les 3 bases (cas 01, 11, 13,
             33, 34)
             """
-            if db.bss_equals( bss ):
-                if db == ldap:
+            if eppn in db_bss_equal:
+                if eppn in db_ldap_equal:
                     self.result( eppn , 1 )
                 elif db.markedForDeletion is None:
                     self.result( eppn , 11 )
                 else:
                     self.result( eppn , 13 )
-            elif db == ldap:
+            elif eppn in db_ldap_equal:
                 self.result( eppn , 33 )
             else:
                 self.result( eppn , 34 )
@@ -536,7 +548,7 @@ class Consolidator( ProcessSkeleton ):
             Vérification des comptes présents sur DB et BSS, mais pas en LDAP
             (cas 02, 12, 24, 31, 32, 35)
             """
-            if db.bss_equals( bss ):
+            if eppn in db_bss_equal:
                 if db.markedForDeletion is not None:
                     self.result( eppn , 2 )
                 else:
@@ -560,7 +572,7 @@ class Consolidator( ProcessSkeleton ):
             Vérification des comptes figurant dans le LDAP et dans le BSS, mais
             pas dans la base (cas 22, 30)
             """
-            if ldap.bss_equals( bss ):
+            if eppn in ldap_bss_equal:
                 opw = ldap.passwordHash
                 ldap.passwordHash = b'{SSHA}invalide'
                 self.save_account( ldap )
@@ -574,7 +586,7 @@ class Consolidator( ProcessSkeleton ):
             Vérification des comptes figurant dans le LDAP et la DB, mais pas
             sur le BSS. (cas 20, 21)
             """
-            if ldap == db:
+            if eppn in db_ldap_equal:
                 self.result( eppn , 20 )
             else:
                 self.result( eppn , 21 )
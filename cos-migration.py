@@ -12,6 +12,8 @@ class CosMigration( ProcessSkeleton ):
     des noms de classes de services.
     """
 
+    LAZY_DB = True
+
     def cli_description( self ):
         return '''Outil de dépannage permettant de modifier les noms des
                   classes de services dans la base de données intermédiaire.
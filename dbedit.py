@@ -12,6 +12,8 @@ class DbEditor( ProcessSkeleton ):
     la base de données de synchronisation.
     """
 
+    LDAP_SNAPSHOT = True
+
     def cli_description( self ):
         return '''Outil de dépannage permettant de modifier la base de données
                   de synchronisation. Il est possible d'éditer les champs
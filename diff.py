@@ -216,6 +216,8 @@ class DiffViewer( ProcessSkeleton ):
     différences entre les diverses sources de données.
     """
 
+    LDAP_SNAPSHOT = True
+
     def cli_description( self ):
         return '''Outil de diagnostic qui affiche les différences trouvées entre
                   les entrées du LDAP, de la base de synchronisation et de l'API
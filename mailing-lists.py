@@ -103,7 +103,7 @@ class MailingListSynchronizer( ProcessSkeleton ):
                     value = addr_fixer( value )
                 else:
                     value = '{}@{}'.format( value , bss_dom )
-                data[ 'aliases' ].add( value )
+                data[ 'aliases' ].add( self.address( value ) )
             # Expéditeurs autorisés
             elif name == 'sender':
                 value = value.lower( )
@@ -125,6 +125,8 @@ class MailingListSynchronizer( ProcessSkeleton ):
                     value = '{}@{}'.format( value , bss_dom )
                 if value in self.address_map:
                     value = self.address_map[ value ]
+                else:
+                    value = self.address( value )
                 data[ 'members' ].add( value )
             # Drapeaux
             elif name == 'partage-group':
@@ -303,16 +305,20 @@ class MailingListSynchronizer( ProcessSkeleton ):
         distribution en comparant le contenu de la base de synchronisation et
         les données envoyées par le serveur Sympa.
         """
+        # Les adresses, EPPN et membres de listes sont remplacés par leurs
+        # instances enregistrées
+        self.address = self.cfg.address_registry( ).address
         self.address_map = {}
         for eppn in self.db_accounts:
             acc = self.db_accounts[ eppn ]
             if acc.markedForDeletion is not None:
                 continue
+            eppn = self.address( eppn )
             self.address_map[ eppn ] = eppn
             if acc.aliases is None:
                 continue
             for alias in acc.aliases:
-                self.address_map[ alias ] = eppn
+                self.address_map[ self.address( alias ) ] = eppn
 
         import csv
         reader = csv.reader( self.get_ml_data_( ) , delimiter = ',' ,
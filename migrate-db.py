@@ -0,0 +1,90 @@
+#!/usr/bin/python3
+
+from aolpsync import *
+
+
+#-------------------------------------------------------------------------------
+
+
+class DbMigration( ProcessSkeleton ):
+    """
+    Outil permettant de convertir l'ensemble des enregistrements de la base de
+    données vers un format d'enregistrement donné.
+    """
+
+    def cli_description( self ):
+        return '''Convertit tous les enregistrements de la base de données
+                  intermédiaire (comptes, informations supplémentaires et cache
+                  LDAP) vers le format d'enregistrement configuré ou spécifié.
+                  Les enregistrements déjà au bon format ne sont pas
+                  modifiés.'''
+
+    def cli_register_arguments( self , parser ):
+        parser.add_argument( '--format' , '-F' ,
+                action = 'store' ,
+                choices = aolputils.RECORD_FORMATS ,
+                help = '''Le format cible. Par défaut, le format configuré
+                          (option record-format de la section db) est
+                          utilisé.''' )
+
+    #---------------------------------------------------------------------------
+
+    def __init__( self ):
+        ProcessSkeleton.__init__( self ,
+                require_bss = False ,
+                require_cos = False ,
+                require_ldap = False )
+
+    def load_db( self , txn ):
+        """
+        Les enregistrements sont relus par process(), ils ne sont donc pas
+        chargés ici.
+        """
+        pass
+
+    def process( self ):
+        """
+        Relit chaque enregistrement de la base de données et le réécrit dans le
+        format cible s'il est différent. La conversion s'effectue au sein d'une
+        unique transaction.
+        """
+        fmt = self.arguments.format
+        if fmt is None:
+            fmt = aolputils.record_format( self.cfg )
+        sim = self.cfg.has_flag( 'bss' , 'simulate' )
+        Logging( 'db' ).info( 'Conversion {}vers le format {}'.format(
+                'simulée ' if sim else '' , fmt ) )
+
+        total = 0
+        with self.db.begin( write = not sim ) as txn:
+            converted = []
+            with txn.cursor( ) as cursor:
+                for key , value in cursor:
+                    total += 1
+                    binary = value.startswith( aolputils.RECORD_MAGIC )
+                    if binary == ( fmt == 'binary' ):
+                        continue
+                    try:
+                        data = aolputils.record_load( value )
+                    except ValueError as e:
+                        raise FatalError( 'Enregistrement {} illisible: {}'
+                                .format( key.decode( 'utf-8' ) , str( e ) ) )
+                    converted.append( ( key ,
+                            aolputils.record_dump( data , fmt ) ) )
+            if not sim:
+                for key , value in converted:
+                    txn.put( key , value )
+        Logging( 'db' ).info( '{} enregistrement(s) sur {} converti(s)'.format(
+                len( converted ) , total ) )
+
+
+#-------------------------------------------------------------------------------
+
+
+try:
+    DbMigration( )
+except FatalError as e:
+    import sys
+    Logging( ).critical( str( e ) )
+    print( "ERREUR: {}".format( str( e ) ) )
+    sys.exit( 1 )
@@ -13,6 +13,8 @@ class Provisioner( ProcessSkeleton ):
     intermédiaire.
     """
 
+    LDAP_SNAPSHOT = True
+
     def cli_description( self ):
         return '''Génère le fichier LDIF de provisioning ainsi qu'un fichier
                   JSON qui servira ensuite à alimenter la base de données.'''
@@ -244,10 +246,22 @@ class Provisioner( ProcessSkeleton ):
         else:
             self.redirects = { }
         if self.arguments.uid:
-            self.ldap_query = ( '(&' + ''.join(
+            self.ldap_query = ( '(|' + ''.join(
                     '(uid={})'.format( uid ) for uid in self.arguments.uid
                 ) + ')' )
 
+    def init( self ):
+        """
+        Si des UID ont été spécifiés, élimine les autres comptes; cela n'est
+        nécessaire que lorsque les comptes ont été lus depuis l'instantané.
+        """
+        if not self.arguments.uid:
+            return
+        uids = set( self.arguments.uid )
+        self.ldap_accounts = { eppn : account
+                for eppn , account in self.ldap_accounts.items( )
+                if account.uid in uids }
+
     def process( self ):
         """
         Génère les données LDIF et JSON puis les écrit dans leurs fichiers
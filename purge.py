@@ -12,6 +12,8 @@ class Deleter( ProcessSkeleton ):
     marqués comme pré-supprimés.
     """
 
+    LAZY_DB = True
+
     def __init__( self ):
         ProcessSkeleton.__init__( self ,
                 require_ldap = False ,
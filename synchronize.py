@@ -15,6 +15,23 @@ class Synchronizer( ProcessSkeleton ):
         return '''Éffectue la synchronisation depuis l'annuaire LDAP vers le
                   serveur de Partage.'''
 
+    def cli_register_arguments( self , parser ):
+        parser.add_argument( '--listen' ,
+                action = 'store_true' ,
+                help = '''Après la synchronisation, surveille les
+                          modifications de l'annuaire et synchronise les
+                          comptes modifiés au fur et à mesure.''' )
+
+    def preinit( self ):
+        """
+        Mémorise la date de début du chargement depuis l'annuaire; si la
+        surveillance est demandée, les modifications seront détectées à partir
+        de celle-ci.
+        """
+        from datetime import datetime , timezone
+        self.listen_since = datetime.now( timezone.utc ).replace(
+                tzinfo = None )
+
     def add_aliases( self , account , aliases ):
         """
         Enregistre de nouveaux aliases pour un compte Partage, en synchronisant
@@ -36,6 +53,7 @@ class Synchronizer( ProcessSkeleton ):
                     alias , account.mail ) )
             if BSSAction( 'addAccountAlias' , account.mail , alias ):
                 account.aliases.add( alias )
+                account.reset_fingerprint( )
                 self.save_account( account )
                 continue
             Logging( ).error(
@@ -61,6 +79,7 @@ class Synchronizer( ProcessSkeleton ):
                     alias , account.mail ) )
             if BSSAction( 'removeAccountAlias' , account.mail , alias ):
                 account.aliases.remove( alias )
+                account.reset_fingerprint( )
                 self.save_account( account )
                 continue
             Logging( ).error(
@@ -114,6 +133,7 @@ class Synchronizer( ProcessSkeleton ):
         Logging( ).info( 'Réactivation du compte {}'.format( dba.mail ) )
         if BSSAction( 'activateAccount' , dba.mail ):
             dba.markedForDeletion = None
+            dba.reset_fingerprint( )
             return True
         Logging( ).error( 'Impossible de réactiver le compte {}'.format(
                 dba.mail ) )
@@ -253,6 +273,7 @@ class Synchronizer( ProcessSkeleton ):
         # Puis on le renomme
         import time
         dba.markedForDeletion = int( time.time( ) )
+        dba.reset_fingerprint( )
         del_addr = 'del-{}-{}'.format( dba.markedForDeletion , dba.mail )
         if not BSSAction( 'renameAccount' , dba.mail , del_addr ):
             Logging( ).error( 'Compte {}: impossible de renommer en {}'.format(
@@ -289,41 +310,15 @@ class Synchronizer( ProcessSkeleton ):
         Logging( ).debug(
                 '{} comptes communs entre la BDD et l\'annuaire'.format(
                     len( common ) ) )
-        updated = set([ a for a in common
-                if self.ldap_accounts[ a ] != self.db_accounts[ a ] ])
+        updated = { }
+        for a in common:
+            changes = self.ldap_accounts[ a ].diff( self.db_accounts[ a ] )
+            if changes:
+                updated[ a ] = changes
         Logging( ).info( '{} compte(s) à mettre à jour'.format(
                 len( updated ) ) )
-        ops = ( 'undelete' , 'rename' , 'password_change' , 'details' ,
-                'alias_changes' )
-        d = self.__class__.__dict__
         for eppn in updated:
-            failed = False
-            for op in ops:
-                failed = not d[ 'check_' + op ].__call__( self , eppn )
-                if failed: break
-
-            # Si le compte était marqué à modifier car les groupes diffèraient
-            # mais que cette différence ne provoquait aucune modification chez
-            # Partage, il resterait "à modifier". On le re-sauvegarde donc en
-            # copiant les groupes depuis l'enregistrement LDAP. Le même principe
-            # est également appliqué aux attributs supplémentaires et à
-            # ldapMail.
-            if failed: continue
-            acc_ldap = self.ldap_accounts[ eppn ]
-            acc_db = self.db_accounts[ eppn ]
-            has_changed = False
-            ns_attrs = [ ea
-                    for ea , v in self.cfg.get_section(
-                            'extra-attributes' , True ).items( )
-                    if v != 'once' ]
-            ns_attrs += ( 'groups' , 'ldapMail' )
-            for ea in ns_attrs:
-                ldap_val = getattr( acc_ldap , ea )
-                if ldap_val != getattr( acc_db , ea ):
-                    setattr( acc_db , ea , ldap_val )
-                    has_changed = True
-            if has_changed:
-                self.save_account( acc_db )
+            self.update_account( eppn , updated[ eppn ] )
 
         # (Pré-)suppressions de comptes
         db_only = sdba - sla
@@ -336,6 +331,80 @@ class Synchronizer( ProcessSkeleton ):
         for eppn in deleted:
             self.pre_delete( eppn )
 
+        LDAPSnapshot.save( self.cfg , self.ldap_accounts )
+        if self.arguments.listen:
+            self.listen( )
+
+    def update_account( self , eppn , changes = None ):
+        """
+        Applique la séquence de mise à jour à un compte présent à la fois dans
+        la base de données et dans l'annuaire. Seules les étapes
+        correspondant aux groupes de champs modifiés sont exécutées.
+
+        :param str eppn: l'EPPN du compte à mettre à jour
+        :param changes: l'ensemble des groupes de champs modifiés, tel que \
+                renvoyé par SyncAccount.diff(), ou None pour exécuter toutes \
+                les étapes
+        """
+        ops = ( ( 'undelete' , 'identity' ) , ( 'rename' , 'mail' ) ,
+                ( 'password_change' , 'password' ) , ( 'details' , 'details' ) ,
+                ( 'alias_changes' , 'aliases' ) )
+        d = self.__class__.__dict__
+        for op , group in ops:
+            if changes is not None and group not in changes:
+                continue
+            if not d[ 'check_' + op ].__call__( self , eppn ):
+                return
+        if changes is not None and 'extra' not in changes:
+            return
+
+        # Si le compte était marqué à modifier car les groupes diffèraient
+        # mais que cette différence ne provoquait aucune modification chez
+        # Partage, il resterait "à modifier". On le re-sauvegarde donc en
+        # copiant les groupes depuis l'enregistrement LDAP. Le même principe
+        # est également appliqué aux attributs supplémentaires et à
+        # ldapMail.
+        acc_ldap = self.ldap_accounts[ eppn ]
+        acc_db = self.db_accounts[ eppn ]
+        has_changed = False
+        ns_attrs = [ ea
+                for ea , v in self.cfg.get_section(
+                        'extra-attributes' , True ).items( )
+                if v != 'once' ]
+        ns_attrs += ( 'groups' , 'ldapMail' )
+        for ea in ns_attrs:
+            ldap_val = getattr( acc_ldap , ea )
+            if ldap_val != getattr( acc_db , ea ):
+                setattr( acc_db , ea , ldap_val )
+                has_changed = True
+        if has_changed:
+            self.save_account( acc_db )
+
+    def listen( self ):
+        """
+        Surveille les modifications de l'annuaire LDAP pendant la durée
+        configurée, à partir du début du chargement initial. Pour chaque lot
+        de modifications, les comptes concernés sont relus et intégrés aux
+        comptes du chargement initial (voir reload_from_ldap()), puis les
+        comptes relus ou dont les aliases ont changé sont créés ou mis à jour.
+        Les suppressions et les modifications de groupes ne sont prises en
+        compte que lors de la synchronisation complète suivante.
+        """
+        from ldap3.utils.conv import escape_filter_chars
+        listener = LDAPListener( self.cfg , self.listen_since )
+        for uids in listener.changes( ):
+            query = '(|{})'.format( ''.join([
+                    '(uid={})'.format( escape_filter_chars( uid ) )
+                        for uid in sorted( uids ) ]) )
+            for eppn in self.reload_from_ldap( query ):
+                if eppn not in self.db_accounts:
+                    self.check_new_account( eppn )
+                else:
+                    changes = self.ldap_accounts[ eppn ].diff(
+                            self.db_accounts[ eppn ] )
+                    if changes:
+                        self.update_account( eppn , changes )
+
     def postprocess( self ):
         """
         Si des comptes ont été créés sur le serveur, tente d'ajouter les emplois
@@ -0,0 +1,133 @@
+"""
+Configuration commune des tests. Les tests n'accèdent ni à l'annuaire ni à
+l'API de Partage; la configuration et la base de données sont créées dans un
+répertoire temporaire.
+
+La liste des attributs de SyncAccount étant initialisée une seule fois par
+processus, tous les tests partagent la même configuration.
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+if ROOT not in sys.path:
+    sys.path.insert( 0 , ROOT )
+
+CONFIG = '''
+[ldap]
+host=localhost
+user=cn=admin,dc=univ-test,dc=fr
+pass=x
+people-dn=ou=people,dc=univ-test,dc=fr
+groups-dn=ou=groups,dc=univ-test,dc=fr
+mail-domain=univ-test.fr
+eppn-domain=univ-test.fr
+
+[db]
+path={path}
+
+[bss]
+domain=univ-test.fr
+token=x
+default-cos=default
+deletion-threshold=5
+
+[ldap-people-classes]
+inetOrgPerson
+
+[ldap-group-classes]
+groupOfNames = member
+
+[cos-rules]
+staff = (contains groups staff)
+student = (contains groups students)
+
+[extra-attributes]
+title
+affiliation
+site
+
+[ldap-extra-attributes]
+title=title
+affiliation=eduPersonPrimaryAffiliation
+site=l
+'''
+
+
+@pytest.fixture( scope = 'session' )
+def cfg( tmp_path_factory ):
+    """
+    La configuration utilisée par les tests.
+    """
+    from aolpsync.configuration import Config
+    from aolpsync.account import SyncAccount
+    tmp = tmp_path_factory.mktemp( 'psync' )
+    path = tmp / 'partage-sync.ini'
+    path.write_text( CONFIG.format( path = tmp / 'db' ) )
+    Config.FILE_NAME = str( path )
+    config = Config( )
+    SyncAccount( config )
+    return config
+
+
+@pytest.fixture
+def make_account( cfg ):
+    """
+    Renvoie une fonction créant un compte de synchronisation à partir d'un
+    dictionnaire d'attributs, qui est copié.
+    """
+    import copy
+    from aolpsync.account import SyncAccount
+    def make_account_( **attrs ):
+        account = SyncAccount( cfg ).from_json_record( copy.deepcopy( attrs ) )
+        account.clear_empty_sets( )
+        return account
+    return make_account_
+
+
+# Valeurs utilisées pour générer les populations de comptes
+GROUPS = ( 'staff' , 'students' , 'faculty' , 'admins' , 'guests' )
+TITLES = ( 'Enseignant' , 'Etudiant' , 'Technicien' , 'Chercheur' )
+AFFILIATIONS = ( 'staff' , 'student' , 'faculty' )
+DOMAINS = ( 'univ-test.fr' , 'etu.univ-test.fr' , 'labo.univ-test.fr' )
+
+
+@pytest.fixture( scope = 'session' )
+def population( cfg ):
+    """
+    Une population de comptes générés aléatoirement (avec une graine fixe),
+    indexée par EPPN. Les attributs prennent toutes les formes rencontrées
+    dans les comptes réels: valeur absente, chaîne, ensemble d'une ou
+    plusieurs valeurs, liste.
+    """
+    import random
+    from aolpsync.account import SyncAccount
+    rnd = random.Random( 1 )
+    def maybe_( value ):
+        return value if rnd.random( ) < .8 else None
+    accounts = {}
+    for i in range( 400 ):
+        uid = 'u{:04d}'.format( i )
+        groups = set( rnd.sample( GROUPS , rnd.randrange( len( GROUPS ) ) ) )
+        if rnd.random( ) < .1:
+            groups = sorted( groups )
+        mails = set([ '{}.{}@{}'.format( uid , j , rnd.choice( DOMAINS ) )
+                for j in range( rnd.randrange( 3 ) ) ])
+        if len( mails ) == 1 and rnd.random( ) < .5:
+            mails = mails.pop( )
+        record = {
+            'uid' : uid ,
+            'eppn' : '{}@univ-test.fr'.format( uid ) ,
+            'mail' : '{}@{}'.format( uid , rnd.choice( DOMAINS ) ) ,
+            'ldapMail' : mails ,
+            'groups' : groups ,
+            'title' : maybe_( rnd.choice( TITLES ) ) ,
+            'affiliation' : maybe_( rnd.choice( AFFILIATIONS ) ) ,
+            'site' : maybe_( 'site{}'.format( rnd.randrange( 20 ) ) ) ,
+        }
+        account = SyncAccount( cfg ).from_json_record( record )
+        account.clear_empty_sets( )
+        accounts[ account.eppn ] = account
+    return accounts
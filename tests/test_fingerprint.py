@@ -0,0 +1,84 @@
+"""
+Tests des empreintes des comptes de synchronisation.
+"""
+from aolpsync.account import SyncAccount
+
+
+BASE = {
+    'uid' : 'a' ,
+    'eppn' : 'a@univ-test.fr' ,
+    'mail' : 'a@univ-test.fr' ,
+    'surname' : 'Nom' ,
+    'givenName' : 'Prénom' ,
+    'groups' : { 'staff' , 'faculty' } ,
+}
+
+
+def test_equal_accounts_have_equal_fingerprints( make_account ):
+    a = make_account( **BASE )
+    b = make_account( **dict( BASE , groups = { 'faculty' , 'staff' } ) )
+    assert a.fingerprint( ) == b.fingerprint( )
+    assert a == b
+    assert not a.diff( b )
+
+def test_fingerprint_canonical_forms( make_account ):
+    a = make_account( **dict( BASE , aliases = { 'x@univ-test.fr' } ) )
+    b = make_account( **dict( BASE , aliases = 'x@univ-test.fr' ) )
+    assert a.fingerprint( ) == b.fingerprint( )
+    c = make_account( **dict( BASE , ldapMail = [ ] , title = None ) )
+    c.aliases = set( )
+    d = make_account( **BASE )
+    assert c.fingerprint( ) == d.fingerprint( )
+
+def test_different_accounts_have_different_fingerprints( make_account ):
+    a = make_account( **BASE )
+    for attr , value in ( ( 'mail' , 'b@univ-test.fr' ) ,
+            ( 'groups' , { 'staff' } ) , ( 'title' , 'Chercheur' ) ,
+            ( 'markedForDeletion' , 1700000000 ) ):
+        b = make_account( **dict( BASE , **{ attr : value } ) )
+        assert a.fingerprint( ) != b.fingerprint( ) , attr
+        assert a != b , attr
+
+def test_assignment_invalidates_the_fingerprint( make_account ):
+    a = make_account( **BASE )
+    before = a.fingerprint( )
+    a.mail = 'other@univ-test.fr'
+    assert a.fingerprint_ is None
+    assert a.fingerprint( ) == a.compute_fingerprint( ) != before
+
+def test_in_place_changes_require_a_reset( make_account ):
+    a = make_account( **BASE )
+    before = a.fingerprint( )
+    a.groups.add( 'admins' )
+    assert a.fingerprint( ) == before
+    a.reset_fingerprint( )
+    assert a.fingerprint( ) != before
+    a.add_group( 'library' )
+    assert a.fingerprint( ) == a.compute_fingerprint( )
+
+def test_copy_details_invalidates_the_fingerprint( make_account ):
+    a = make_account( **BASE )
+    b = make_account( **dict( BASE , surname = 'Autre' ) )
+    a.fingerprint( )
+    a.copy_details_from( b )
+    assert a.fingerprint( ) == b.fingerprint( )
+
+def test_stored_fingerprint_is_reused( cfg , make_account ):
+    a = make_account( **BASE )
+    record = a.to_json_record( )
+    record[ '__fp__' ] = a.compute_fingerprint( )
+    b = make_account( **record )
+    assert b.fingerprint_ == record[ '__fp__' ]
+    assert b == a
+
+    # L'empreinte n'est lue que depuis les enregistrements de la base
+    c = SyncAccount( cfg ).from_json_record( record , all_fields = True )
+    assert c.fingerprint_ is None
+
+def test_mismatched_fingerprints_fall_back_to_field_comparison(
+        make_account ):
+    a = make_account( **BASE )
+    b = make_account( **dict( BASE , __fp__ = 'stale' ) )
+    assert a.fingerprint( ) != b.fingerprint( )
+    assert a == b
+    assert a.diff( b ) == set( )
@@ -0,0 +1,125 @@
+"""
+Tests du calcul des groupes imbriqués (LDAPData.group_closure), en
+particulier sur des graphes d'appartenance comportant des cycles.
+"""
+import itertools
+import random
+
+import pytest
+
+from aolpsync.account import LDAPData
+
+
+def parents_( graph ):
+    """
+    Renvoie une fonction donnant les parents d'un groupe dans un graphe
+    décrit par un dictionnaire, et la liste des DN qui lui ont été passés.
+    """
+    calls = []
+    def parents( dn ):
+        calls.append( dn )
+        return graph.get( dn , [ ] )
+    return ( parents , calls )
+
+def reference_( graph , dn ):
+    """
+    Calcule la fermeture d'un groupe par un simple parcours en largeur.
+    """
+    lowered = { k.lower( ) : v for k , v in graph.items( ) }
+    found = { dn.lower( ) : dn }
+    todo = [ dn ]
+    while todo:
+        for parent in lowered.get( todo.pop( ).lower( ) , [ ] ):
+            if parent.lower( ) not in found:
+                found[ parent.lower( ) ] = parent
+                todo.append( parent )
+    return set( found )
+
+def closures_( graph , order ):
+    ( parents , _ ) = parents_( graph )
+    closures = {}
+    return { dn : set( g.lower( ) for g in
+            LDAPData.group_closure( dn , closures , parents ) )
+        for dn in order }
+
+
+# Graphes de test; les arcs vont d'un groupe vers les groupes dont il est
+# membre.
+GRAPHS = {
+    'cycle' : {
+        'a' : [ 'b' ] , 'b' : [ 'a' ] ,
+    } ,
+    'self-loop' : {
+        'a' : [ 'a' , 'b' ] , 'b' : [ ] ,
+    } ,
+    'cycle-with-tails' : {
+        't' : [ 'a' ] , 'a' : [ 'b' ] , 'b' : [ 'c' , 'e' ] , 'c' : [ 'a' ] ,
+        'e' : [ 'f' ] , 'f' : [ ] ,
+    } ,
+    'nested-cycles' : {
+        'a' : [ 'b' ] , 'b' : [ 'c' , 'a' ] , 'c' : [ 'd' ] ,
+        'd' : [ 'b' , 'e' ] , 'e' : [ 'f' ] , 'f' : [ 'e' ] ,
+    } ,
+    'chained-cycles' : {
+        'a' : [ 'b' ] , 'b' : [ 'a' , 'c' ] , 'c' : [ 'd' ] , 'd' : [ 'c' ] ,
+        'x' : [ 'c' , 'a' ] ,
+    } ,
+}
+
+
+#-------------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize( 'name' , GRAPHS )
+def test_closures_match_a_plain_traversal( name ):
+    graph = GRAPHS[ name ]
+    for order in itertools.permutations( graph ):
+        result = closures_( graph , order )
+        for dn in graph:
+            assert result[ dn ] == reference_( graph , dn ) , ( order , dn )
+
+@pytest.mark.parametrize( 'seed' , range( 20 ) )
+def test_random_graphs( seed ):
+    rnd = random.Random( seed )
+    nodes = [ 'cn=g{},ou=groups'.format( i ) for i in range( 30 ) ]
+    graph = { dn : rnd.sample( nodes , rnd.randrange( 3 ) )
+            for dn in nodes }
+    for _ in range( 3 ):
+        order = list( nodes )
+        rnd.shuffle( order )
+        result = closures_( graph , order )
+        for dn in nodes:
+            assert result[ dn ] == reference_( graph , dn ) , dn
+
+def test_cycle_members_share_their_closure( ):
+    graph = GRAPHS[ 'nested-cycles' ]
+    ( parents , _ ) = parents_( graph )
+    closures = {}
+    LDAPData.group_closure( 'a' , closures , parents )
+    assert closures[ 'a' ] is closures[ 'b' ] is closures[ 'c' ] \
+            is closures[ 'd' ]
+    assert closures[ 'e' ] is closures[ 'f' ]
+    assert closures[ 'e' ] == { 'e' , 'f' }
+
+def test_groups_are_visited_once( ):
+    graph = GRAPHS[ 'chained-cycles' ]
+    ( parents , calls ) = parents_( graph )
+    closures = {}
+    for dn in ( 'x' , 'a' , 'b' , 'c' , 'd' , 'x' ):
+        LDAPData.group_closure( dn , closures , parents )
+    assert sorted( calls ) == sorted( graph )
+
+def test_dns_are_case_insensitive( ):
+    graph = {
+        'cn=A,ou=groups' : [ 'CN=B,ou=groups' ] ,
+        'CN=B,ou=groups' : [ 'cn=a,OU=GROUPS' , 'cn=C,ou=groups' ] ,
+        'cn=C,ou=groups' : [ ] ,
+    }
+    lowered = { k.lower( ) : v for k , v in graph.items( ) }
+    parents = lambda dn : lowered[ dn.lower( ) ]
+    closures = {}
+    result = LDAPData.group_closure( 'cn=a,ou=groups' , closures , parents )
+    assert set( g.lower( ) for g in result ) == {
+            'cn=a,ou=groups' , 'cn=b,ou=groups' , 'cn=c,ou=groups' }
+    assert set( closures ) == set( g.lower( ) for g in graph )
+    assert len( result ) == 3
@@ -0,0 +1,123 @@
+"""
+Tests du cache utilisé par le chargement incrémental (LDAPCache).
+"""
+from datetime import datetime , timedelta , timezone
+
+import pytest
+
+from aolpsync.ldapcache import LDAPCache
+
+
+@pytest.fixture
+def empty_db( cfg ):
+    """
+    Vide la base de données avant le test.
+    """
+    with cfg.lmdb_env( ) as db:
+        with db.begin( write = True ) as txn:
+            txn.drop( db.open_db( ) , delete = False )
+    return cfg
+
+def read_cache_( cfg ):
+    cache = LDAPCache( cfg )
+    cache.read_( )
+    return cache
+
+
+#-------------------------------------------------------------------------------
+
+
+def test_update_keeps_the_latest_utc_timestamp( cfg ):
+    cache = LDAPCache( cfg )
+    paris = timezone( timedelta( hours = 1 ) )
+    cache.update( 'uid=a' , 'a' , None ,
+            datetime( 2024 , 3 , 1 , 13 , 0 , 0 , tzinfo = paris ) )
+    assert cache.timestamp == '20240301120000Z'
+    cache.update( 'uid=b' , 'b' , None , '20240201000000.5Z' )
+    assert cache.timestamp == '20240301120000Z'
+    cache.update( 'uid=c' , 'c' , None , '20240302000000Z' )
+    assert cache.timestamp == '20240302000000Z'
+    cache.update( 'uid=d' , 'd' , None , None )
+    assert cache.timestamp == '20240302000000Z'
+    assert cache.updated == { 'uid=a' , 'uid=b' , 'uid=c' , 'uid=d' }
+
+def test_query_subtracts_the_overlap( cfg ):
+    cache = LDAPCache( cfg )
+    cache.full = False
+    cache.timestamp = '20240301120000Z'
+    cache.overlap = 600
+    assert cache.query( ) == '(modifyTimestamp>=20240301115000Z)'
+
+def test_missing_cache_requires_a_full_load( empty_db ):
+    cache = read_cache_( empty_db )
+    assert cache.full
+    assert cache.entries == {}
+
+def test_saved_entries_are_reloaded( empty_db , make_account ):
+    cfg = empty_db
+    cache = LDAPCache( cfg )
+    account = make_account( uid = 'a' , eppn = 'a@univ-test.fr' ,
+            mail = 'a@univ-test.fr' , groups = [ 'staff' ] )
+    cache.update( 'uid=a' , 'a' , account , '20240301120000Z' ,
+            member_of = [ 'cn=staff' ] )
+    cache.update( 'uid=b' , 'b' , None , '20240301110000Z' )
+    cache.save( )
+
+    cache = read_cache_( cfg )
+    assert not cache.full
+    assert cache.timestamp == '20240301120000Z'
+    assert set( cache.entries ) == { 'uid=a' , 'uid=b' }
+    ( uids , accounts , memberships ) = cache.accounts( )
+    assert uids == { 'a' , 'b' }
+    assert set( accounts ) == { 'a@univ-test.fr' }
+    assert accounts[ 'a@univ-test.fr' ] == account
+    assert memberships == { 'a' : [ 'cn=staff' ] }
+
+def test_incremental_save_keeps_other_entries( empty_db ):
+    cfg = empty_db
+    cache = LDAPCache( cfg )
+    cache.update( 'uid=a' , 'a' , None , '20240301120000Z' )
+    cache.update( 'uid=b' , 'b' , None , '20240301120000Z' )
+    cache.save( )
+
+    cache = read_cache_( cfg )
+    cache.update( 'uid=b' , 'b2' , None , '20240302000000Z' )
+    cache.save( )
+
+    cache = read_cache_( cfg )
+    assert not cache.full
+    assert cache.timestamp == '20240302000000Z'
+    assert { dn : e[ 'uid' ] for dn , e in cache.entries.items( ) } == {
+            'uid=a' : 'a' , 'uid=b' : 'b2' }
+
+def test_expired_cache_requires_a_full_load( empty_db ):
+    cfg = empty_db
+    cache = LDAPCache( cfg )
+    cache.update( 'uid=a' , 'a' , None , '20240301120000Z' )
+    cache.save( )
+
+    cache = LDAPCache( cfg )
+    cache.interval = 0
+    cache.read_( )
+    assert cache.full
+    assert cache.entries == {}
+
+def test_unreadable_cache_requires_a_full_load( empty_db ):
+    from aolpsync.utils import RECORD_MAGIC , RECORD_VERSION
+    cfg = empty_db
+    cache = LDAPCache( cfg )
+    cache.update( 'uid=a' , 'a' , None , '20240301120000Z' )
+    cache.save( )
+    with cfg.lmdb_env( ) as db:
+        with db.begin( write = True ) as txn:
+            txn.put( LDAPCache.DB_PREFIX + b'uid=b' ,
+                    RECORD_MAGIC + bytes(( RECORD_VERSION - 1 , )) )
+
+    cache = read_cache_( cfg )
+    assert cache.full
+    assert cache.entries == {}
+    cache.update( 'uid=a' , 'a' , None , '20240302000000Z' )
+    cache.save( )
+    cache = read_cache_( cfg )
+    assert not cache.full
+    assert set( cache.entries ) == { 'uid=a' }
@@ -0,0 +1,182 @@
+"""
+Tests de la surveillance des modifications de l'annuaire (LDAPListener).
+"""
+from datetime import datetime
+
+import ldap3
+import pytest
+from pyasn1.codec.ber import decoder , encoder
+from ldap3.protocol.persistentSearch import EntryChangeNotificationControl
+from ldap3.protocol.rfc4511 import ( LDAPMessage , MessageID , ProtocolOp ,
+        SearchResultEntry , LDAPDN , PartialAttributeList , PartialAttribute ,
+        AttributeDescription , Vals , AttributeValue , Controls , Control ,
+        LDAPOID , Criticality , ControlValue )
+
+from aolpsync.listener import LDAPListener
+
+
+PEOPLE = 'ou=people,dc=univ-test,dc=fr'
+MESSAGE_ID = 7
+
+
+def notification_( uid , change , previous = None ):
+    """
+    Encode en BER une notification de recherche persistante, telle qu'envoyée
+    par le serveur: une entrée portant le contrôle EntryChangeNotification.
+    """
+    ecn = EntryChangeNotificationControl( )
+    ecn.setComponentByName( 'changeType' , change )
+    if previous is not None:
+        ecn.setComponentByName( 'previousDN' , previous )
+    vals = Vals( )
+    vals.setComponentByPosition( 0 , AttributeValue( uid ) )
+    attribute = PartialAttribute( )
+    attribute[ 'type' ] = AttributeDescription( 'uid' )
+    attribute[ 'vals' ] = vals
+    attributes = PartialAttributeList( )
+    attributes.setComponentByPosition( 0 , attribute )
+    entry = SearchResultEntry( )
+    entry[ 'object' ] = LDAPDN( 'uid={},{}'.format( uid , PEOPLE ) )
+    entry[ 'attributes' ] = attributes
+    op = ProtocolOp( )
+    op.setComponentByName( 'searchResEntry' , entry )
+    control = Control( )
+    control[ 'controlType' ] = LDAPOID( LDAPListener.ECN_OID )
+    control[ 'criticality' ] = Criticality( False )
+    control[ 'controlValue' ] = ControlValue( encoder.encode( ecn ) )
+    controls = Controls( )
+    controls.setComponentByPosition( 0 , control )
+    message = LDAPMessage( )
+    message[ 'messageID' ] = MessageID( MESSAGE_ID )
+    message[ 'protocolOp' ] = op
+    message[ 'controls' ] = controls
+    return encoder.encode( message )
+
+def stream_connection_( ):
+    return ldap3.Connection( ldap3.Server( 'localhost' ) ,
+            client_strategy = ldap3.ASYNC_STREAM )
+
+def decoded_event_( uid , change , previous = None ):
+    """
+    Décode une notification au moyen d'ldap3, sans traitement par la
+    recherche persistante: le contrôle reste dans les contrôles de
+    l'événement, avec sa valeur brute.
+    """
+    conn = stream_connection_( )
+    ( message , _ ) = decoder.decode( notification_( uid , change , previous ) ,
+            asn1Spec = LDAPMessage( ) )
+    return conn.strategy.decode_response( message )
+
+def queued_event_( uid , change , previous = None ):
+    """
+    Fait traiter une notification par la stratégie de flux d'ldap3, comme lors
+    d'une recherche persistante non diffusée, puis renvoie l'événement placé
+    dans la file.
+    """
+    conn = stream_connection_( )
+    strategy = conn.strategy
+    # Table des réponses normalement créée à l'ouverture de la connexion
+    strategy._responses = {}
+    strategy.persistent_search_message_id = MESSAGE_ID
+    strategy.accumulate_stream( MESSAGE_ID ,
+            decoded_event_( uid , change , previous ) )
+    return strategy.events.get( block = False )
+
+def control_event_( uid , change , previous = None ):
+    """
+    Construit un événement dont le contrôle a été décodé sous la forme d'un
+    dictionnaire.
+    """
+    event = decoded_event_( uid , change , previous )
+    event[ 'controls' ][ LDAPListener.ECN_OID ][ 'value' ] = {
+        'changeType' : change ,
+        'previousDN' : previous ,
+        'changeNumber' : None ,
+    }
+    return event
+
+
+@pytest.fixture
+def listener( cfg ):
+    return LDAPListener( cfg , datetime( 2024 , 1 , 1 ) )
+
+
+#-------------------------------------------------------------------------------
+
+
+EVENT_BUILDERS = ( decoded_event_ , queued_event_ , control_event_ )
+
+@pytest.mark.parametrize( 'build' , EVENT_BUILDERS )
+@pytest.mark.parametrize( 'change' , ( LDAPListener.CHANGE_ADD ,
+        LDAPListener.CHANGE_MODIFY ) )
+def test_added_or_modified_entries_are_reported( listener , build , change ):
+    event = build( 'u1' , change )
+    assert LDAPListener.change_notification_( event ) == ( change , None )
+    assert listener.event_uids_( event ) == [ 'u1' ]
+
+@pytest.mark.parametrize( 'build' , EVENT_BUILDERS )
+def test_deleted_entries_are_ignored( listener , build ):
+    event = build( 'u1' , LDAPListener.CHANGE_DELETE )
+    assert LDAPListener.change_notification_( event )[ 0 ] == \
+            LDAPListener.CHANGE_DELETE
+    assert listener.event_uids_( event ) == [ ]
+
+@pytest.mark.parametrize( 'build' , EVENT_BUILDERS )
+def test_renamed_entries_are_reported_under_their_new_uid( listener , build ):
+    previous = 'uid=old,{}'.format( PEOPLE )
+    event = build( 'new' , LDAPListener.CHANGE_MODDN , previous )
+    assert LDAPListener.change_notification_( event ) == (
+            LDAPListener.CHANGE_MODDN , previous )
+    assert listener.event_uids_( event ) == [ 'new' ]
+
+def test_events_without_notification_are_modifications( listener ):
+    event = { 'type' : 'searchResEntry' , 'dn' : 'uid=u1,' + PEOPLE ,
+            'attributes' : { 'uid' : [ 'u1' , 'u1bis' ] } }
+    assert LDAPListener.change_notification_( event ) == ( None , None )
+    assert listener.event_uids_( event ) == [ 'u1' , 'u1bis' ]
+
+def test_unreadable_notifications_are_modifications( listener ):
+    event = decoded_event_( 'u1' , LDAPListener.CHANGE_DELETE )
+    event[ 'controls' ][ LDAPListener.ECN_OID ][ 'value' ] = b'\x30\x01'
+    assert LDAPListener.change_notification_( event ) == ( None , None )
+    assert listener.event_uids_( event ) == [ 'u1' ]
+
+
+#-------------------------------------------------------------------------------
+
+
+def mock_connection_( stamps ):
+    server = ldap3.Server( 'mock' , get_info = ldap3.OFFLINE_SLAPD_2_4 )
+    conn = ldap3.Connection( server , 'cn=admin,dc=univ-test,dc=fr' , 'x' ,
+            client_strategy = ldap3.MOCK_SYNC )
+    conn.strategy.add_entry( 'cn=admin,dc=univ-test,dc=fr' ,
+            { 'userPassword' : 'x' , 'sn' : 'admin' } )
+    for uid , stamp in stamps.items( ):
+        conn.strategy.add_entry( 'uid={},{}'.format( uid , PEOPLE ) , {
+            'objectClass' : [ 'inetOrgPerson' ] , 'uid' : uid ,
+            'sn' : uid , 'cn' : uid , 'modifyTimestamp' : stamp ,
+        } )
+    conn.bind( )
+    return conn
+
+def test_polling_reports_entries_once_per_modification( listener ):
+    conn = mock_connection_( {
+        'old' : '20231201000000Z' ,
+        'u1' : '20240101120000Z' ,
+        'u2' : '20240102000000Z' ,
+    } )
+    seen = {}
+    ( uids , since ) = listener.query_changes_( conn , listener.since , seen )
+    assert uids == { 'u1' , 'u2' }
+    assert since == datetime( 2024 , 1 , 2 )
+
+    # Les entrées de la fenêtre de recouvrement déjà vues sont ignorées
+    ( uids , since ) = listener.query_changes_( conn , since , seen )
+    assert uids == set( )
+    assert since == datetime( 2024 , 1 , 2 )
+
+    conn.strategy.entries[ 'uid=u2,{}'.format( PEOPLE ).lower( ) ][
+            'modifyTimestamp' ] = [ b'20240102000100Z' ]
+    ( uids , since ) = listener.query_changes_( conn , since , seen )
+    assert uids == { 'u2' }
+    assert since == datetime( 2024 , 1 , 2 , 0 , 1 )
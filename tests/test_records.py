@@ -0,0 +1,111 @@
+"""
+Tests des formats d'enregistrement de la base de données.
+"""
+import pytest
+
+from aolpsync.utils import ( RECORD_FORMATS , RECORD_MAGIC , RECORD_VERSION ,
+        record_dump , record_field , record_index , record_load )
+
+
+VALUES = (
+    None , True , False , 0 , -1 , 2 ** 63 - 1 , -2 ** 63 , 2 ** 80 ,
+    -2 ** 70 , 1.5 , -0.25 , '' , 'é' * 200 , 'x' * 255 , 'y' * 256 ,
+    [ ] , [ 1 , 'a' , [ None , True ] ] , { 'a' : 'b' } , { } ,
+    { 'accounts' : { 'x@univ-test.fr' : { 'groups' : { 'a' , 'b' } } } } ,
+    { 'long' : 'v' * 300 , 'list' : [ 'v' * 300 ] } ,
+)
+BINARY_VALUES = (
+    b'' , b'\x00\xff' , { 'data' : b'abc' } , { 1 : 'one' , 2.5 : None } ,
+    { 'set' : { 1 , 'a' , b'b' } } , set( ) ,
+)
+
+RECORD = {
+    'uid' : 'a' ,
+    'eppn' : 'a@univ-test.fr' ,
+    'mail' : 'a@univ-test.fr' ,
+    'ldapMail' : { 'a@univ-test.fr' , 'alias@univ-test.fr' } ,
+    'groups' : { 'staff' } ,
+    'markedForDeletion' : 1700000000 ,
+    '__fp__' : '0123456789abcdef' ,
+}
+
+
+@pytest.mark.parametrize( 'fmt' , RECORD_FORMATS )
+@pytest.mark.parametrize( 'value' , VALUES )
+def test_round_trip( fmt , value ):
+    assert record_load( record_dump( value , fmt ) ) == value
+
+@pytest.mark.parametrize( 'value' , BINARY_VALUES )
+def test_binary_round_trip( value ):
+    raw = record_dump( value , 'binary' )
+    result = record_load( raw )
+    assert result == value
+    assert type( result ) is type( value )
+    assert record_load( memoryview( raw ) ) == value
+
+@pytest.mark.parametrize( 'fmt' , RECORD_FORMATS )
+def test_account_record_round_trip( fmt , make_account ):
+    raw = record_dump( RECORD , fmt )
+    assert raw.startswith( RECORD_MAGIC ) == ( fmt == 'binary' )
+    data = record_load( raw )
+    assert data == RECORD
+    account = make_account( **data )
+    assert account.fingerprint_ == RECORD[ '__fp__' ]
+    assert account.ldapMail == RECORD[ 'ldapMail' ]
+
+def test_tuples_are_stored_as_lists( ):
+    assert record_load( record_dump( ( 1 , 'a' ) , 'binary' ) ) == [ 1 , 'a' ]
+
+def test_unsupported_values_are_rejected( ):
+    with pytest.raises( TypeError ):
+        record_dump( { 'x' : object( ) } , 'binary' )
+
+
+#-------------------------------------------------------------------------------
+
+
+def test_unknown_versions_are_rejected( ):
+    raw = RECORD_MAGIC + bytes(( RECORD_VERSION + 1 , )) + b'N'
+    with pytest.raises( ValueError ):
+        record_load( raw )
+
+def test_unknown_tags_are_rejected( ):
+    with pytest.raises( ValueError ):
+        record_load( RECORD_MAGIC + bytes(( RECORD_VERSION , )) + b'Z' )
+
+def test_truncated_records_are_rejected( ):
+    raw = record_dump( RECORD , 'binary' )
+    for end in range( len( RECORD_MAGIC ) + 1 , len( raw ) ):
+        with pytest.raises( ValueError ):
+            record_load( raw[ :end ] )
+
+def test_trailing_data_is_rejected( ):
+    with pytest.raises( ValueError ):
+        record_load( record_dump( RECORD , 'binary' ) + b'N' )
+
+
+#-------------------------------------------------------------------------------
+
+
+def test_index_gives_each_field( ):
+    raw = record_dump( RECORD , 'binary' )
+    index = record_index( raw )
+    assert set( index ) == set( RECORD )
+    for key , pos in index.items( ):
+        assert record_field( raw , pos ) == RECORD[ key ]
+        assert record_field( memoryview( raw ) , pos ) == RECORD[ key ]
+
+@pytest.mark.parametrize( 'raw' , (
+    record_dump( RECORD , 'json' ) , record_dump( [ 1 , 2 ] , 'binary' ) ,
+    record_dump( 'x' , 'binary' ) ,
+) )
+def test_only_binary_dictionaries_are_indexed( raw ):
+    assert record_index( raw ) is None
+
+def test_invalid_records_are_not_indexed( ):
+    raw = record_dump( RECORD , 'binary' )
+    for end in range( len( RECORD_MAGIC ) + 2 , len( raw ) ):
+        with pytest.raises( ValueError ):
+            record_index( raw[ :end ] )
+    with pytest.raises( ValueError ):
+        record_index( raw + b'N' )
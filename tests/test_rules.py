@@ -0,0 +1,172 @@
+"""
+Tests des règles: l'évaluation compte par compte par l'arbre des
+vérificateurs sert de référence pour la fonction compilée, le cache des
+résultats et l'évaluation sur un ensemble de comptes (select).
+"""
+import random
+
+import pytest
+
+from aolpsync.rules import Rule , RuleError , RuleIndex , RuleParser
+from aolpsync.table import AccountTable
+
+
+# Au moins une règle par opérateur, sur des attributs de toutes les formes
+# (valeurs absentes, chaînes, ensembles et listes)
+RULES = (
+    '(true)' ,
+    '(false)' ,
+    '(eq affiliation staff)' ,
+    '(eq groups staff)' ,
+    '(ne affiliation staff)' ,
+    '(ne ldapMail nobody@univ-test.fr)' ,
+    '(empty title)' ,
+    '(empty groups)' ,
+    '(empty ldapMail)' ,
+    '(contains groups staff)' ,
+    '(contains affiliation faculty)' ,
+    '(contains ldapMail nobody@univ-test.fr)' ,
+    '(in affiliation staff faculty)' ,
+    '(in groups staff faculty)' ,
+    '(contains-any groups admins guests)' ,
+    '(contains-any affiliation student)' ,
+    '(prefix mail u00)' ,
+    '(prefix ldapMail u01)' ,
+    '(suffix ldapMail "@etu.univ-test.fr")' ,
+    '(suffix groups s)' ,
+    '(match site "^site1[0-4]$")' ,
+    '(match ldapMail "\\.1@")' ,
+    '(not (contains groups staff))' ,
+    '(not (empty site))' ,
+    '(and (contains groups staff) (eq affiliation faculty))' ,
+    '(and (contains groups staff) (not (empty title)) (suffix mail ".fr"))' ,
+    '(or (contains groups admins) (eq affiliation student))' ,
+    '(or (empty title) (in site site1 site2) (contains groups guests))' ,
+    '(xor (contains groups staff) (contains groups faculty))' ,
+    '(xor (contains groups staff) (contains groups faculty) '
+            + '(contains groups admins))' ,
+    '(xor (true) (true) (true))' ,
+    '(not (xor (empty title) (eq affiliation staff) (prefix site site1)))' ,
+)
+
+# Feuilles utilisées pour générer des règles aléatoires
+LEAVES = (
+    '(eq affiliation staff)' , '(ne affiliation faculty)' ,
+    '(empty title)' , '(empty groups)' , '(contains groups staff)' ,
+    '(contains groups guests)' , '(in site site1 site2 site3)' ,
+    '(contains-any groups admins students)' , '(prefix site site1)' ,
+    '(suffix ldapMail "@labo.univ-test.fr")' , '(match title "^E")' ,
+    '(true)' , '(false)' ,
+)
+
+def random_rule_( rnd , depth ):
+    if depth == 0 or rnd.random( ) < .3:
+        return rnd.choice( LEAVES )
+    op = rnd.choice( ( 'and' , 'or' , 'xor' , 'not' ) )
+    if op == 'not':
+        return '(not {})'.format( random_rule_( rnd , depth - 1 ) )
+    return '({} {})'.format( op , ' '.join( random_rule_( rnd , depth - 1 )
+            for _ in range( rnd.randrange( 2 , 5 ) ) ) )
+
+RANDOM_RULES = tuple( random_rule_( random.Random( seed ) , 4 )
+        for seed in range( 40 ) )
+
+
+@pytest.fixture( scope = 'module' )
+def index( population ):
+    return RuleIndex( AccountTable( population ) )
+
+def reference_( population , rule ):
+    return set([ eppn for eppn , a in population.items( )
+            if rule.tree.check( a ) ])
+
+
+#-------------------------------------------------------------------------------
+
+
+def test_every_operator_is_covered( ):
+    used = set( )
+    for text in RULES:
+        used.update( op for op in RuleParser.OPS if '(' + op + ' ' in text
+                or '(' + op + ')' in text )
+    assert used == set( RuleParser.OPS )
+
+@pytest.mark.parametrize( 'text' , RULES + RANDOM_RULES )
+def test_select_matches_check( text , population , index ):
+    rule = Rule( 'test' , text )
+    expected = reference_( population , rule )
+    assert rule.select( index ) == expected
+    for eppn , account in population.items( ):
+        assert rule.evaluate( account ) == ( eppn in expected )
+        assert rule.check( account ) == ( eppn in expected )
+
+@pytest.mark.parametrize( 'text' , RULES )
+def test_rules_select_something_and_not_everything( text , population ,
+        index ):
+    # S'assure que la population permet de distinguer les implémentations
+    if text in ( '(true)' , '(false)' , '(xor (true) (true) (true))' ,
+            '(ne ldapMail nobody@univ-test.fr)' ,
+            '(contains ldapMail nobody@univ-test.fr)' ,
+            '(eq groups staff)' , '(in groups staff faculty)' ):
+        return
+    selected = Rule( 'test' , text ).select( index )
+    assert selected and selected != index.all
+
+def test_xor_is_true_for_exactly_one_operand( make_account ):
+    rule = Rule( 'test' , '(xor (contains groups a) (contains groups b) '
+            + '(contains groups c))' )
+    for groups , result in ( ( None , False ) , ( { 'a' } , True ) ,
+            ( { 'a' , 'b' } , False ) , ( { 'a' , 'b' , 'c' } , False ) ,
+            ( { 'c' } , True ) ):
+        account = make_account( uid = 'x' , eppn = 'x@univ-test.fr' ,
+                groups = groups )
+        assert rule.tree.check( account ) == result , groups
+        assert rule.check( account ) == result , groups
+
+def test_operators_short_circuit( make_account ):
+    account = make_account( uid = 'x' , eppn = 'x@univ-test.fr' ,
+            groups = { 'a' } )
+    calls = []
+    class Spy:
+        def compile( self ):
+            def spy_( account ):
+                calls.append( account )
+                return True
+            return spy_
+    for word , first in ( ( 'and' , 'false' ) , ( 'or' , 'true' ) ):
+        checker = RuleParser.LogicalBinaryChecker( word ,
+                RuleParser.ConstantChecker( first ) , Spy( ) , Spy( ) )
+        checker.compile( )( account )
+    assert calls == [ ]
+
+
+#-------------------------------------------------------------------------------
+
+
+@pytest.mark.parametrize( 'text' , (
+    '(or (eq affiliation staff) (eq affiliation faculty) (empty affiliation))' ,
+    '(or {})'.format( ' '.join(
+            '(and (eq affiliation {}) (eq site site{}))'.format( a , n )
+                for a in ( 'staff' , 'student' , 'faculty' )
+                for n in range( 4 ) ) ) ,
+) )
+def test_memoized_results( text , population ):
+    rule = Rule( 'test' , text )
+    assert rule.cache_stats( ) == ( 0 , 0 )
+    for account in population.values( ):
+        assert rule.check( account ) == rule.evaluate( account )
+    ( hits , misses ) = rule.cache_stats( )
+    assert hits + misses == len( population )
+    assert misses < len( population ) // 4
+
+def test_simple_rules_are_not_memoized( ):
+    assert Rule( 'test' , '(contains groups staff)' ).cache_stats( ) is None
+
+@pytest.mark.parametrize( 'text' , (
+    '' , '(' , '(eq mail)' , '(unknown mail x)' , '(eq nothing x)' ,
+    '(not (true) (true))' , '(and (true))' , '(match mail "(")' ,
+    '(true) x' ,
+) )
+def test_invalid_rules( text ):
+    with pytest.raises( RuleError ):
+        Rule( 'test' , text )
@@ -0,0 +1,132 @@
+"""
+Tests de la table des comptes en colonnes (AccountTable) et des index
+inversés construits à partir de celle-ci (RuleIndex).
+"""
+import copy
+
+import pytest
+
+from aolpsync.account import SyncAccount
+from aolpsync.rules import RuleIndex
+from aolpsync.table import AccountTable
+
+
+def test_columns_follow_the_accounts( population ):
+    table = AccountTable( population )
+    assert len( table ) == len( population )
+    assert table.fields == SyncAccount.ALL_ATTRS
+    for eppn , account in population.items( ):
+        assert eppn in table
+        for field in table.fields:
+            assert table.get( eppn , field ) == getattr( account , field )
+    assert 'nobody@univ-test.fr' not in table
+    with pytest.raises( KeyError ):
+        table.get( 'nobody@univ-test.fr' , 'mail' )
+
+def test_selected_fields( population ):
+    table = AccountTable( population , ( 'mail' , 'groups' ) )
+    assert set( table.columns ) == { 'mail' , 'groups' }
+    with pytest.raises( KeyError ):
+        table.column( 'title' )
+
+def test_strings_are_shared_between_tables( population ):
+    other = { eppn : copy.deepcopy( a ) for eppn , a in population.items( ) }
+    ( ta , tb ) = ( AccountTable( population , ( 'mail' , ) ) ,
+            AccountTable( other , ( 'mail' , ) ) )
+    for eppn in population:
+        assert ta.get( eppn , 'mail' ) is tb.get( eppn , 'mail' )
+
+def test_select_matches_a_row_by_row_filter( population ):
+    table = AccountTable( population )
+    predicate = lambda v : v is not None and 'staff' in v
+    assert table.select( 'groups' , predicate ) == set([ eppn
+            for eppn , a in population.items( ) if predicate( a.groups ) ])
+
+def test_equal_rows_match_account_comparison( population ):
+    other = {}
+    for i , ( eppn , account ) in enumerate( population.items( ) ):
+        if i % 7 == 0:
+            continue
+        account = copy.deepcopy( account )
+        if i % 5 == 0:
+            account.title = 'Autre'
+        elif i % 11 == 0:
+            # Valeur unique contre ensemble d'une valeur: égaux
+            account.mail = set([ account.mail ])
+        other[ eppn ] = account
+    fields = SyncAccount.STORAGE_ATTRS
+    expected = set([ eppn for eppn in other
+            if population[ eppn ].compare_( other[ eppn ] , fields ) ])
+    ( ta , tb ) = ( AccountTable( population ) , AccountTable( other ) )
+    assert ta.equal_rows( tb , fields ) == expected
+    assert tb.equal_rows( ta , fields ) == expected
+    assert expected and expected < set( other )
+
+
+#-------------------------------------------------------------------------------
+
+
+@pytest.fixture
+def index( population ):
+    return RuleIndex( AccountTable( population ) )
+
+def matching_( population , test ):
+    return set([ eppn for eppn , a in population.items( ) if test( a ) ])
+
+def test_index_all( index , population ):
+    assert index.all == set( population )
+
+@pytest.mark.parametrize( 'value' , ( 'staff' , 'student' , 'missing' ) )
+def test_equal_and_not_equal_partition_the_strings( index , population ,
+        value ):
+    equal = index.equal( 'affiliation' , value )
+    not_equal = index.not_equal( 'affiliation' , value )
+    strings = matching_( population ,
+            lambda a : isinstance( a.affiliation , str ) )
+    assert equal == matching_( population ,
+            lambda a : a.affiliation == value )
+    assert not equal & not_equal
+    assert equal | not_equal == strings
+    assert index.empty( 'affiliation' ) == index.all - strings
+
+def test_contains_covers_strings_and_collections( index , population ):
+    address = next( a.ldapMail for a in population.values( )
+            if isinstance( a.ldapMail , str ) )
+    assert index.contains( 'ldapMail' , address ) == matching_( population ,
+            lambda a : a.ldapMail == address or (
+                not isinstance( a.ldapMail , str )
+                    and a.ldapMail is not None and address in a.ldapMail ) )
+    staff = index.contains( 'groups' , 'staff' )
+    assert staff == matching_( population ,
+            lambda a : a.groups is not None and 'staff' in a.groups )
+
+def test_any_operations_are_unions( index ):
+    values = ( 'staff' , 'guests' , 'missing' )
+    assert index.contains_any( 'groups' , values ) == set( ).union(
+            *( index.contains( 'groups' , v ) for v in values ) )
+    values = ( 'staff' , 'faculty' )
+    assert index.equal_any( 'affiliation' , values ) == set( ).union(
+            *( index.equal( 'affiliation' , v ) for v in values ) )
+
+def test_matching_tests_each_distinct_value( index , population ):
+    predicate = lambda v : v.endswith( '@etu.univ-test.fr' )
+    def test_( a ):
+        v = a.ldapMail
+        if v is None: return False
+        if isinstance( v , str ): return predicate( v )
+        return any( predicate( x ) for x in v )
+    assert index.matching( 'ldapMail' , predicate ) == matching_(
+            population , test_ )
+
+def test_results_are_copies( index ):
+    before = index.contains( 'groups' , 'staff' )
+    for result in ( index.contains( 'groups' , 'staff' ) ,
+            index.equal( 'affiliation' , 'staff' ) ,
+            index.empty( 'title' ) ,
+            index.not_equal( 'affiliation' , 'staff' ) ,
+            index.contains_any( 'groups' , ( 'staff' , ) ) ):
+        result.clear( )
+    assert index.contains( 'groups' , 'staff' ) == before
+    assert index.equal( 'affiliation' , 'staff' )
+    assert index.empty( 'title' )
+    assert index.not_equal( 'affiliation' , 'staff' )
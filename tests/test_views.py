@@ -0,0 +1,61 @@
+"""
+Tests des vues paresseuses sur les enregistrements de la base de données
+(SyncAccountView).
+"""
+import pytest
+
+from aolpsync.account import SyncAccount , SyncAccountView
+from aolpsync.utils import RECORD_FORMATS , record_dump
+
+
+RECORD = {
+    'uid' : 'a' ,
+    'eppn' : 'a@univ-test.fr' ,
+    'mail' : 'a@univ-test.fr' ,
+    'surname' : 'Nom' ,
+    'aliases' : { 'alias@univ-test.fr' } ,
+    'groups' : { 'staff' , 'faculty' } ,
+    'ldapMail' : set( ) ,
+    'markedForDeletion' : 1700000000 ,
+    'title' : 'Chercheur' ,
+}
+
+
+@pytest.fixture( params = RECORD_FORMATS )
+def view( request , cfg ):
+    return SyncAccountView( cfg , record_dump( RECORD , request.param ) )
+
+
+#-------------------------------------------------------------------------------
+
+
+def test_fields_are_read_without_conversion( view , make_account ):
+    account = make_account( **RECORD )
+    for attr in SyncAccount.ALL_ATTRS:
+        assert getattr( view , attr ) == getattr( account , attr ) , attr
+    assert view.account_ is None
+    assert str( view ) == 'a@univ-test.fr'
+
+def test_views_equal_their_account( view , make_account ):
+    account = make_account( **RECORD )
+    assert view == account and account == view
+    assert view != make_account( **dict( RECORD , cos = 'staff' ) )
+
+def test_methods_convert_the_view( view ):
+    assert view.to_json_record( )[ 'groups' ] == RECORD[ 'groups' ]
+    assert isinstance( view.account_ , SyncAccount )
+    assert view.raw_ is None
+
+def test_assignment_converts_the_view( view , make_account ):
+    view.cos = 'staff'
+    assert view.account_.cos == 'staff'
+    assert view.upgrade( ) == make_account( **dict( RECORD , cos = 'staff' ) )
+
+def test_in_place_changes_are_kept( view ):
+    view.aliases.add( 'other@univ-test.fr' )
+    view.groups.discard( 'staff' )
+    account = view.upgrade( )
+    assert account.aliases == { 'alias@univ-test.fr' , 'other@univ-test.fr' }
+    assert account.groups == { 'faculty' }
+    assert account.surname == 'Nom'
+    assert account.fingerprint( ) == account.compute_fingerprint( )